@@ -0,0 +1,296 @@
+"""Local stand-in for NetBox used by the benchmark suite.
+
+Serves paginated REST list endpoints, a generated OpenAPI schema, /api/status/,
+a changelog of the bulk writes and a minimal GraphQL endpoint, with
+configurable row counts, page latency and payload sizes::
+
+    python -m bench.mock_netbox --port 8765 --rows 50000 --latency 0.02
+"""
+import re
+import json
+import hashlib
+import asyncio
+import argparse
+
+from aiohttp import web
+
+import graphql_query
+
+
+MODELS = {
+    "dcim/sites": "Site",
+    "dcim/devices": "Device",
+    "dcim/interfaces": "Interface",
+    "ipam/ip-addresses": "IPAddress",
+    "ipam/vlans": "VLAN",
+}
+STATUSES = ["active", "planned", "offline", "decommissioning"]
+FILTER_PARAMS = ["id", "name", "slug", "status", "site", "site_id", "description", "tag", "created", "last_updated"]
+LOOKUPS = ["n", "ic", "nic", "iew", "niew", "isw", "nisw", "ie", "nie", "empty", "regex", "iregex", "gt", "gte", "lt", "lte"]
+# Extra paths so the schema index is built over a NetBox sized document
+FILLER_PATHS = 600
+
+
+def make_rows(endpoint, count, payload_size):
+    model = MODELS[endpoint]
+    padding = "x" * payload_size
+    rows = []
+    for i in range(1, count + 1):
+        site = (i % 50) + 1
+        rows.append({
+            "id": i,
+            "url": f"http://netbox/api/{endpoint}/{i}/",
+            "display": f"{model} {i}",
+            "name": f"{model.lower()}-{i}",
+            "slug": f"{model.lower()}-{i}",
+            "status": {"value": STATUSES[i % len(STATUSES)], "label": STATUSES[i % len(STATUSES)].title()},
+            "site": {"id": site, "url": f"http://netbox/api/dcim/sites/{site}/", "display": f"Site {site}", "name": f"Site {site}", "slug": f"site-{site}"},
+            "tenant": None,
+            "description": padding,
+            "custom_fields": {},
+            "tags": [],
+            "last_updated": "2026-01-01T00:00:00Z",
+        })
+    return rows
+
+
+def make_schema():
+    paths = {}
+    components = {
+        "BriefSite": {"properties": {"id": {"type": "integer"}, "slug": {"type": "string"}}},
+        "Status": {"properties": {"value": {"enum": STATUSES}, "label": {"type": "string"}}},
+    }
+    for endpoint, model in MODELS.items():
+        parameters = [{"name": "limit", "in": "query"}, {"name": "offset", "in": "query"},
+                      {"name": "ordering", "in": "query"}, {"name": "q", "in": "query"}]
+        for name in FILTER_PARAMS:
+            if name == "status":
+                parameters.append({"name": name, "in": "query", "schema": {"type": "array", "items": {"type": "string", "enum": STATUSES}}})
+            else:
+                parameters.append({"name": name, "in": "query", "schema": {"type": "array", "items": {"type": "string"}}})
+            parameters.extend({"name": f"{name}__{lookup}", "in": "query"} for lookup in LOOKUPS)
+        paths[f"/api/{endpoint}/"] = {
+            "get": {
+                "parameters": parameters,
+                "responses": {"200": {"content": {"application/json": {"schema": {"$ref": f"#/components/schemas/Paginated{model}List"}}}}},
+            },
+            "post": {}, "put": {}, "patch": {}, "delete": {},
+        }
+        paths[f"/api/{endpoint}/{{id}}/"] = {"get": {"parameters": [{"name": "id", "in": "path"}]}, "put": {}, "patch": {}, "delete": {}}
+        components[f"Paginated{model}List"] = {"properties": {"results": {"type": "array", "items": {"$ref": f"#/components/schemas/{model}"}}}}
+        components[model] = {"properties": {
+            "id": {"type": "integer"},
+            "slug": {"type": "string"},
+            "status": {"$ref": "#/components/schemas/Status"},
+            "site": {"allOf": [{"$ref": "#/components/schemas/BriefSite"}]},
+        }}
+    for i in range(FILLER_PATHS):
+        paths[f"/api/plugins/filler-{i}/"] = {"get": {"parameters": [{"name": name, "in": "query"} for name in FILTER_PARAMS]}}
+    return {"openapi": "3.0.3", "paths": paths, "components": {"schemas": components}}
+
+
+def _type(kind, name=None, of_type=None):
+    return {"kind": kind, "name": name, "ofType": of_type}
+
+
+def make_introspection():
+    scalar = {"name": "String", "kind": "SCALAR", "description": None, "fields": None}
+    query_fields = []
+    types = [scalar]
+    for endpoint, model in MODELS.items():
+        type_name = f"{model}Type"
+        query_fields.append({
+            "name": f"{model.lower()}_list", "description": None, "args": [{"name": "filters"}, {"name": "pagination"}],
+            "type": _type("NON_NULL", None, _type("LIST", None, _type("NON_NULL", None, _type("OBJECT", type_name)))),
+        })
+        types.append({"name": type_name, "kind": "OBJECT", "description": None, "fields": [
+            {"name": name, "description": None, "args": [], "type": _type("SCALAR", "String")}
+            for name in ("id", "name", "slug", "description")
+        ]})
+    types.insert(0, {"name": "Query", "kind": "OBJECT", "description": None, "fields": query_fields})
+    return {"__schema": {"queryType": {"name": "Query"}, "types": types}}
+
+
+class MockNetBox:
+    def __init__(self, rows=1000, latency=0.0, payload_size=64, max_page_size=1000, etags=False):
+        self.latency = latency
+        self.etags = etags
+        self.max_page_size = max_page_size
+        self.rows = {endpoint: make_rows(endpoint, rows if endpoint != "dcim/sites" else min(rows, 50), payload_size) for endpoint in MODELS}
+        self.schema = json.dumps(make_schema()).encode()
+        self.introspection = make_introspection()
+        self.changes = []
+        self.requests = 0
+        self.version = "4.2.0-mock"
+
+    async def list_view(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = request.match_info["app"] + "/" + request.match_info["model"]
+        rows = self.rows.get(endpoint)
+        if rows is None:
+            return web.json_response({"detail": "Not found."}, status=404)
+        query = request.query
+        if "id" in query:
+            values = {int(value) for value in query.getall("id")}
+            rows = [row for row in rows if row["id"] in values]
+        if "last_updated__gte" in query:
+            rows = [row for row in rows if row["last_updated"] >= query["last_updated__gte"]]
+        for name in ("name", "slug"):
+            if name in query:
+                values = set(query.getall(name))
+                rows = [row for row in rows if row[name] in values]
+        if "status" in query:
+            values = set(query.getall("status"))
+            if not values <= set(STATUSES):
+                return web.json_response({"status": [f"Select a valid choice. {values} is not one of the available choices."]}, status=400)
+            rows = [row for row in rows if row["status"]["value"] in values]
+        if "site" in query:
+            values = set(query.getall("site"))
+            rows = [row for row in rows if row["site"]["slug"] in values]
+        if "ordering" in query:
+            field = query["ordering"].lstrip("-")
+            if rows and field in rows[0]:
+                rows = sorted(rows, key=lambda row: row[field], reverse=query["ordering"].startswith("-"))
+        limit = int(query.get("limit", 50)) or self.max_page_size
+        limit = min(limit, self.max_page_size)
+        offset = int(query.get("offset", 0))
+        page = rows[offset:offset + limit]
+        if "fields" in query:
+            fields = query["fields"].split(",")
+            page = [{key: row[key] for key in fields if key in row} for row in page]
+        elif query.get("brief"):
+            page = [{key: row[key] for key in ("id", "url", "display", "name", "slug")} for row in page]
+        next_url = None
+        if offset + limit < len(rows):
+            next_url = str(request.url.update_query(limit=limit, offset=offset + limit))
+        return self.respond(request, json.dumps({"count": len(rows), "next": next_url, "previous": None, "results": page}).encode())
+
+    def respond(self, request, body):
+        """JSON response with an ETag and 304 answers when ``etags`` is on, NetBox itself sends none."""
+        if not self.etags:
+            return web.Response(body=body, content_type="application/json")
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def bulk_view(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = request.match_info["app"] + "/" + request.match_info["model"]
+        rows = self.rows.get(endpoint)
+        if rows is None:
+            return web.json_response({"detail": "Not found."}, status=404)
+        items = await request.json()
+        action = {"POST": "create", "PATCH": "update", "DELETE": "delete"}[request.method]
+        if request.method == "POST":
+            errors = [{} if item.get("name") else {"name": ["This field is required."]} for item in items]
+            if any(errors):
+                return web.json_response(errors, status=400)
+            next_id = max((row["id"] for row in rows), default=0) + 1
+            created = [{**item, "id": next_id + offset, "last_updated": "2026-01-02T00:00:00Z"} for offset, item in enumerate(items)]
+            rows.extend(created)
+            self.log_changes(endpoint, action, created)
+            return web.json_response(created, status=201)
+        by_id = {row["id"]: row for row in rows}
+        missing = [item["id"] for item in items if item.get("id") not in by_id]
+        if missing:
+            return web.json_response({"detail": f"Objects not found: {missing}"}, status=400)
+        if request.method == "PATCH":
+            for item in items:
+                by_id[item["id"]].update(item)
+            self.log_changes(endpoint, action, items)
+            return web.json_response([by_id[item["id"]] for item in items])
+        deleted = {item["id"] for item in items}
+        rows[:] = [row for row in rows if row["id"] not in deleted]
+        self.log_changes(endpoint, action, items)
+        return web.Response(status=204)
+
+    def log_changes(self, endpoint, action, items):
+        app, _ = endpoint.split("/")
+        for item in items:
+            self.changes.append({
+                "id": len(self.changes) + 1,
+                "time": "2026-01-02T00:00:00Z",
+                "action": {"value": action, "label": action.title()},
+                "changed_object_type": f"{app}.{MODELS[endpoint].lower()}",
+                "changed_object_id": item["id"],
+            })
+
+    async def changes_view(self, request):
+        self.requests += 1
+        query = request.query
+        changes = [change for change in self.changes if change["id"] > int(query.get("id__gt", 0))]
+        if query.get("ordering") == "-id":
+            changes = changes[::-1]
+        limit = int(query.get("limit", 50))
+        return web.json_response({"count": len(changes), "next": None, "previous": None, "results": changes[:limit]})
+
+    async def schema_view(self, request):
+        self.requests += 1
+        return self.respond(request, self.schema)
+
+    async def status_view(self, request):
+        return web.json_response({"netbox-version": self.version})
+
+    async def graphql_view(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = await request.json()
+        if "__schema" in body["query"]:
+            return web.json_response({"data": self.introspection})
+        data = {}
+        for definition in graphql_query.parse(body["query"]):
+            for selection in definition.get("selections", []):
+                if selection["kind"] != "field" or not selection["name"].endswith("_list"):
+                    continue
+                model = selection["name"][:-len("_list")]
+                endpoint = next((e for e, m in MODELS.items() if m.lower() == model), None)
+                rows = self.rows.get(endpoint, [])
+                arguments = " ".join(selection["arguments"])
+                offset = re.search(r"offset : (\d+)", arguments)
+                limit = re.search(r"limit : (\d+)", arguments)
+                start = int(offset.group(1)) if offset else 0
+                stop = start + int(limit.group(1)) if limit else len(rows)
+                fields = [child["name"] for child in selection["selections"] or [] if child["kind"] == "field"]
+                data[selection["alias"] or selection["name"]] = [
+                    {field: row.get(field) for field in fields} for row in rows[start:stop]
+                ]
+        return web.json_response({"data": data})
+
+    async def requests_view(self, request):
+        return web.json_response({"requests": self.requests})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/api/schema/", self.schema_view)
+        app.router.add_get("/api/status/", self.status_view)
+        app.router.add_get("/api/core/object-changes/", self.changes_view)
+        app.router.add_get("/api/{app}/{model}/", self.list_view)
+        for method in ("POST", "PATCH", "DELETE"):
+            app.router.add_route(method, "/api/{app}/{model}/", self.bulk_view)
+        app.router.add_post("/graphql/", self.graphql_view)
+        app.router.add_get("/_requests", self.requests_view)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rows", type=int, default=1000, help="rows per list endpoint")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every page")
+    parser.add_argument("--payload-size", type=int, default=64, help="bytes of padding per row")
+    parser.add_argument("--max-page-size", type=int, default=1000)
+    parser.add_argument("--etags", action="store_true", help="send ETags and answer If-None-Match with 304")
+    args = parser.parse_args()
+    mock = MockNetBox(args.rows, args.latency, args.payload_size, args.max_page_size, args.etags)
+    web.run_app(mock.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Benchmark netbox.py, validation.py and the FastMCP tools against a mock NetBox.
+
+Starts ``bench.mock_netbox`` in a subprocess, runs every scenario and prints
+p50/p99 latency, throughput, peak RSS and allocations::
+
+    python -m bench.run --rows 50000 --latency 0.02 --json bench_output.json
+    python -m bench.run --baseline bench_output.json --threshold 1.25
+
+With ``--baseline`` the exit status is 1 when any scenario's p50 regressed by
+more than ``--threshold`` times the baseline.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import resource
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(args, port):
+    process = subprocess.Popen([
+        sys.executable, "-m", "bench.mock_netbox",
+        "--port", str(port),
+        "--rows", str(args.rows),
+        "--latency", str(args.latency),
+        "--payload-size", str(args.payload_size),
+    ])
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("mock NetBox did not start")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def measure(name, fn, iterations, concurrency=1, trace=False):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with semaphore:
+            started = time.perf_counter()
+            await fn()
+            latencies.append(time.perf_counter() - started)
+
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(iterations)))
+    elapsed = time.perf_counter() - started
+    result = {
+        "scenario": name,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "throughput_per_s": iterations / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        result["alloc_peak_mb"] = peak / (1024 * 1024)
+        result["alloc_blocks"] = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+    return result
+
+
+async def run_scenarios(args):
+    # Imported after the environment points them at the mock NetBox
+    import cache
+    import client
+    import netbox
+    import server
+    import validation
+    from fastmcp import Client
+
+    schema = await validation.get_schema_index()
+    valid_params = {"name__ic": ["a"], "status": ["active"], "site": ["site-1"], "limit": 1000, "fields": "id,name"}
+
+    async def validate():
+        await validation.validate_path(schema, "/api/dcim/devices/")
+        await validation.validate_query_params(schema, "/api/dcim/devices/", valid_params)
+
+    def uncached(fn):
+        async def wrapped():
+            cache.response_cache.clear()
+            await fn()
+        return wrapped
+
+    results = []
+    iterations = args.iterations
+    trace = args.tracemalloc
+    results.append(await measure("validation.validate_query_params", validate, iterations * 100, trace=trace))
+    results.append(await measure("netbox.get dcim/sites", uncached(lambda: netbox.get("dcim/sites/", {})), iterations, trace=trace))
+    results.append(await measure("netbox.get dcim/interfaces", uncached(lambda: netbox.get("dcim/interfaces/", {})), max(1, iterations // 10), trace=trace))
+    results.append(await measure("netbox.get cached", lambda: netbox.get("dcim/devices/", {"limit": 100}), iterations, trace=trace))
+    results.append(await measure(
+        "netbox.graphql_get",
+        uncached(lambda: netbox.graphql_get("{ device_list { id name } }")),
+        iterations, trace=trace,
+    ))
+    async with Client(server.mcp) as mcp_client:
+        results.append(await measure(
+            "tool get_resources",
+            uncached(lambda: mcp_client.call_tool("get_resources", {"resource": "dcim/devices/", "query_string": "status=active"})),
+            max(1, iterations // 10), trace=trace,
+        ))
+        results.append(await measure(
+            "tool get_resources concurrent",
+            uncached(lambda: mcp_client.call_tool("get_resources", {"resource": "dcim/sites/"})),
+            iterations, concurrency=args.concurrency, trace=trace,
+        ))
+        results.append(await measure(
+            "tool query_netbox_relationships",
+            uncached(lambda: mcp_client.call_tool("query_netbox_relationships", {"query": "{ site_list { id name } }"})),
+            iterations, trace=trace,
+        ))
+    await client.close()
+    return results
+
+
+def report(results, baseline=None, threshold=None):
+    regressions = []
+    header = f"{'scenario':<36} {'p50 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'rss MB':>8} {'alloc MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        alloc = f"{result['alloc_peak_mb']:9.1f}" if "alloc_peak_mb" in result else f"{'-':>9}"
+        line = (
+            f"{result['scenario']:<36} {result['p50_ms']:10.3f} {result['p99_ms']:10.3f} "
+            f"{result['throughput_per_s']:10.1f} {result['peak_rss_mb']:8.1f} {alloc}"
+        )
+        previous = (baseline or {}).get(result["scenario"])
+        if previous is not None:
+            ratio = result["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else 1.0
+            line += f"  x{ratio:.2f}"
+            if threshold is not None and ratio > threshold:
+                regressions.append(result["scenario"])
+                line += " REGRESSION"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="rows per mock list endpoint")
+    parser.add_argument("--latency", type=float, default=0.005, help="mock NetBox seconds per page")
+    parser.add_argument("--payload-size", type=int, default=256, help="bytes of padding per row")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tracemalloc", action="store_true", help="trace allocations (slower)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json output")
+    parser.add_argument("--threshold", type=float, default=1.25, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="netbox-bench-")
+    os.environ["NETBOX_URL"] = f"http://127.0.0.1:{port}/"
+    os.environ.setdefault("NETBOX_API_TOKEN", "bench")
+    os.environ["NETBOX_SCHEMA_FILE"] = os.path.join(workdir, "schema.json")
+    os.environ["NETBOX_GRAPHQL_SCHEMA_FILE"] = os.path.join(workdir, "graphql_schema.json")
+    os.environ["NETBOX_CHOICES_FILE"] = os.path.join(workdir, "choices.json")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import logging
+    logging.disable(logging.INFO)
+
+    mock = start_mock(args, port)
+    try:
+        results = asyncio.run(run_scenarios(args))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+    regressions = report(results, baseline, args.threshold if args.baseline else None)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if regressions:
+        print(f"p50 regressed by more than x{args.threshold}: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
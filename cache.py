@@ -0,0 +1,404 @@
+import os
+import re
+import json
+import time
+import logging
+import sqlite3
+import tempfile
+import codec
+import metrics
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+NETBOX_CACHE_TTL = float(os.environ.get("NETBOX_CACHE_TTL") or 60)
+NETBOX_CACHE_MAX_BYTES = int(os.environ.get("NETBOX_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+# Per endpoint TTL overrides, keys are endpoints ("dcim/sites/"), apps ("dcim/") or "graphql"
+NETBOX_CACHE_TTLS = json.loads(os.environ.get("NETBOX_CACHE_TTLS") or "{}")
+# Workers of a multi-process server share one SQLite cache file, in memory
+# backed /dev/shm where available
+_shm = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+NETBOX_CACHE_FILE = os.environ.get("NETBOX_CACHE_FILE") or (
+    os.path.join(_shm, "netbox-mcp-cache.sqlite") if int(os.environ.get("NETBOX_WORKERS") or 1) > 1 else None
+)
+# Hits of the shared cache record their access time for LRU eviction in
+# batches, at most this often, instead of taking the write lock on each one
+NETBOX_CACHE_TOUCH_INTERVAL = float(os.environ.get("NETBOX_CACHE_TOUCH_INTERVAL") or 1)
+# How often a write also drops the expired entries that can't be revalidated
+NETBOX_CACHE_PRUNE_INTERVAL = float(os.environ.get("NETBOX_CACHE_PRUNE_INTERVAL") or 30)
+
+GRAPHQL_ENDPOINT = "graphql"
+
+_graphql_token_re = re.compile(r'"(?:\\.|[^"\\])*"|\s+|#[^\n]*')
+
+
+def normalize_endpoint(endpoint):
+    endpoint = endpoint.strip("/")
+    if endpoint.startswith("api/"):
+        endpoint = endpoint[4:]
+    return f"{endpoint}/"
+
+
+def make_key(endpoint, params):
+    items = []
+    for name, value in params.items():
+        if isinstance(value, (list, tuple)):
+            value = tuple(str(item) for item in value)
+        else:
+            value = str(value)
+        items.append((name, value))
+    return (normalize_endpoint(endpoint), tuple(sorted(items)))
+
+
+def _normalize_graphql_token(match):
+    token = match.group(0)
+    if token.startswith('"'):
+        return token
+    # Whitespace and comments are insignificant outside of string literals
+    return " "
+
+
+def graphql_key(query):
+    return (GRAPHQL_ENDPOINT, _graphql_token_re.sub(_normalize_graphql_token, query).strip())
+
+
+def estimate_size(value):
+    return len(codec.dumps(value))
+
+
+class ResponseCache:
+    """Bounded TTL + LRU cache of decoded NetBox responses.
+
+    Entries are evicted least recently used first once the summed size of the
+    cached payloads exceeds ``max_bytes``. Setting ``max_bytes`` to 0 disables
+    the cache.
+    """
+
+    def __init__(self, max_bytes=NETBOX_CACHE_MAX_BYTES, default_ttl=NETBOX_CACHE_TTL, ttls=NETBOX_CACHE_TTLS):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = ttls
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped on every invalidation, results fetched before it are not cached
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._endpoints = {}
+
+    def ttl(self, endpoint):
+        if endpoint in self.ttls:
+            return float(self.ttls[endpoint])
+        app = endpoint.split("/", 1)[0] + "/"
+        if app in self.ttls:
+            return float(self.ttls[app])
+        return self.default_ttl
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, size, value, validators = entry
+        if expires < time.monotonic():
+            if validators is None:
+                self._remove(key)
+            # Otherwise kept past its TTL for netbox.get to revalidate
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key):
+        """Return ``(value, validators)`` of an entry stored with validators, expired or not."""
+        entry = self._entries.get(key)
+        if entry is None or entry[3] is None:
+            return None
+        return entry[2], entry[3]
+
+    def set(self, key, value, size=None, generation=None, validators=None):
+        endpoint = key[0]
+        ttl = self.ttl(endpoint)
+        if self.max_bytes <= 0 or ttl <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        if size is None:
+            size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value, validators)
+        self._endpoints.setdefault(endpoint, set()).add(key)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, endpoint):
+        """Drop every entry for the endpoint, its detail views and all GraphQL results."""
+        endpoint = normalize_endpoint(endpoint)
+        self.generation += 1
+        for cached_endpoint in list(self._endpoints):
+            if cached_endpoint == GRAPHQL_ENDPOINT or cached_endpoint.startswith(endpoint) or endpoint.startswith(cached_endpoint):
+                for key in list(self._endpoints.get(cached_endpoint, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._endpoints.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key):
+        expires, size, value, validators = self._entries.pop(key)
+        self.size -= size
+        keys = self._endpoints.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._endpoints[key[0]]
+
+
+class SQLiteFile:
+    """A SQLite file shared by every worker process, each opening its own connection.
+
+    Subclasses set ``path``, create their tables in ``SCHEMA`` and upgrade
+    files written by older versions in ``migrate``.
+    """
+
+    SCHEMA = ""
+    SYNCHRONOUS = "NORMAL"
+    _db = None
+    _pid = None
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(f"PRAGMA synchronous={self.SYNCHRONOUS}")
+        return db
+
+    @property
+    def db(self):
+        # A connection must not cross a fork, every worker opens its own
+        if self._db is None or self._pid != os.getpid():
+            self._db = self.connect()
+            self._pid = os.getpid()
+            self._db.executescript(self.SCHEMA)
+            self.migrate(self._db)
+        return self._db
+
+    def migrate(self, db):
+        pass
+
+    @contextmanager
+    def _transaction(self):
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        else:
+            db.execute("COMMIT")
+
+
+class SharedCache(SQLiteFile, ResponseCache):
+    """``ResponseCache`` stored in a SQLite file, shared by every worker process.
+
+    Values are kept encoded and decoded on each hit, so a payload is held once
+    for all workers instead of once per worker. The invalidation generation
+    lives in the file too, a write in one worker drops the entries and
+    discards in-flight reads of every worker. Hit and miss counters stay per
+    process. Hits only read the file, their access times are written with
+    the next write, and expired entries that can't be revalidated are
+    dropped by writes every ``NETBOX_CACHE_PRUNE_INTERVAL`` seconds.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, endpoint TEXT, expires REAL, used REAL, size INTEGER, value BLOB,
+            validators TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_endpoint ON entries (endpoint);
+        CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+        CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+        CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+        INSERT OR IGNORE INTO meta VALUES ('generation', 0), ('size', 0), ('evictions', 0), ('invalidations', 0);
+    """
+    # In memory backed /dev/shm, nothing to keep across a power loss
+    SYNCHRONOUS = "OFF"
+
+    def __init__(self, path, max_bytes=NETBOX_CACHE_MAX_BYTES, default_ttl=NETBOX_CACHE_TTL, ttls=NETBOX_CACHE_TTLS):
+        super().__init__(max_bytes, default_ttl, ttls)
+        self.path = path
+        # Access times of hits not written to the file yet
+        self._touched = {}
+        self._flushed = time.monotonic()
+        self._pruned = 0.0
+
+    def migrate(self, db):
+        if "validators" not in {row[1] for row in db.execute("PRAGMA table_info(entries)")}:
+            try:
+                # A file created before validators were stored
+                db.execute("ALTER TABLE entries ADD COLUMN validators TEXT")
+            except sqlite3.OperationalError:
+                # Added by another worker meanwhile
+                pass
+
+    def _meta(self, name):
+        return self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    @property
+    def generation(self):
+        return self._meta("generation")
+
+    @generation.setter
+    def generation(self, value):
+        # Set by ResponseCache.__init__ only, the shared value is kept
+        pass
+
+    def get(self, key):
+        now = time.time()
+        encoded_key = codec.dumps_text(key)
+        row = self.db.execute("SELECT expires, value FROM entries WHERE key = ?", (encoded_key,)).fetchone()
+        if row is None or row[0] < now:
+            self.misses += 1
+            return None
+        self._touched[encoded_key] = now
+        if time.monotonic() - self._flushed > NETBOX_CACHE_TOUCH_INTERVAL:
+            with self._transaction() as db:
+                self._flush_touches(db)
+        self.hits += 1
+        return codec.loads(row[1])
+
+    def _flush_touches(self, db):
+        if self._touched:
+            db.executemany("UPDATE entries SET used = ? WHERE key = ?", [(used, key) for key, used in self._touched.items()])
+            self._touched = {}
+        self._flushed = time.monotonic()
+
+    def _prune(self, db, now):
+        """Drop the expired entries without validators, returning the bytes freed."""
+        removed, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE expires < ? AND validators IS NULL", (now,)
+        ).fetchone()
+        if removed:
+            db.execute("DELETE FROM entries WHERE expires < ? AND validators IS NULL", (now,))
+        self._pruned = time.monotonic()
+        return size
+
+    def get_stale(self, key):
+        row = self.db.execute(
+            "SELECT value, validators FROM entries WHERE key = ? AND validators IS NOT NULL", (codec.dumps_text(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        return codec.loads(row[0]), codec.loads(row[1])
+
+    def set(self, key, value, size=None, generation=None, validators=None):
+        endpoint = key[0]
+        ttl = self.ttl(endpoint)
+        if self.max_bytes <= 0 or ttl <= 0:
+            return
+        encoded = codec.dumps(value)
+        if len(encoded) > self.max_bytes:
+            return
+        now = time.time()
+        with self._transaction() as db:
+            if generation is not None and generation != self._meta("generation"):
+                return
+            encoded_key = codec.dumps_text(key)
+            previous = db.execute("SELECT size FROM entries WHERE key = ?", (encoded_key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, endpoint, expires, used, size, value, validators) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (encoded_key, endpoint, now + ttl, now, len(encoded), encoded,
+                 codec.dumps_text(validators) if validators is not None else None),
+            )
+            size = self._meta("size") + len(encoded) - (previous[0] if previous else 0)
+            # Recent hits first, eviction is least recently used
+            self._flush_touches(db)
+            if size > self.max_bytes or time.monotonic() - self._pruned > NETBOX_CACHE_PRUNE_INTERVAL:
+                size -= self._prune(db, now)
+            while size > self.max_bytes:
+                oldest = db.execute("SELECT key, size FROM entries ORDER BY used LIMIT 1").fetchone()
+                db.execute("DELETE FROM entries WHERE key = ?", (oldest[0],))
+                db.execute("UPDATE meta SET value = value + 1 WHERE name = 'evictions'")
+                size -= oldest[1]
+            db.execute("UPDATE meta SET value = ? WHERE name = 'size'", (size,))
+
+    def invalidate(self, endpoint):
+        endpoint = normalize_endpoint(endpoint)
+        with self._transaction() as db:
+            db.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            # Same matching as ResponseCache.invalidate, prefixes compared without LIKE wildcards
+            removed, size = db.execute(
+                """SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE endpoint = ?
+                   OR substr(endpoint, 1, length(?)) = ? OR substr(?, 1, length(endpoint)) = endpoint""",
+                (GRAPHQL_ENDPOINT, endpoint, endpoint, endpoint),
+            ).fetchone()
+            db.execute(
+                """DELETE FROM entries WHERE endpoint = ?
+                   OR substr(endpoint, 1, length(?)) = ? OR substr(?, 1, length(endpoint)) = endpoint""",
+                (GRAPHQL_ENDPOINT, endpoint, endpoint, endpoint),
+            )
+            db.execute("UPDATE meta SET value = value - ? WHERE name = 'size'", (size,))
+            db.execute("UPDATE meta SET value = value + ? WHERE name = 'invalidations'", (removed,))
+        self.invalidations += removed
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute("DELETE FROM entries")
+            db.execute("UPDATE meta SET value = 0 WHERE name = 'size'")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries": entries,
+            "size_bytes": self._meta("size"),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self._meta("evictions"),
+            "invalidations": self._meta("invalidations"),
+            "path": self.path,
+        }
+
+
+response_cache = SharedCache(NETBOX_CACHE_FILE) if NETBOX_CACHE_FILE else ResponseCache()
+
+
+def collect_metrics():
+    stats = response_cache.stats()
+    metrics.cache_entries.set(stats["entries"])
+    metrics.cache_bytes.set(stats["size_bytes"])
+    metrics.cache_lookups.values[("hit",)] = stats["hits"]
+    metrics.cache_lookups.values[("miss",)] = stats["misses"]
+    metrics.cache_hit_ratio.set(stats["hit_ratio"])
+
+
+metrics.register_collector(collect_metrics)
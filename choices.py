@@ -0,0 +1,63 @@
+import os
+import time
+import logging
+import aiofiles
+import codec
+import store
+
+
+logger = logging.getLogger(__name__)
+
+CHOICES_FILE = os.environ.get("NETBOX_CHOICES_FILE") or "choices.json"
+CHOICES_TTL = float(os.environ.get("NETBOX_CHOICES_TTL") or 3600)
+
+
+class ChoiceIndex:
+    """Valid values of endpoint fields, persisted to ``CHOICES_FILE`` and the store.
+
+    Every endpoint/field pair carries its own timestamp, so stale pairs are
+    refreshed one at a time as they are asked for instead of all at once.
+    """
+
+    def __init__(self, path=CHOICES_FILE, ttl=CHOICES_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = None
+        self.restored = False
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                self.entries = codec.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    async def restore(self):
+        """Fill an index without ``CHOICES_FILE``, e.g. after a redeploy, from the store."""
+        if self.entries is None:
+            self._load()
+        if not self.entries and not self.restored:
+            self.entries = await store.load("choices", "index") or {}
+        self.restored = True
+
+    def get(self, endpoint, field):
+        if self.entries is None:
+            self._load()
+        entry = self.entries.get(f"{endpoint}:{field}")
+        if entry is None or time.time() - entry["updated"] > self.ttl:
+            return None
+        return entry["values"]
+
+    async def set(self, endpoint, field, values):
+        if self.entries is None:
+            self._load()
+        self.entries[f"{endpoint}:{field}"] = {"values": values, "updated": time.time()}
+        try:
+            async with aiofiles.open(self.path, "wb") as f:
+                await f.write(codec.dumps(self.entries))
+        except OSError as e:
+            logger.error(f"choices.set could not persist {self.path} with reason {e}")
+        await store.save("choices", "index", self.entries)
+
+
+choice_index = ChoiceIndex()
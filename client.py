@@ -0,0 +1,161 @@
+import os
+import time
+import asyncio
+import aiohttp
+import logging
+import codec
+import limiter
+import metrics
+
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+NETBOX_POOL_LIMIT = int(os.environ.get("NETBOX_POOL_LIMIT") or 100)
+NETBOX_POOL_LIMIT_PER_HOST = int(os.environ.get("NETBOX_POOL_LIMIT_PER_HOST") or 20)
+NETBOX_KEEPALIVE_TIMEOUT = float(os.environ.get("NETBOX_KEEPALIVE_TIMEOUT") or 30)
+NETBOX_DNS_CACHE_TTL = int(os.environ.get("NETBOX_DNS_CACHE_TTL") or 300)
+NETBOX_TIMEOUT = float(os.environ.get("NETBOX_TIMEOUT") or 120)
+NETBOX_CONNECT_TIMEOUT = float(os.environ.get("NETBOX_CONNECT_TIMEOUT") or 10)
+
+NETBOX_URL = os.environ.get("NETBOX_URL") or "http://netbox:8080/"
+
+_session = None
+_session_loop = None
+
+
+def headers():
+    """Headers of every NetBox API request, authenticated with ``NETBOX_API_TOKEN``."""
+    return {
+        "accept": "application/json",
+        "Authorization": f"Token {os.environ.get('NETBOX_API_TOKEN')}",
+    }
+
+
+def _create_session():
+    connector = aiohttp.TCPConnector(
+        limit=NETBOX_POOL_LIMIT,
+        limit_per_host=NETBOX_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=NETBOX_KEEPALIVE_TIMEOUT,
+        use_dns_cache=True,
+        ttl_dns_cache=NETBOX_DNS_CACHE_TTL,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=NETBOX_TIMEOUT,
+        connect=NETBOX_CONNECT_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, json_serialize=codec.dumps_text)
+
+
+async def start():
+    """Create the shared NetBox session, called once at server startup."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is not None and not _session.closed and _session_loop is loop:
+        return _session
+    # A session is bound to the loop that created it, a new loop gets a new pool
+    _session = _create_session()
+    _session_loop = loop
+    logger.info(
+        f"client.start pool limit: {NETBOX_POOL_LIMIT}, per host: {NETBOX_POOL_LIMIT_PER_HOST}, "
+        f"keepalive: {NETBOX_KEEPALIVE_TIMEOUT}s, dns cache ttl: {NETBOX_DNS_CACHE_TTL}s"
+    )
+    return _session
+
+
+async def close():
+    """Close the shared NetBox session, called once at server shutdown."""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+async def get_session():
+    """Return the shared session, creating it lazily outside of the server lifespan."""
+    if _session is None or _session.closed or _session_loop is not asyncio.get_running_loop():
+        return await start()
+    return _session
+
+
+@asynccontextmanager
+async def request(method, url, **kwargs):
+    """Send a request to NetBox within the adaptive limiter, yielding the response.
+
+    Overloaded responses (429, 5xx gateway errors) and, for idempotent
+    methods, connection errors and timeouts are retried up to
+    ``NETBOX_RETRIES`` times with jittered backoff, honouring ``Retry-After``.
+    The last response is yielded as is once retries are exhausted.
+    """
+    session = await get_session()
+    endpoint = metrics.endpoint_label(urlsplit(url).path)
+    attempt = 0
+    while True:
+        await limiter.limiter.acquire()
+        started = time.perf_counter()
+        metrics.upstream_in_flight.inc()
+        try:
+            r = await session.request(method, url, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            metrics.upstream_in_flight.dec()
+            metrics.upstream_requests.inc(method, endpoint, "error")
+            limiter.limiter.release(overloaded=isinstance(e, asyncio.TimeoutError))
+            if method not in limiter.IDEMPOTENT_METHODS or attempt >= limiter.NETBOX_RETRIES:
+                raise
+            delay = limiter.backoff(attempt)
+            attempt += 1
+            metrics.upstream_retries.inc(endpoint, type(e).__name__)
+            logger.info(f"client.request {method} {url} failed with reason {e!r}, retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            metrics.upstream_in_flight.dec()
+            metrics.upstream_requests.inc(method, endpoint, "error")
+            limiter.limiter.release()
+            raise
+        metrics.upstream_in_flight.dec()
+        metrics.upstream_duration.observe(time.perf_counter() - started, method, endpoint)
+        metrics.upstream_requests.inc(method, endpoint, r.status)
+        overloaded = r.status in limiter.OVERLOAD_STATUS
+        if overloaded and attempt < limiter.NETBOX_RETRIES and limiter.should_retry(method, r.status):
+            r.release()
+            limiter.limiter.release(overloaded=True)
+            wait = limiter.retry_after(r.headers.get("Retry-After"))
+            delay = limiter.backoff(attempt, wait)
+            if wait is not None:
+                # NetBox asked every client to back off, not only this request
+                limiter.limiter.pause(delay)
+            attempt += 1
+            metrics.upstream_retries.inc(endpoint, str(r.status))
+            logger.info(f"client.request {method} {url} returned {r.status}, retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        try:
+            yield r
+        finally:
+            r.release()
+            limiter.limiter.release(overloaded=overloaded)
+        return
+
+
+def http_validators(headers):
+    """Return the ``ETag`` and ``Last-Modified`` of a response, None when it has neither."""
+    validators = {}
+    if headers.get("ETag"):
+        validators["etag"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        validators["last_modified"] = headers["Last-Modified"]
+    return validators or None
+
+
+def conditional_headers(headers, validators):
+    """Return ``headers`` asking NetBox for a 304 when the validators still match."""
+    conditional = dict(headers)
+    if "etag" in validators:
+        conditional["If-None-Match"] = validators["etag"]
+    if "last_modified" in validators:
+        conditional["If-Modified-Since"] = validators["last_modified"]
+    return conditional
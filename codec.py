@@ -0,0 +1,82 @@
+import os
+import json
+import logging
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# auto picks the fastest installed backend: orjson, then msgspec, then the stdlib
+NETBOX_JSON_BACKEND = (os.environ.get("NETBOX_JSON_BACKEND") or "auto").lower()
+
+
+def _stdlib():
+    encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=str)
+
+    def dumps(value):
+        return encoder.encode(value).encode()
+
+    return "json", json.loads, dumps
+
+
+def _orjson():
+    import orjson
+
+    def dumps(value):
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    return "orjson", orjson.loads, dumps
+
+
+def _msgspec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=str)
+    return "msgspec", msgspec.json.decode, encoder.encode
+
+
+BACKENDS = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+
+def _select(name):
+    candidates = ["orjson", "msgspec", "json"] if name == "auto" else [name, "json"]
+    for candidate in candidates:
+        try:
+            return BACKENDS[candidate]()
+        except ImportError:
+            if name != "auto":
+                logger.error(f"codec backend {candidate} is not installed, falling back to json")
+        except KeyError:
+            raise ValueError(f"NETBOX_JSON_BACKEND must be one of auto, {', '.join(BACKENDS)}, got {name}")
+
+
+backend, loads, dumps = _select(NETBOX_JSON_BACKEND)
+
+
+def dumps_text(value):
+    """Compact JSON as ``str``, for aiohttp request bodies and MCP text resources."""
+    return dumps(value).decode()
+
+
+async def read_body(response):
+    """Read a NetBox response body, counting the bytes received by endpoint.
+
+    Chunked and compressed responses have no usable ``Content-Length``,
+    the body as read is what is counted.
+    """
+    body = await response.read()
+    metrics.upstream_bytes.inc(metrics.endpoint_label(response.url.path), amount=len(body))
+    return body
+
+
+async def read_json(response):
+    """Decode a NetBox response body straight from its bytes.
+
+    ``aiohttp``'s ``response.json()`` decodes the body to ``str`` before
+    parsing it, the backends here parse the bytes in a single pass. An empty
+    body, as sent with 204 responses, is ``None``.
+    """
+    body = await read_body(response)
+    if not body.strip():
+        return None
+    return loads(body)
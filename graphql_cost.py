@@ -0,0 +1,288 @@
+"""Pre-flight cost estimate of GraphQL queries and pagination of the costly ones.
+
+The cost of a query is the number of values NetBox would resolve: every
+selected field counts once per object it is selected on, and a list field
+multiplies its children by its estimated length. Root lists are as long as
+the object count of their type, nested lists as the ratio between the
+counts of the child and parent types, both read from the REST API and
+cached. A query over ``NETBOX_GRAPHQL_COST_BUDGET`` has its root list
+fields rewritten with ``pagination: {offset, limit}`` and their pages are
+fetched concurrently, then merged back into a single response.
+"""
+import os
+import math
+import asyncio
+import logging
+import graphql_query
+import netbox
+
+from collections import deque
+from itertools import count, islice
+
+
+logger = logging.getLogger(__name__)
+
+NETBOX_GRAPHQL_COST_BUDGET = int(os.environ.get("NETBOX_GRAPHQL_COST_BUDGET") or 20000)
+# Length assumed for lists whose types have no known count
+NETBOX_GRAPHQL_DEFAULT_COUNT = int(os.environ.get("NETBOX_GRAPHQL_DEFAULT_COUNT") or 1000)
+NETBOX_GRAPHQL_DEFAULT_FANOUT = int(os.environ.get("NETBOX_GRAPHQL_DEFAULT_FANOUT") or 10)
+NETBOX_GRAPHQL_MAX_PAGE_SIZE = int(os.environ.get("NETBOX_GRAPHQL_MAX_PAGE_SIZE") or 1000)
+NETBOX_GRAPHQL_MAX_PAGES = int(os.environ.get("NETBOX_GRAPHQL_MAX_PAGES") or 100)
+NETBOX_GRAPHQL_PAGE_CONCURRENCY = int(os.environ.get("NETBOX_GRAPHQL_PAGE_CONCURRENCY") or 4)
+
+# NetBox names the GraphQL type of a model after it, e.g. Device is DeviceType
+ENDPOINTS_BY_TYPE = {
+    f"{details['name']}Type": f"{details['endpoint']}/" for details in netbox.NETBOX_OBJECT_TYPES.values()
+}
+_opening = ("(", "[", "{")
+_closing = (")", "]", "}")
+
+
+def arguments(tokens):
+    """Split the raw argument tokens of a field into ``{name: value tokens}``."""
+    inner = tokens[1:-1]
+    values = {}
+    name = None
+    depth = 0
+    i = 0
+    while i < len(inner):
+        if depth == 0 and i + 1 < len(inner) and inner[i + 1] == ":":
+            name = inner[i]
+            values[name] = []
+            i += 2
+            continue
+        token = inner[i]
+        if token in _opening:
+            depth += 1
+        elif token in _closing:
+            depth -= 1
+        values[name].append(token)
+        i += 1
+    return values
+
+
+def pagination_limit(values):
+    """Return the literal ``limit`` of a ``pagination`` argument, None without one."""
+    tokens = values.get("pagination") or []
+    for i, token in enumerate(tokens[:-2]):
+        if token == "limit" and tokens[i + 1] == ":" and tokens[i + 2].isdigit():
+            return int(tokens[i + 2])
+    return None
+
+
+def _fragments(definitions):
+    return {definition["name"]: definition for definition in definitions if definition["kind"] == "fragment"}
+
+
+def list_types(schema, type_name, selections, fragments, found=None, seen=()):
+    """Return the types whose counts the estimate uses, list items and their parents."""
+    found = set() if found is None else found
+    fields = schema.types.get(type_name) or {}
+    for selection in selections:
+        if selection["kind"] == "fragment_spread":
+            fragment = fragments.get(selection["name"])
+            if fragment is not None and selection["name"] not in seen:
+                list_types(schema, fragment["type_condition"], fragment["selections"], fragments, found,
+                           seen + (selection["name"],))
+            continue
+        if selection["kind"] == "inline_fragment":
+            list_types(schema, selection["type_condition"] or type_name, selection["selections"], fragments, found, seen)
+            continue
+        field = fields.get(selection["name"])
+        if field is None or field.type_name is None:
+            continue
+        if field.is_list:
+            found.update((type_name, field.type_name))
+        if selection["selections"] is not None:
+            list_types(schema, field.type_name, selection["selections"], fragments, found, seen)
+    return found
+
+
+def list_size(schema, type_name, field, values, counts):
+    """Estimated length of a list field selected on one object of ``type_name``."""
+    known = counts.get(field.type_name)
+    if type_name == schema.query_type:
+        size = known if known is not None else NETBOX_GRAPHQL_DEFAULT_COUNT
+    elif known is not None and counts.get(type_name):
+        size = math.ceil(known / counts[type_name])
+    else:
+        size = NETBOX_GRAPHQL_DEFAULT_FANOUT
+    limit = pagination_limit(values)
+    return size if limit is None else min(size, limit)
+
+
+def selection_cost(schema, type_name, selections, fragments, counts, seen=()):
+    """Estimated values resolved for the selections of one object of ``type_name``."""
+    fields = schema.types.get(type_name) or {}
+    cost = 0
+    for selection in selections:
+        if selection["kind"] == "fragment_spread":
+            fragment = fragments.get(selection["name"])
+            if fragment is not None and selection["name"] not in seen:
+                cost += selection_cost(schema, fragment["type_condition"], fragment["selections"], fragments, counts,
+                                       seen + (selection["name"],))
+            continue
+        if selection["kind"] == "inline_fragment":
+            cost += selection_cost(schema, selection["type_condition"] or type_name, selection["selections"],
+                                   fragments, counts, seen)
+            continue
+        field = fields.get(selection["name"])
+        items = 1
+        if field is not None and field.is_list:
+            items = list_size(schema, type_name, field, arguments(selection["arguments"]), counts)
+        children = 0
+        if field is not None and selection["selections"] is not None:
+            children = selection_cost(schema, field.type_name, selection["selections"], fragments, counts, seen)
+        cost += items * (1 + children)
+    return cost
+
+
+def estimate(schema, query, counts={}):
+    """Return the estimated cost of the query operations of a GraphQL document."""
+    definitions = graphql_query.parse(query)
+    fragments = _fragments(definitions)
+    return sum(
+        selection_cost(schema, schema.query_type, definition["selections"], fragments, counts)
+        for definition in definitions
+        if definition["kind"] == "operation" and definition["operation"] == "query"
+    )
+
+
+async def known_counts(type_names):
+    """Return the object count of the types backed by a NetBox list endpoint, skipping failures."""
+    type_names = [type_name for type_name in type_names if type_name in ENDPOINTS_BY_TYPE]
+    results = await asyncio.gather(
+        *(netbox.count(ENDPOINTS_BY_TYPE[type_name]) for type_name in type_names), return_exceptions=True
+    )
+    counts = {}
+    for type_name, result in zip(type_names, results):
+        if isinstance(result, Exception):
+            logger.info(f"graphql_cost.known_counts no count for {type_name}: {result}")
+        else:
+            counts[type_name] = result
+    return counts
+
+
+def _used_fragments(selections, fragments, used):
+    for selection in selections:
+        if selection["kind"] == "fragment_spread":
+            fragment = fragments.get(selection["name"])
+            if fragment is not None and selection["name"] not in used:
+                used[selection["name"]] = fragment
+                _used_fragments(fragment["selections"], fragments, used)
+        elif selection["selections"] is not None:
+            _used_fragments(selection["selections"], fragments, used)
+    return used
+
+
+def _document(operation, selections, fragments):
+    """Print the operation reduced to ``selections`` with only the fragments they spread."""
+    used = _used_fragments(selections, fragments, {})
+    return graphql_query.print_document([{**operation, "selections": selections}, *used.values()])
+
+
+def _page(selection, key, offset, limit):
+    tokens = selection["arguments"] or ["(", ")"]
+    pagination = ["pagination", ":", "{", "offset", ":", str(offset), "limit", ":", str(limit), "}"]
+    return {**selection, "alias": key if key != selection["name"] else None, "arguments": tokens[:-1] + pagination + [")"]}
+
+
+async def fetch_pages(operation, selection, fragments, page_size, rows):
+    """Fetch a root list field page by page, a window of pages at a time, until a short page."""
+    key = selection["alias"] or selection["name"]
+    offsets = count(0, page_size)
+
+    def fetch(offset):
+        page = _page(selection, key, offset, page_size)
+        return asyncio.create_task(netbox.graphql_get(_document(operation, [page], fragments)))
+
+    window = max(1, min(NETBOX_GRAPHQL_PAGE_CONCURRENCY, NETBOX_GRAPHQL_MAX_PAGES, math.ceil(rows / page_size)))
+    pending = deque(fetch(offset) for offset in islice(offsets, window))
+    items = []
+    errors = []
+    pages = 0
+    truncated = False
+    try:
+        while pending:
+            response = await pending.popleft()
+            pages += 1
+            errors.extend(response.get("errors") or [])
+            page = (response.get("data") or {}).get(key)
+            if page is None:
+                break
+            items.extend(page)
+            if len(page) < page_size:
+                break
+            if pages >= NETBOX_GRAPHQL_MAX_PAGES:
+                truncated = True
+                break
+            if pages + len(pending) < NETBOX_GRAPHQL_MAX_PAGES:
+                pending.append(fetch(next(offsets)))
+    finally:
+        for task in pending:
+            task.cancel()
+    return items, errors, {"pages": pages, "page_size": page_size, "truncated": truncated}
+
+
+async def execute(schema, query, counts=None):
+    """Send a query to NetBox, paginating its root lists when it is over budget."""
+    definitions = graphql_query.parse(query)
+    operations = [definition for definition in definitions if definition["kind"] == "operation"]
+    # Variables unused by a page would fail validation, those queries are sent as written
+    if len(operations) != 1 or operations[0]["operation"] != "query" or "$" in operations[0]["header"]:
+        return await netbox.graphql_get(query)
+    operation = operations[0]
+    fragments = _fragments(definitions)
+    type_names = list_types(schema, schema.query_type, operation["selections"], fragments)
+    if not type_names:
+        return await netbox.graphql_get(query)
+    if counts is None:
+        counts = await known_counts(type_names)
+    cost = selection_cost(schema, schema.query_type, operation["selections"], fragments, counts)
+    if cost <= NETBOX_GRAPHQL_COST_BUDGET:
+        return await netbox.graphql_get(query)
+
+    root_fields = schema.types.get(schema.query_type) or {}
+    paginated = []
+    rest = []
+    for selection in operation["selections"]:
+        field = root_fields.get(selection["name"]) if selection["kind"] == "field" else None
+        if (
+            field is None or not field.is_list or "pagination" not in field.args
+            or "pagination" in arguments(selection["arguments"])
+        ):
+            rest.append(selection)
+            continue
+        row_cost = 1 + selection_cost(schema, field.type_name, selection["selections"] or [], fragments, counts)
+        rows = list_size(schema, schema.query_type, field, {}, counts)
+        page_size = max(1, min(NETBOX_GRAPHQL_MAX_PAGE_SIZE, NETBOX_GRAPHQL_COST_BUDGET // row_cost))
+        paginated.append((selection, page_size, rows))
+    if not paginated:
+        logger.info(f"graphql_cost.execute query estimated at {cost} has no list to paginate, sent as is")
+        return await netbox.graphql_get(query)
+    logger.info(
+        f"graphql_cost.execute query estimated at {cost} over the {NETBOX_GRAPHQL_COST_BUDGET} budget, paginating "
+        + ", ".join(f"{selection['alias'] or selection['name']} by {page_size}" for selection, page_size, _ in paginated)
+    )
+
+    tasks = [fetch_pages(operation, selection, fragments, page_size, rows) for selection, page_size, rows in paginated]
+    if rest:
+        tasks.append(netbox.graphql_get(_document(operation, rest, fragments)))
+    results = await asyncio.gather(*tasks)
+    rest_response = results.pop() if rest else {}
+    data = dict(rest_response.get("data") or {})
+    errors = list(rest_response.get("errors") or [])
+    pagination = {}
+    for (selection, _, _), (items, page_errors, details) in zip(paginated, results):
+        key = selection["alias"] or selection["name"]
+        data[key] = items
+        errors.extend(page_errors)
+        pagination[key] = details
+    # Keys in the order the query selected them
+    order = [selection["alias"] or selection["name"] for selection in operation["selections"] if selection["kind"] == "field"]
+    data = {**{key: data[key] for key in order if key in data}, **data}
+    response = {"data": data}
+    if errors:
+        response["errors"] = errors
+    response["extensions"] = {"pagination": pagination, "estimated_cost": cost}
+    return response
@@ -0,0 +1,196 @@
+import re
+
+
+_token_re = re.compile(r'''
+    (?P<ignored>[\s,\ufeff]+|\#[^\n]*)
+    | (?P<block_string>"""(?:\\"""|[^"]|"(?!""))*""")
+    | (?P<string>"(?:\\.|[^"\\\n])*")
+    | (?P<spread>\.\.\.)
+    | (?P<punctuator>[!$&()\:=@\[\]{|}])
+    | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+''', re.VERBOSE)
+
+OPERATIONS = ("query", "mutation", "subscription")
+_closing = {"(": ")", "[": "]", "{": "}"}
+
+
+def tokenize(query):
+    tokens = []
+    position = 0
+    while position < len(query):
+        match = _token_re.match(query, position)
+        if match is None:
+            raise ValueError(f"Unexpected character {query[position]!r} at position {position} of the GraphQL query")
+        position = match.end()
+        if match.lastgroup != "ignored":
+            tokens.append(match.group())
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of the GraphQL query")
+        self.position += 1
+        return token
+
+    def expect(self, expected):
+        token = self.take()
+        if token != expected:
+            raise ValueError(f"Expected '{expected}' but found '{token}' in the GraphQL query")
+        return token
+
+    def balanced(self):
+        """Return the tokens of a bracketed group, brackets included."""
+        opening = self.peek()
+        tokens = [self.take()]
+        stack = [_closing[opening]]
+        while stack:
+            token = self.take()
+            tokens.append(token)
+            if token in _closing:
+                stack.append(_closing[token])
+            elif token == stack[-1]:
+                stack.pop()
+            elif token in (")", "]", "}"):
+                raise ValueError(f"Unbalanced '{token}' in the GraphQL query")
+        return tokens
+
+    def directives(self):
+        tokens = []
+        while self.peek() == "@":
+            tokens.append(self.take())
+            tokens.append(self.take())
+            if self.peek() == "(":
+                tokens.extend(self.balanced())
+        return tokens
+
+    def document(self):
+        definitions = []
+        while self.peek() is not None:
+            definitions.append(self.definition())
+        return definitions
+
+    def definition(self):
+        token = self.peek()
+        if token == "{":
+            return {"kind": "operation", "operation": "query", "header": [], "selections": self.selection_set()}
+        if token in OPERATIONS:
+            header = [self.take()]
+            if self.peek() not in ("(", "@", "{"):
+                header.append(self.take())
+            if self.peek() == "(":
+                header.extend(self.balanced())
+            header.extend(self.directives())
+            return {"kind": "operation", "operation": token, "header": header, "selections": self.selection_set()}
+        if token == "fragment":
+            self.take()
+            name = self.take()
+            self.expect("on")
+            type_condition = self.take()
+            directives = self.directives()
+            return {
+                "kind": "fragment",
+                "name": name,
+                "type_condition": type_condition,
+                "directives": directives,
+                "selections": self.selection_set(),
+            }
+        raise ValueError(f"Unexpected '{token}' at the top level of the GraphQL query")
+
+    def selection_set(self):
+        self.expect("{")
+        selections = []
+        while self.peek() != "}":
+            selections.append(self.selection())
+        self.expect("}")
+        return selections
+
+    def selection(self):
+        if self.peek() == "...":
+            self.take()
+            if self.peek() == "on" or self.peek() in ("@", "{"):
+                type_condition = None
+                if self.peek() == "on":
+                    self.take()
+                    type_condition = self.take()
+                directives = self.directives()
+                return {
+                    "kind": "inline_fragment",
+                    "type_condition": type_condition,
+                    "directives": directives,
+                    "selections": self.selection_set(),
+                }
+            return {"kind": "fragment_spread", "name": self.take(), "directives": self.directives()}
+        alias = None
+        name = self.take()
+        if self.peek() == ":":
+            self.take()
+            alias, name = name, self.take()
+        arguments = self.balanced() if self.peek() == "(" else []
+        directives = self.directives()
+        selections = self.selection_set() if self.peek() == "{" else None
+        return {
+            "kind": "field",
+            "alias": alias,
+            "name": name,
+            "arguments": arguments,
+            "directives": directives,
+            "selections": selections,
+        }
+
+
+def parse(query):
+    """Parse a GraphQL document into plain dict nodes.
+
+    Only the structure needed for validation and rewriting is kept: arguments,
+    variable definitions and directives are stored as raw token lists.
+    """
+    return _Parser(tokenize(query)).document()
+
+
+def _print_selections(selections):
+    parts = ["{"]
+    for selection in selections:
+        if selection["kind"] == "field":
+            if selection["alias"]:
+                parts.append(f"{selection['alias']}:")
+            parts.append(selection["name"])
+            parts.extend(selection["arguments"])
+            parts.extend(selection["directives"])
+            if selection["selections"] is not None:
+                parts.append(_print_selections(selection["selections"]))
+        elif selection["kind"] == "inline_fragment":
+            parts.append("...")
+            if selection["type_condition"]:
+                parts.extend(["on", selection["type_condition"]])
+            parts.extend(selection["directives"])
+            parts.append(_print_selections(selection["selections"]))
+        else:
+            parts.extend(["...", selection["name"]])
+            parts.extend(selection["directives"])
+    parts.append("}")
+    return " ".join(parts)
+
+
+def print_document(definitions):
+    parts = []
+    for definition in definitions:
+        if definition["kind"] == "operation":
+            parts.extend(definition["header"])
+        else:
+            parts.extend(["fragment", definition["name"], "on", definition["type_condition"]])
+            parts.extend(definition["directives"])
+        parts.append(_print_selections(definition["selections"]))
+    return " ".join(parts)
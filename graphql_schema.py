@@ -0,0 +1,237 @@
+import os
+import time
+import asyncio
+import difflib
+import logging
+import codec
+import netbox
+import graphql_query
+import store
+import validation
+
+from typing import NamedTuple
+
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_SCHEMA_FILE = os.environ.get("NETBOX_GRAPHQL_SCHEMA_FILE") or "graphql_schema.json"
+GRAPHQL_SCHEMA_TTL = float(os.environ.get("NETBOX_GRAPHQL_SCHEMA_TTL") or 24 * 3600)
+GRAPHQL_SCHEMA_CHECK_INTERVAL = float(os.environ.get("NETBOX_GRAPHQL_SCHEMA_CHECK_INTERVAL") or 300)
+
+_type_ref = "kind name ofType { kind name ofType { kind name ofType { kind name } } }"
+
+INTROSPECTION_QUERY = f"""
+query {{
+  __schema {{
+    queryType {{ name }}
+    types {{
+      name
+      kind
+      description
+      fields {{
+        name
+        description
+        args {{ name }}
+        type {{ {_type_ref} }}
+      }}
+    }}
+  }}
+}}
+"""
+
+
+class FieldType(NamedTuple):
+    type_name: str | None
+    is_list: bool
+    args: tuple
+
+
+class GraphQLSchema:
+    """NetBox GraphQL introspection with everything derived from it precomputed.
+
+    ``types`` maps every type name to its fields and their unwrapped return
+    type, ``resource`` is the compact JSON served as ``netbox://graphql-schema``.
+    """
+
+    def __init__(self, data, version=None, fetched_at=None):
+        self.data = data
+        self.version = version
+        self.fetched_at = fetched_at or time.time()
+        schema = data["__schema"]
+        self.query_type = (schema.get("queryType") or {}).get("name") or "Query"
+        self.types = {}
+        resource_types = []
+        for graphql_type in schema["types"]:
+            fields = {}
+            for field in graphql_type.get("fields") or []:
+                fields[field["name"]] = FieldType(
+                    *unwrap_type(field.get("type")),
+                    tuple(arg["name"] for arg in field.get("args") or []),
+                )
+            self.types[graphql_type["name"]] = fields
+            resource_types.append({
+                "name": graphql_type["name"],
+                "kind": graphql_type["kind"],
+                "description": graphql_type.get("description"),
+                "fields": [
+                    {"name": field["name"], "description": field.get("description")}
+                    for field in graphql_type.get("fields") or []
+                ] if graphql_type.get("fields") is not None else None,
+            })
+        self.resource = codec.dumps_text({"__schema": {"types": resource_types}})
+
+    def expired(self):
+        return time.time() - self.fetched_at > GRAPHQL_SCHEMA_TTL
+
+
+def unwrap_type(type_ref):
+    """Return (named type, is list) of a possibly NON_NULL/LIST wrapped type."""
+    is_list = False
+    while type_ref is not None and type_ref.get("kind") in ("NON_NULL", "LIST"):
+        if type_ref["kind"] == "LIST":
+            is_list = True
+        type_ref = type_ref.get("ofType")
+    if type_ref is None:
+        return None, is_list
+    return type_ref.get("name"), is_list
+
+
+_schema = None
+_refresh_task = None
+_warmup_task = None
+
+
+async def get_netbox_version():
+    return await store.fetch_version()
+
+
+async def introspect():
+    version = await get_netbox_version()
+    response = await netbox.graphql_get(INTROSPECTION_QUERY, cached=False)
+    if not response or "data" not in response or not response["data"]:
+        raise LookupError(f"Failed to introspect NetBox GraphQL schema with reason {response}")
+    schema = GraphQLSchema(response["data"], version)
+    content = codec.dumps({"version": schema.version, "fetched_at": schema.fetched_at, "data": schema.data})
+    await validation.write_file(GRAPHQL_SCHEMA_FILE, content)
+    await store.save_raw("graphql", "introspection", content)
+    logger.info(f"graphql_schema.introspect loaded {len(schema.types)} types for NetBox {version}")
+    return schema
+
+
+def _load_file():
+    try:
+        with open(GRAPHQL_SCHEMA_FILE, "rb") as f:
+            return _from_content(codec.loads(f.read()))
+    except FileNotFoundError:
+        return None
+
+
+async def _load_store():
+    content = await store.load("graphql", "introspection")
+    return None if content is None else _from_content(content)
+
+
+def _from_content(content):
+    if "__schema" not in content.get("data", {}):
+        return None
+    return GraphQLSchema(content["data"], content.get("version"), content.get("fetched_at"))
+
+
+async def refresh(force=False):
+    """Re-introspect when forced, when the TTL expired or when NetBox was upgraded."""
+    global _schema
+    if not force and _schema is not None:
+        if not _schema.expired():
+            version = await get_netbox_version()
+            if version is None or version == _schema.version:
+                return _schema
+            logger.info(f"graphql_schema.refresh NetBox version changed from {_schema.version} to {version}")
+    _schema = await introspect()
+    return _schema
+
+
+async def _background_refresh():
+    try:
+        await refresh(force=True)
+    except Exception as e:
+        logger.error(f"graphql_schema background refresh failed with reason {e}")
+
+
+async def get_schema():
+    """Return the introspected schema from memory, disk, the store or NetBox, in that order.
+
+    An expired schema is still served while a refresh runs in the background.
+    """
+    global _schema, _refresh_task
+    if _schema is None:
+        _schema = await asyncio.to_thread(_load_file) or await _load_store()
+        if _schema is None:
+            return await refresh(force=True)
+    if _schema.expired() and (_refresh_task is None or _refresh_task.done()):
+        _refresh_task = asyncio.create_task(_background_refresh())
+    return _schema
+
+
+def start_warm_up():
+    """Load or introspect the schema in the background, from the server lifespan."""
+    global _warmup_task
+    _warmup_task = asyncio.create_task(get_schema())
+    return _warmup_task
+
+
+async def get_schema_nowait():
+    """Return the schema, or None while the startup warm-up is still loading it."""
+    if _schema is None and _warmup_task is not None and not _warmup_task.done():
+        return None
+    return await get_schema()
+
+
+async def refresh_forever():
+    """Poll for NetBox upgrades and TTL expiry, run for the server lifetime."""
+    while True:
+        await asyncio.sleep(GRAPHQL_SCHEMA_CHECK_INTERVAL)
+        try:
+            if _schema is not None:
+                await refresh()
+        except Exception as e:
+            logger.error(f"graphql_schema.refresh_forever failed with reason {e}")
+
+
+def _validate_selections(schema, type_name, selections, errors):
+    fields = schema.types.get(type_name)
+    if fields is None:
+        return
+    for selection in selections:
+        if selection["kind"] == "inline_fragment":
+            _validate_selections(schema, selection["type_condition"] or type_name, selection["selections"], errors)
+            continue
+        if selection["kind"] == "fragment_spread":
+            continue
+        name = selection["name"]
+        if name.startswith("__"):
+            continue
+        field = fields.get(name)
+        if field is None:
+            suggestions = difflib.get_close_matches(name, fields, n=3)
+            hint = f", did you mean {suggestions}?" if suggestions else ""
+            errors.append(f"Field '{name}' does not exist on type '{type_name}'{hint}")
+            continue
+        if selection["selections"] is not None and field.type_name is not None:
+            _validate_selections(schema, field.type_name, selection["selections"], errors)
+
+
+def validate_query(schema, query):
+    """Check every selected field of a query exists in the introspected schema.
+
+    Raises ValueError on syntax errors and unknown fields. Mutations and types
+    missing from the introspection are left for NetBox to validate.
+    """
+    definitions = graphql_query.parse(query)
+    errors = []
+    for definition in definitions:
+        if definition["kind"] == "fragment":
+            _validate_selections(schema, definition["type_condition"], definition["selections"], errors)
+        elif definition["operation"] == "query":
+            _validate_selections(schema, schema.query_type, definition["selections"], errors)
+    if errors:
+        raise ValueError("\n".join(errors[:10]))
@@ -0,0 +1,168 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import metrics
+
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+logger = logging.getLogger(__name__)
+
+# Both caps are for the whole server, with NETBOX_WORKERS each worker gets its share
+NETBOX_MAX_CONCURRENCY = int(os.environ.get("NETBOX_MAX_CONCURRENCY") or 16)
+NETBOX_MIN_CONCURRENCY = int(os.environ.get("NETBOX_MIN_CONCURRENCY") or 1)
+# Requests per second toward NetBox, 0 disables the token bucket
+NETBOX_RATE_LIMIT = float(os.environ.get("NETBOX_RATE_LIMIT") or 0)
+NETBOX_RATE_BURST = float(os.environ.get("NETBOX_RATE_BURST") or max(1.0, NETBOX_RATE_LIMIT))
+NETBOX_RETRIES = int(os.environ.get("NETBOX_RETRIES") or 3)
+NETBOX_RETRY_BACKOFF = float(os.environ.get("NETBOX_RETRY_BACKOFF") or 0.5)
+NETBOX_RETRY_MAX_DELAY = float(os.environ.get("NETBOX_RETRY_MAX_DELAY") or 30)
+
+# Statuses meaning NetBox is overloaded, the request was not served
+OVERLOAD_STATUS = frozenset({429, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class AdaptiveLimiter:
+    """Concurrency limit toward NetBox, adjusted by additive increase, multiplicative decrease.
+
+    Every served request raises the limit by ``1 / limit``, about one more
+    slot per round of requests, up to ``max_concurrency``. An overloaded
+    response or a timeout halves it, at most once per ``cooldown`` so a burst
+    of failures from the same round only counts once. An optional token
+    bucket caps the request rate on top, and ``pause`` holds every caller
+    back after a ``Retry-After``.
+    """
+
+    def __init__(self, max_concurrency=NETBOX_MAX_CONCURRENCY, min_concurrency=NETBOX_MIN_CONCURRENCY,
+                 rate=NETBOX_RATE_LIMIT, burst=NETBOX_RATE_BURST, cooldown=1.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._refilled = time.monotonic()
+        self._decreased = 0.0
+        self._waiters = deque()
+
+    def _take_token(self):
+        """Return 0 when a token was taken, otherwise the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight >= int(self.limit):
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    if waiter.done() and not waiter.cancelled():
+                        # Woken and cancelled at once, hand the slot to the next waiter
+                        self._wake()
+                    raise
+                continue
+            if self.rate:
+                delay = self._take_token()
+                if delay:
+                    await asyncio.sleep(delay)
+                    continue
+            self.in_flight += 1
+            return
+
+    def release(self, overloaded=False):
+        self.in_flight -= 1
+        if overloaded:
+            now = time.monotonic()
+            if now - self._decreased >= self.cooldown:
+                self._decreased = now
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                logger.info(f"limiter.release NetBox overloaded, concurrency limit lowered to {int(self.limit)}")
+        elif self.limit < self.max_concurrency:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        self._wake()
+
+    def pause(self, delay):
+        """Hold back every new request for ``delay`` seconds."""
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def stats(self):
+        return {"limit": int(self.limit), "in_flight": self.in_flight, "waiting": len(self._waiters)}
+
+
+def retry_after(value):
+    """Seconds to wait from a ``Retry-After`` header, either delta seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, retry_after_delay=None):
+    """Full jitter exponential backoff, never shorter than ``Retry-After``."""
+    delay = random.uniform(0, min(NETBOX_RETRY_MAX_DELAY, NETBOX_RETRY_BACKOFF * 2 ** attempt))
+    if retry_after_delay is not None:
+        delay = max(delay, min(retry_after_delay, NETBOX_RETRY_MAX_DELAY))
+    return delay
+
+
+def should_retry(method, status):
+    """Overloaded responses were not served and can always be retried, except
+    a bad gateway or timeout for a non idempotent write which may have been applied."""
+    if status == 429 or status == 503:
+        return True
+    return status in OVERLOAD_STATUS and method in IDEMPOTENT_METHODS
+
+
+limiter = AdaptiveLimiter()
+
+
+def share(workers):
+    """Replace the limiter with one of ``workers`` processes' share of the
+    concurrency and rate caps, called before forking them."""
+    global limiter
+    limiter = AdaptiveLimiter(
+        max_concurrency=max(1, NETBOX_MAX_CONCURRENCY // workers),
+        rate=NETBOX_RATE_LIMIT / workers,
+        burst=max(1.0, NETBOX_RATE_BURST / workers),
+    )
+    return limiter
+
+
+def collect_metrics():
+    metrics.upstream_concurrency_limit.set(int(limiter.limit))
+    metrics.upstream_waiting.set(len(limiter._waiters))
+
+
+metrics.register_collector(collect_metrics)
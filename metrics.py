@@ -0,0 +1,142 @@
+import re
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_id_re = re.compile(r"/\d+(?=/|$)")
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.values = {}
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # Per bucket counts (the last one is +Inf), sum, count
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+def register_collector(collect):
+    """Register a callable run before every scrape, to refresh derived gauges."""
+    _collectors.append(collect)
+
+
+def endpoint_label(path):
+    """Reduce a NetBox URL path to a bounded label, ``/api/dcim/devices/12/`` -> ``dcim/devices/{id}/``."""
+    path = path.split("?", 1)[0]
+    if path.startswith("/api/"):
+        path = path[5:]
+    return _id_re.sub("/{id}", path).lstrip("/")
+
+
+def render():
+    for collect in _collectors:
+        collect()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+tool_requests = Counter("mcp_tool_requests_total", "MCP tool calls by tool and outcome.", ("tool", "outcome"))
+tool_duration = Histogram("mcp_tool_duration_seconds", "MCP tool call latency.", ("tool",))
+tool_in_flight = Gauge("mcp_tool_in_flight", "MCP tool calls being served.", ("tool",))
+upstream_requests = Counter("netbox_requests_total", "Requests sent to NetBox by method, endpoint and status.", ("method", "endpoint", "status"))
+upstream_duration = Histogram("netbox_request_duration_seconds", "NetBox response latency until headers.", ("method", "endpoint"))
+upstream_in_flight = Gauge("netbox_requests_in_flight", "Requests to NetBox awaiting a response.")
+upstream_retries = Counter("netbox_request_retries_total", "Requests to NetBox retried by endpoint and reason.", ("endpoint", "reason"))
+upstream_concurrency_limit = Gauge("netbox_concurrency_limit", "Current adaptive limit of concurrent requests to NetBox.")
+upstream_waiting = Gauge("netbox_requests_waiting", "Requests to NetBox queued behind the concurrency limit.")
+upstream_bytes = Counter("netbox_response_bytes_total", "Bytes received from NetBox by endpoint.", ("endpoint",))
+pages_per_call = Histogram("netbox_pages_per_call", "List pages fetched per netbox.get call.", ("endpoint",), buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+schema_validation = Histogram("netbox_schema_validation_seconds", "Time spent validating paths and query params.", buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.1))
+replica_queries = Counter("netbox_replica_queries_total", "get calls on replicated endpoints answered locally or by NetBox.", ("endpoint", "source"))
+replica_records = Gauge("netbox_replica_records", "Records held by the local replica.", ("endpoint",))
+replica_lag = Gauge("netbox_replica_lag_seconds", "Seconds since the replica last synced.", ("endpoint",))
+startup_seconds = Gauge("mcp_startup_seconds", "Time spent in each startup phase.", ("phase",))
+cache_entries = Gauge("netbox_cache_entries", "Entries in the NetBox response cache.")
+cache_bytes = Gauge("netbox_cache_bytes", "Estimated size of the NetBox response cache.")
+cache_lookups = Counter("netbox_cache_lookups_total", "Response cache lookups by result.", ("result",))
+cache_revalidations = Counter("netbox_cache_revalidations_total", "Expired list entries checked against NetBox by endpoint and result.", ("endpoint", "result"))
+cache_hit_ratio = Gauge("netbox_cache_hit_ratio", "Response cache hit ratio since start.")
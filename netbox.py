@@ -1,39 +1,148 @@
 import re
 import os
-import aiohttp
 import asyncio
 import logging
+import cache
+import client
+import codec
+import choices
+import metrics
+import replica
+import store
 import validation
-import re
 
+from collections import Counter, deque
+from contextlib import aclosing
 from fastmcp.exceptions import ToolError
+from itertools import islice
+from urllib.parse import urlsplit, parse_qs
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-NETBOX_URL = os.environ.get("NETBOX_URL") or "http://netbox:8080/" 
+NETBOX_PAGE_CONCURRENCY = int(os.environ.get("NETBOX_PAGE_CONCURRENCY") or 4)
+NETBOX_BULK_CHUNK_SIZE = int(os.environ.get("NETBOX_BULK_CHUNK_SIZE") or 100)
+NETBOX_BULK_CONCURRENCY = int(os.environ.get("NETBOX_BULK_CONCURRENCY") or 4)
+
+BULK_EXPECTED_STATUS = {"POST": 201, "PATCH": 200, "DELETE": 204}
+
+_inflight = {}
+_endpoint_re = re.compile(r"^(?:[a-z0-9_-]+/){2,}$")
+# Params a list query may be sent with unvalidated while the schema warms up
+UNFILTERED_PARAMS = frozenset(["limit", "offset", "fields", "brief"])
+
+
+def page_offsets(response):
+    """Return the (limit, offsets) still to fetch after a first list page.
+
+    Returns None when the ``next`` link is not limit/offset based (cursor style
+    pagination), in that case the caller has to follow ``next`` sequentially.
+    """
+    if response.get("next") is None or response.get("count") is None:
+        return None
+    next_query = parse_qs(urlsplit(response["next"]).query)
+    if "offset" not in next_query:
+        return None
+    try:
+        offset = int(next_query["offset"][0])
+        limit = int(next_query["limit"][0]) if "limit" in next_query else len(response["results"])
+    except ValueError:
+        return None
+    if limit <= 0:
+        return None
+    return limit, range(offset, response["count"], limit)
+
+
+def _forget_flight(key, future):
+    if _inflight.get(key) is future:
+        del _inflight[key]
+    if not future.cancelled():
+        # Mark the exception retrieved even when every waiter was cancelled
+        future.exception()
+
+
+async def single_flight(key, fetch):
+    """Share one ``fetch()`` between concurrent callers asking for the same key.
+
+    The first caller starts the fetch, callers arriving while it is in flight
+    await the same task and get the same result or exception. A cancelled
+    caller does not cancel the fetch for the others.
+    """
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(fetch())
+        _inflight[key] = future
+        future.add_done_callback(lambda done: _forget_flight(key, done))
+    else:
+        logger.info(f"netbox.single_flight joined in-flight request {key[0]}")
+    return await asyncio.shield(future)
+
+
+async def fetch_page(url, headers, params, limit, offset):
+    page_params = {**params, "limit": limit, "offset": offset}
+    async with client.request("GET", url, headers=headers, params=page_params) as r:
+        response = await codec.read_json(r)
+        if r.status != 200:
+            raise LookupError(response)
+        return response
 
 
 async def get_field_choices(endpoint, field_name):
-    api_token = os.environ.get("NETBOX_API_TOKEN")
-    api_url = f"{NETBOX_URL}api/"
+    """Return the valid values of a field for "not one of the available choices" errors.
+
+    Choice fields are answered from the OpenAPI enums, foreign keys from the
+    slugs of the related endpoint, both without scanning ``endpoint`` itself.
+    """
+    schema = await validation.get_schema_index()
+    path_index = schema.paths.get(f"/api/{endpoint}")
+    if path_index is not None and field_name in path_index.choices:
+        return list(path_index.choices[field_name])
+    await choices.choice_index.restore()
+    values = choices.choice_index.get(endpoint, field_name)
+    if values is not None:
+        return values
+    if path_index is not None and field_name in path_index.related:
+        related_endpoint = path_index.related[field_name][len("/api/"):]
+        values = [
+            record["slug"]
+            async for record in iter_records(related_endpoint, {"fields": ["slug"]})
+            if record.get("slug")
+        ]
+    else:
+        values = await scan_field_choices(endpoint, field_name)
+    await choices.choice_index.set(endpoint, field_name, values)
+    logger.info(f"netbox.get_field_choices indexed {len(values)} choices for endpoint: {endpoint}, field_name: {field_name}")
+    return values
+
+
+async def scan_field_choices(endpoint, field_name):
+    api_url = f"{client.NETBOX_URL}api/"
     url = f"{api_url}{endpoint}"
     params = {
         "limit": 0,
         "fields": field_name,}
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Token {api_token}",
-    }
+    headers = client.headers()
     choices = set()
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as r:
-                response = await r.json()
-                if r.status != 200:
-                    raise LookupError(response)
-                response = await r.json()
+        async with client.request("GET", url, headers=headers, params=params) as r:
+            response = await codec.read_json(r)
+            if r.status != 200:
+                raise LookupError(response)
+            for item in response["results"]:
+                if field_name in item and item[field_name] is not None:
+                    value = item[field_name]
+                    if isinstance(value, dict):
+                        slug = value.get("slug")
+                        if slug:
+                            choices.add(slug)
+                    else:
+                        choices.add(value)
+        while response["next"] is not None:
+            async with client.request(
+                "GET", response["next"], headers=headers, params=params
+            ) as r:
+                response = await codec.read_json(r)
                 for item in response["results"]:
                     if field_name in item and item[field_name] is not None:
                         value = item[field_name]
@@ -43,20 +152,6 @@ async def get_field_choices(endpoint, field_name):
                                 choices.add(slug)
                         else:
                             choices.add(value)
-            while response["next"] is not None:
-                async with session.get(
-                    response["next"], headers=headers, params=params
-                ) as r:
-                    response = await r.json()
-                    for item in response["results"]:
-                        if field_name in item and item[field_name] is not None:
-                            value = item[field_name]
-                            if isinstance(value, dict):
-                                slug = value.get("slug")
-                                if slug:
-                                    choices.add(slug)
-                            else:
-                                choices.add(value)
         logger.info(f"netbox.get_field_choices called with endpoint: {endpoint}, field_name: {field_name}, choices: {choices}")
         return list(choices)
     except Exception as e:
@@ -65,16 +160,17 @@ async def get_field_choices(endpoint, field_name):
         return None
 
 
-async def get(endpoint, params={}):
+async def prepare_get(endpoint, params):
+    """Normalize and validate list query params, returning (url, headers, params, validated).
+
+    ``validated`` is False for a query sent unchecked while the schema warms
+    up, its result isn't cached nor shared with concurrent callers.
+    """
     slugfyed_fields = ['site', 'manufacturer', 'cluster_group', 'device_type',
                        'model','tenant',]
-    api_token = os.environ.get("NETBOX_API_TOKEN")
-    api_url = f"{NETBOX_URL}api/"
+    api_url = f"{client.NETBOX_URL}api/"
     url = f"{api_url}{endpoint}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Token {api_token}",
-    }
+    headers = client.headers()
     for field in slugfyed_fields:
         if f"{field}__slug" in params:
             params[field] = params.pop(f"{field}__slug")[0]
@@ -82,42 +178,241 @@ async def get(endpoint, params={}):
         params["limit"] = 1000
     if "fields" in params:
         params["fields"] = ",".join(params["fields"])
-    output = {}
+    schema = await validation.get_schema_index_nowait()
+    if schema is None and not params.keys() <= UNFILTERED_PARAMS:
+        # NetBox ignores unknown filters, a misspelled one would answer with the whole table
+        schema = await validation.get_schema_index()
+    if schema is None:
+        # Degraded path while the schema warms up at startup, only for unfiltered queries
+        if not _endpoint_re.match(endpoint):
+            raise ToolError(f"Path '/api/{endpoint}' is not a NetBox API path")
+        logger.info(f"netbox.prepare_get schema index not ready, sending {endpoint} unvalidated")
+        return url, headers, params, False
+    with metrics.schema_validation.time():
+        try:
+            await validation.validate_path(schema, f"/api/{endpoint}")
+        except ValueError as e:
+            raise ToolError(str(e))        
+        try:
+            await validation.validate_query_params(schema, f"/api/{endpoint}", params)
+        except ValueError as e:
+            raise ToolError(str(e))
+    return url, headers, params, True
+
+
+async def _iter_pages(endpoint, url, headers, params, validators=None):
+    async with client.request("GET", url, headers=headers, params=params) as r:
+        response = await codec.read_json(r)
+        status = r.status
+        if validators is not None:
+            validators.update(client.http_validators(r.headers) or {})
+    # Handled once the response is released, looking up choices is another request
+    if status == 400:
+        errors = []
+        choices_re = re.compile(r'Select a valid choice. .+? is not one of the available choices.')
+        for field in response:
+            for message in response[field]:
+                if choices_re.match(message):
+                    field_choices = await get_field_choices(endpoint, field)
+                    error_message = f"Invalid choice for field '{field}': Available choices are: {field_choices}"
+                    errors.append(error_message)
+        raise ToolError("\n".join(errors))
+    elif status != 200:
+        raise LookupError(response)
+    yield response
+    pagination = page_offsets(response)
+    if pagination is not None:
+        # Keep a window of NETBOX_PAGE_CONCURRENCY pages in flight and hand
+        # them out in offset order, so memory stays bounded by the window
+        limit, offsets = pagination
+        offsets = iter(offsets)
+        pending = deque(
+            asyncio.create_task(fetch_page(url, headers, params, limit, offset))
+            for offset in islice(offsets, NETBOX_PAGE_CONCURRENCY)
+        )
+        try:
+            while pending:
+                response = await pending.popleft()
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(asyncio.create_task(fetch_page(url, headers, params, limit, offset)))
+                yield response
+        finally:
+            for task in pending:
+                task.cancel()
+        return
+    while response["next"] is not None:
+        async with client.request(
+            "GET", response["next"], headers=headers, params=params
+        ) as r:
+            response = await codec.read_json(r)
+            if r.status != 200:
+                raise LookupError(response)
+        yield response
+
+
+async def iter_pages(endpoint, params={}):
+    """Yield the list pages of an endpoint one at a time, in order.
+
+    Only the pages in flight are held in memory, callers that stop early
+    should close the generator (``contextlib.aclosing``) to cancel them.
+    """
+    url, headers, params, _ = await prepare_get(endpoint, params)
     try:
-        await validation.validate_path(await validation.get_schema(), f"/api/{endpoint}")
-    except ValueError as e:
-        raise ToolError(str(e))        
+        async with aclosing(_iter_pages(endpoint, url, headers, params)) as pages:
+            async for page in pages:
+                yield page
+    except Exception as e:
+        logger.error(f"{e}")
+        raise LookupError(f"Failed to get data from NetBox endpoint {endpoint} with reason {e}")
+
+
+async def iter_records(endpoint, params={}):
+    async with aclosing(iter_pages(endpoint, params)) as pages:
+        async for page in pages:
+            for record in page["results"]:
+                yield record
+
+
+async def get(endpoint, params={}):
+    return await get_prepared(endpoint, *await prepare_get(endpoint, params))
+
+
+async def get_prepared(endpoint, url, headers, params, validated=True):
+    """``get`` for a query already normalized by ``prepare_get``."""
+    local = replica.query(cache.normalize_endpoint(endpoint), params)
+    if local is not None:
+        return local
+    if not validated:
+        try:
+            output, _ = await _collect(endpoint, url, headers, params, {})
+            return output
+        except Exception as e:
+            logger.error(f"{e}")
+            raise LookupError(f"Failed to get data from NetBox endpoint {endpoint} with reason {e}")
+    cache_key = cache.make_key(endpoint, params)
+    cached = cache.response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return await single_flight(cache_key, lambda: _get(endpoint, url, headers, params, cache_key))
+
+
+async def get_many(queries):
+    """Run several list queries concurrently, validating all of them before sending any.
+
+    ``queries`` maps a key to ``(endpoint, params)``, the result maps every
+    key to its response or to ``{"error": message}``.
+    """
+    prepared = {}
+    results = {}
+    for key, (endpoint, params) in queries.items():
+        try:
+            prepared[key] = (endpoint, await prepare_get(endpoint, params))
+        except Exception as e:
+            results[key] = {"error": str(e)}
+
+    async def fetch(endpoint, request):
+        try:
+            return await get_prepared(endpoint, *request)
+        except Exception as e:
+            return {"error": str(e)}
+
+    responses = await asyncio.gather(*(fetch(endpoint, request) for endpoint, request in prepared.values()))
+    results.update(zip(prepared, responses))
+    failed = sum(1 for result in results.values() if "error" in result)
+    logger.info(f"netbox.get_many ran {len(prepared)} of {len(queries)} queries, {failed} failed")
+    return {key: results[key] for key in queries}
+
+
+async def probe(url, headers, params):
+    """Return the count and latest ``last_updated`` of a list query, None for models without it."""
+    probe_params = {name: value for name, value in params.items() if name not in ("brief", "offset")}
+    probe_params.update({"ordering": "-last_updated", "fields": "last_updated"})
     try:
-        await validation.validate_query_params(await validation.get_schema(), f"/api/{endpoint}", params)
-    except ValueError as e:
-        raise ToolError(str(e))
+        response = await fetch_page(url, headers, probe_params, 1, 0)
+    except LookupError as e:
+        logger.info(f"netbox.probe {url} failed with reason {e}")
+        return None
+    results = response["results"]
+    if results and not results[0].get("last_updated"):
+        return None
+    return {"count": response["count"], "last_updated": results[0]["last_updated"] if results else None}
+
+
+def results_validators(output):
+    """Probe validators computed from fetched rows, None when a row lacks ``last_updated``."""
+    stamps = [record.get("last_updated") for record in output["results"]]
+    if not all(stamps):
+        return None
+    return {"count": output["count"], "last_updated": max(stamps, default=None)}
+
+
+async def revalidate(url, headers, params, validators):
+    """Check a cached list against NetBox with a single small request.
+
+    ``ETag``/``Last-Modified`` validators are sent back for a 304, otherwise
+    an unchanged count and latest ``last_updated`` mean no object was added,
+    removed or modified since. Returns ``(unchanged, page, validators)``,
+    with the first page NetBox answered a conditional request with and the
+    fresh validators, so a changed list isn't asked for twice.
+    """
+    if "count" in validators:
+        probed = await probe(url, headers, params)
+        return probed == validators, None, probed
+    async with client.request("GET", url, headers=client.conditional_headers(headers, validators), params=params) as r:
+        if r.status == 304:
+            return True, None, None
+        if r.status != 200:
+            return False, None, None
+        return False, await codec.read_json(r), client.http_validators(r.headers)
 
+
+async def _get(endpoint, url, headers, params, cache_key):
+    generation = cache.response_cache.generation
+    label = metrics.endpoint_label(endpoint)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as r:
-                response = await r.json()
-                if r.status == 400:
-                    errors = []
-                    choices_re = re.compile(r'Select a valid choice. .+? is not one of the available choices.')
-                    for field in response:
-                        for message in response[field]:
-                            if choices_re.match(message):
-                                field_choices = await get_field_choices(endpoint, field)
-                                error_message = f"Invalid choice for field '{field}': Available choices are: {field_choices}"
-                                errors.append(error_message)
-                    raise ToolError("\n".join(errors))
-                elif r.status != 200:
-                    raise LookupError(response)
-                response = await r.json()
-                output["count"] = response["count"]
-                output["results"] = []
-                output["results"] = output["results"] + response["results"]
-            while response["next"] is not None:
-                async with session.get(
-                    response["next"], headers=headers, params=params
-                ) as r:
-                    response = await r.json()
-                    output["results"] = output["results"] + response["results"]
+        stale = cache.response_cache.get_stale(cache_key)
+        # Asked for again past its TTL, a hot list is kept in the store across restarts
+        hot = stale is not None
+        if stale is None:
+            stale = await store.load("lists", codec.dumps_text(cache_key))
+        probed = None
+        if stale is not None:
+            cached, validators = stale
+            unchanged, page, fresh = await revalidate(url, headers, params, validators)
+            if unchanged:
+                metrics.cache_revalidations.inc(label, "unchanged")
+                cache.response_cache.set(cache_key, cached, generation=generation, validators=validators)
+                if hot:
+                    await save_hot(cache_key, cached, validators, generation)
+                return cached
+            metrics.cache_revalidations.inc(label, "changed")
+            hot = True
+            if page is not None and page["next"] is None:
+                # NetBox answered the conditional request with the whole list
+                metrics.pages_per_call.observe(1, label)
+                output = {"count": page["count"], "results": page["results"]}
+                cache.response_cache.set(cache_key, output, generation=generation, validators=fresh)
+                await save_hot(cache_key, output, fresh, generation)
+                return output
+            if "count" in validators:
+                probed = fresh
+        validators = None
+        cacheable = cache.response_cache.max_bytes > 0 and cache.response_cache.ttl(cache_key[0]) > 0
+        if cacheable and ("fields" in params or "brief" in params):
+            # Projected rows lack last_updated, probed before the pages so a
+            # change made while they are fetched shows up at the next check
+            validators = probed or await probe(url, headers, params)
+        http_validators = {}
+        output, pages_fetched = await _collect(endpoint, url, headers, params, http_validators)
+        if pages_fetched == 1 and http_validators:
+            # An ETag only covers its own page
+            validators = http_validators
+        elif validators is None:
+            validators = results_validators(output)
+        cache.response_cache.set(cache_key, output, generation=generation, validators=validators)
+        if hot:
+            await save_hot(cache_key, output, validators, generation)
         return output
     except Exception as e:
         logger.error(f"{e}")
@@ -125,22 +420,108 @@ async def get(endpoint, params={}):
         return None
 
 
-async def graphql_get(query):
-    api_token = os.environ.get("NETBOX_API_TOKEN")
-    url = f"{NETBOX_URL}graphql/"
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Token {api_token}",
-        "Content-Type": "application/json",
+async def _collect(endpoint, url, headers, params, http_validators):
+    """Fetch every page of a list query, returning the merged result and the number of pages."""
+    output = {}
+    pages_fetched = 0
+    async with aclosing(_iter_pages(endpoint, url, headers, params, http_validators)) as pages:
+        async for response in pages:
+            pages_fetched += 1
+            if not output:
+                output["count"] = response["count"]
+                output["results"] = []
+            output["results"].extend(response["results"])
+    metrics.pages_per_call.observe(pages_fetched, metrics.endpoint_label(endpoint))
+    return output, pages_fetched
+
+
+async def save_hot(cache_key, output, validators, generation):
+    """Write a revalidatable list result through to the store, unless a write invalidated it meanwhile."""
+    if store.store is not None and validators is not None and generation == cache.response_cache.generation:
+        await store.save("lists", codec.dumps_text(cache_key), [output, validators])
+
+
+async def count(endpoint, params={}):
+    """Return how many objects a list query matches, reading a single one row page."""
+    url, headers, params, validated = await prepare_get(endpoint, {**params, "limit": 1, "brief": 1})
+    local = replica.query(cache.normalize_endpoint(endpoint), params)
+    if local is not None:
+        return local["count"]
+    if not validated:
+        return (await _count(endpoint, url, headers, params, None))["count"]
+    # Apart from the results of a get with the same params, which span every page
+    cache_key = cache.make_key(endpoint, params) + ("count",)
+    cached = cache.response_cache.get(cache_key)
+    if cached is None:
+        cached = await single_flight(cache_key, lambda: _count(endpoint, url, headers, params, cache_key))
+    return cached["count"]
+
+
+async def _count(endpoint, url, headers, params, cache_key):
+    generation = cache.response_cache.generation
+    try:
+        response = await fetch_page(url, headers, params, 1, 0)
+    except Exception as e:
+        logger.error(f"{e}")
+        raise LookupError(f"Failed to count objects of NetBox endpoint {endpoint} with reason {e}")
+    output = {"count": response["count"]}
+    if cache_key is not None:
+        cache.response_cache.set(cache_key, output, generation=generation)
+    return output
+
+
+async def aggregate(endpoint, group_by, params={}):
+    """Count the objects of a list query per value of one field.
+
+    Pages are fetched with only ``group_by`` selected and folded into the
+    counts as they arrive, nested objects count by slug, choice value or id
+    and every item of a list field counts once.
+    """
+    groups = Counter()
+    total = 0
+    missing = 0
+    async with aclosing(iter_pages(endpoint, {**params, "fields": [group_by]})) as pages:
+        async for page in pages:
+            total = page["count"]
+            for record in page["results"]:
+                if group_by not in record:
+                    missing += 1
+                    continue
+                value = compact_value(record[group_by])
+                for item in value if isinstance(value, list) else [value]:
+                    groups[codec.dumps_text(item) if isinstance(item, dict) else item] += 1
+    if total and missing == total:
+        raise ToolError(f"Field '{group_by}' is not returned by endpoint {endpoint}")
+    logger.info(f"netbox.aggregate counted {total} objects of {endpoint} in {len(groups)} groups of {group_by}")
+    return {
+        "count": total,
+        "group_by": group_by,
+        "groups": [{"value": value, "count": matched} for value, matched in groups.most_common()],
     }
+
+
+async def graphql_get(query, cached=True):
+    url = f"{client.NETBOX_URL}graphql/"
+    headers = {**client.headers(), "Content-Type": "application/json"}
     payload = {"query": query}
+    cache_key = cache.graphql_key(query)
+    if cached:
+        response = cache.response_cache.get(cache_key)
+        if response is not None:
+            return response
+    return await single_flight(cache_key, lambda: _graphql_get(url, headers, payload, cache_key, cached))
+
+
+async def _graphql_get(url, headers, payload, cache_key, cached=True):
+    generation = cache.response_cache.generation
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as r:
-                response = await r.json()
-                if r.status != 200:
-                    raise LookupError(response)
-                return response
+        async with client.request("POST", url, headers=headers, json=payload) as r:
+            response = await codec.read_json(r)
+            if r.status != 200:
+                raise LookupError(response)
+            if cached and not response.get("errors"):
+                cache.response_cache.set(cache_key, response, generation=generation)
+            return response
     except Exception as e:
         logger.error(f"{e}")
         raise LookupError(f"Failed to get data from NetBox graphql with reason {e}")
@@ -148,69 +529,121 @@ async def graphql_get(query):
 
 
 async def patch(endpoint, payload={}):
-    api_token = os.environ.get("NETBOX_API_TOKEN")
-    api_url = f"{NETBOX_URL}api/"
+    api_url = f"{client.NETBOX_URL}api/"
     url = f"{api_url}{endpoint}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Token {api_token}",
-    }
+    headers = client.headers()
     output = {}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(url, headers=headers, json=payload) as r:
-                response = await r.json()
-                if r.status != 200:
-                    raise RuntimeError(
-                        f"Failed to update Device with endpoint {endpoint} with reason {response}"
-                    )
+        async with client.request("PATCH", url, headers=headers, json=payload) as r:
+            response = await codec.read_json(r)
+            if r.status != 200:
+                raise RuntimeError(
+                    f"Failed to update Device with endpoint {endpoint} with reason {response}"
+                )
     except Exception as e:
         logger.error(f"{e.args}")
+    finally:
+        cache.response_cache.invalidate(endpoint)
+        replica.invalidate(endpoint)
 
 
 async def post(endpoint, payload={}):
-    api_token = os.environ.get("NETBOX_API_TOKEN")
-    api_url = f"{NETBOX_URL}api/"
+    api_url = f"{client.NETBOX_URL}api/"
     url = f"{api_url}{endpoint}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Token {api_token}",
-    }
+    headers = client.headers()
     output = {}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as r:
-                response = await r.json()
-                if r.status != 201:
-                    raise RuntimeError(
-                        f"Failed to create with endpoint {endpoint} and payload {payload} with reason {response}"
-                    )
+        async with client.request("POST", url, headers=headers, json=payload) as r:
+            response = await codec.read_json(r)
+            if r.status != 201:
+                raise RuntimeError(
+                    f"Failed to create with endpoint {endpoint} and payload {payload} with reason {response}"
+                )
         return response
     except Exception as e:
         logger.error(f"{e.args}")
+    finally:
+        cache.response_cache.invalidate(endpoint)
+        replica.invalidate(endpoint)
 
 async def delete(endpoint, model_id):
-    api_token = os.environ.get("NETBOX_API_TOKEN")
-    api_url = f"{NETBOX_URL}api/"
+    api_url = f"{client.NETBOX_URL}api/"
     url = f"{api_url}{endpoint}{model_id}/"
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Token {api_token}",
-    }        
+    headers = client.headers()
     try:
         if model_id is None:
             raise Exception("model_id is None")
         if not isinstance(model_id, int):
             raise Exception("model_id is not an integer")
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, headers=headers) as r:
-                if r.status != 204:
-                    response = await r.json()
-                    raise RuntimeError(
-                        f"Failed to delete with endpoint {endpoint} and id {model_id} with reason {response}"
-                    )
+        async with client.request("DELETE", url, headers=headers) as r:
+            if r.status != 204:
+                response = await codec.read_json(r)
+                raise RuntimeError(
+                    f"Failed to delete with endpoint {endpoint} and id {model_id} with reason {response}"
+                )
     except Exception as e:
         logger.error(f"{e.args}")
+    finally:
+        cache.response_cache.invalidate(endpoint)
+        replica.invalidate(endpoint)
+
+
+async def bulk(method, endpoint, items):
+    """Create, update or delete many objects through NetBox's list-body bulk API.
+
+    ``items`` are sent to the list endpoint in chunks of NETBOX_BULK_CHUNK_SIZE,
+    up to NETBOX_BULK_CONCURRENCY chunks at a time. NetBox applies a chunk in a
+    single transaction, so one invalid item fails its whole chunk. Returns a
+    report with one entry per item, in input order.
+    """
+    method = method.upper()
+    api_url = f"{client.NETBOX_URL}api/"
+    url = f"{api_url}{endpoint}"
+    headers = client.headers()
+    schema = await validation.get_schema_index()
+    try:
+        await validation.validate_path(schema, f"/api/{endpoint}")
+        await validation.validate_method(schema, f"/api/{endpoint}", method)
+    except ValueError as e:
+        raise ToolError(str(e))
+    semaphore = asyncio.Semaphore(NETBOX_BULK_CONCURRENCY)
+    report = [None] * len(items)
+
+    async def send(start, chunk):
+        async with semaphore:
+            try:
+                async with client.request(method, url, headers=headers, json=chunk) as r:
+                    response = await codec.read_json(r) if r.status != 204 else None
+                    succeeded = r.status == BULK_EXPECTED_STATUS[method]
+            except Exception as e:
+                logger.error(f"{e}")
+                succeeded, response = False, str(e)
+        for offset, item in enumerate(chunk):
+            entry = {"index": start + offset, "success": succeeded}
+            if succeeded:
+                if isinstance(response, list) and offset < len(response):
+                    entry["id"] = response[offset].get("id")
+                elif isinstance(item, dict) and "id" in item:
+                    entry["id"] = item["id"]
+            elif isinstance(response, list) and offset < len(response):
+                # NetBox returns one error dict per item, empty for the valid ones
+                entry["error"] = response[offset] or "Not applied, another object in the same chunk failed"
+            else:
+                entry["error"] = response
+            report[start + offset] = entry
+
+    try:
+        await asyncio.gather(*(
+            send(start, items[start:start + NETBOX_BULK_CHUNK_SIZE])
+            for start in range(0, len(items), NETBOX_BULK_CHUNK_SIZE)
+        ))
+    finally:
+        cache.response_cache.invalidate(endpoint)
+        replica.invalidate(endpoint)
+    succeeded = sum(1 for entry in report if entry["success"])
+    logger.info(f"netbox.bulk {method} {endpoint} applied {succeeded} of {len(items)} objects")
+    return {"total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded, "results": report}
+
 
 NETBOX_OBJECT_TYPES = {
     "circuits.circuit": {
@@ -844,3 +1277,50 @@ NETBOX_OBJECT_TYPES = {
         "fields": ["url", "interface_a", "interface_b", "ssid", "status", "tenant", "auth_type", "auth_cipher", "auth_psk", "description"]
     },
 }
+
+OBJECT_TYPE_FIELDS = {
+    f"{object_type['endpoint']}/": object_type["fields"]
+    for object_type in NETBOX_OBJECT_TYPES.values()
+}
+
+
+def compact_fields(endpoint):
+    """Return the curated fields of an endpoint for compact mode, ``id`` replacing ``url``."""
+    fields = OBJECT_TYPE_FIELDS.get(cache.normalize_endpoint(endpoint))
+    if fields is None:
+        return None
+    return ["id"] + [field for field in fields if field not in ("id", "url")]
+
+
+def compact_value(value):
+    if isinstance(value, dict):
+        for key in ("slug", "value", "id"):
+            if key in value:
+                return value[key]
+        return value
+    if isinstance(value, list):
+        return [compact_value(item) for item in value]
+    return value
+
+
+def compact_results(results):
+    """Flatten nested objects to their slug, choice value or id.
+
+    Returns the compacted rows and an estimate of the JSON bytes saved.
+    """
+    compacted = []
+    saved = 0
+    for record in results:
+        row = {}
+        for key, value in record.items():
+            if key in ("url", "display"):
+                saved += cache.estimate_size(value) + len(key) + 4
+                continue
+            if isinstance(value, (dict, list)) and value:
+                flattened = compact_value(value)
+                if flattened is not value:
+                    saved += cache.estimate_size(value) - cache.estimate_size(flattened)
+                value = flattened
+            row[key] = value
+        compacted.append(row)
+    return compacted, saved
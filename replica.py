@@ -0,0 +1,341 @@
+import os
+import time
+import asyncio
+import logging
+import cache
+import client
+import codec
+import metrics
+
+from cache import normalize_endpoint
+
+
+logger = logging.getLogger(__name__)
+
+# Comma separated list endpoints kept locally, e.g. "dcim/devices/,dcim/sites/", empty disables the replica
+NETBOX_REPLICA_ENDPOINTS = [
+    normalize_endpoint(endpoint) for endpoint in (os.environ.get("NETBOX_REPLICA_ENDPOINTS") or "").split(",") if endpoint.strip()
+]
+NETBOX_REPLICA_INTERVAL = float(os.environ.get("NETBOX_REPLICA_INTERVAL") or 30)
+# A replica not synced for this long is bypassed until it catches up
+NETBOX_REPLICA_MAX_LAG = float(os.environ.get("NETBOX_REPLICA_MAX_LAG") or 3 * NETBOX_REPLICA_INTERVAL)
+# Without a changelog deletions are only noticed by reseeding, with one the
+# nested copies of related objects embedded in records are
+NETBOX_REPLICA_RESEED_INTERVAL = float(os.environ.get("NETBOX_REPLICA_RESEED_INTERVAL") or 3600)
+
+CHANGELOG_ENDPOINTS = ("core/object-changes/", "extras/object-changes/")
+# Scalar fields whose NetBox filter is an exact match on the serialized value
+SCALAR_FIELDS = frozenset(["name", "slug", "serial", "asset_tag", "cid", "vid", "label"])
+LOOKUPS = {
+    "n": lambda value, wanted: value not in wanted,
+    "ie": lambda value, wanted: value.lower() in {item.lower() for item in wanted},
+    "nie": lambda value, wanted: value.lower() not in {item.lower() for item in wanted},
+    "ic": lambda value, wanted: any(item.lower() in value.lower() for item in wanted),
+    "nic": lambda value, wanted: not any(item.lower() in value.lower() for item in wanted),
+    "isw": lambda value, wanted: any(value.lower().startswith(item.lower()) for item in wanted),
+    "iew": lambda value, wanted: any(value.lower().endswith(item.lower()) for item in wanted),
+}
+# Excluding filters, a null field is not one of the excluded values and NetBox keeps its record
+NEGATED_LOOKUPS = frozenset(["n", "nie", "nic"])
+REFRESH_CHUNK = 100
+
+_UNSUPPORTED = object()
+_wake = None
+
+
+def _filter_value(record, name):
+    """Return what NetBox's ``name`` filter compares for a record, as a string.
+
+    Foreign keys and choices are addressed by slug or value, ``<fk>_id`` by
+    id. Anything else is ``_UNSUPPORTED`` and the query goes to NetBox.
+    """
+    if name == "id":
+        return str(record["id"])
+    if name.endswith("_id") and name[:-3] in record:
+        value = record[name[:-3]]
+        return None if value is None else str(value["id"]) if isinstance(value, dict) else _UNSUPPORTED
+    if name not in record:
+        return _UNSUPPORTED
+    value = record[name]
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        for key in ("slug", "value"):
+            if key in value:
+                value = value[key]
+                return str(value).lower() if isinstance(value, bool) else str(value)
+        return _UNSUPPORTED
+    if name in SCALAR_FIELDS and not isinstance(value, (list, dict)):
+        return str(value)
+    return _UNSUPPORTED
+
+
+class Replica:
+    """Local copy of one list endpoint with per filter field indexes.
+
+    Indexes map a filter value to the ids of the records having it, they are
+    built on first use and dropped whenever records change.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.records = {}
+        self.indexes = {}
+        self.synced = None
+        self.seeded = None
+        self.watermark = None
+        # Writes through this server since the last sync, bypassing the replica until applied
+        self.writes = 0
+        self.synced_writes = None
+
+    def write_stamp(self):
+        """This process's writes to the endpoint and the cache invalidation generation,
+        shared through the cache file, which another worker's write of any endpoint bumps."""
+        return self.writes, cache.response_cache.generation
+
+    def fresh(self):
+        return (
+            self.synced is not None
+            and self.write_stamp() == self.synced_writes
+            and time.monotonic() - self.synced < NETBOX_REPLICA_MAX_LAG
+        )
+
+    def load(self, records):
+        self.records = {record["id"]: record for record in records}
+        self.indexes = {}
+
+    def upsert(self, record):
+        self.records[record["id"]] = record
+        self.indexes = {}
+
+    def remove(self, record_id):
+        if self.records.pop(record_id, None) is not None:
+            self.indexes = {}
+
+    def index(self, name):
+        """Return ``{value: ids}`` for a filter field, None when it can't be answered locally."""
+        index = self.indexes.get(name)
+        if index is None:
+            index = {}
+            for record_id, record in self.records.items():
+                value = _filter_value(record, name)
+                if value is _UNSUPPORTED:
+                    index = _UNSUPPORTED
+                    break
+                if value is not None:
+                    index.setdefault(value, set()).add(record_id)
+            self.indexes[name] = index
+        return None if index is _UNSUPPORTED else index
+
+    def query(self, params):
+        """Answer a ``netbox.get`` locally, or return None for anything NetBox must evaluate."""
+        exact = []
+        lookups = []
+        fields = None
+        for name, values in params.items():
+            if name == "limit":
+                continue
+            if name == "fields":
+                fields = values.split(",") if isinstance(values, str) else list(values)
+                continue
+            values = [str(value) for value in values] if isinstance(values, (list, tuple)) else [str(values)]
+            base, separator, lookup = name.partition("__")
+            if not separator:
+                exact.append((name, values))
+            elif lookup in LOOKUPS:
+                lookups.append((base, LOOKUPS[lookup], values, lookup in NEGATED_LOOKUPS))
+            else:
+                return None
+        ids = None
+        for name, values in exact:
+            index = self.index(name)
+            if index is None:
+                return None
+            if name != "id" and name not in SCALAR_FIELDS and not all(value in index for value in values):
+                # NetBox rejects unknown slugs, choices and related ids with the list of valid ones
+                return None
+            matched = set().union(*(index.get(value, ()) for value in values))
+            ids = matched if ids is None else ids & matched
+        for base, _, _, _ in lookups:
+            if self.index(base) is None:
+                return None
+        records = self.records if ids is None else ids
+        results = []
+        for record_id in sorted(records):
+            record = self.records[record_id]
+            if all(
+                negated if (value := _filter_value(record, base)) is None else match(value, wanted)
+                for base, match, wanted, negated in lookups
+            ):
+                results.append(record if fields is None else {field: record[field] for field in fields if field in record})
+        return {"count": len(results), "results": results}
+
+
+replicas = {endpoint: Replica(endpoint) for endpoint in NETBOX_REPLICA_ENDPOINTS}
+
+
+def query(endpoint, params):
+    """Return the local answer to ``netbox.get(endpoint, params)``, None to ask NetBox."""
+    replica = replicas.get(endpoint)
+    if replica is None:
+        return None
+    result = replica.query(params) if replica.fresh() else None
+    metrics.replica_queries.inc(metrics.endpoint_label(endpoint), "local" if result is not None else "remote")
+    return result
+
+
+def invalidate(endpoint):
+    """Bypass the replicas of an endpoint written through this server until the next sync."""
+    endpoint = normalize_endpoint(endpoint)
+    for replica_endpoint, replica in replicas.items():
+        if endpoint.startswith(replica_endpoint):
+            replica.writes += 1
+            if _wake is not None:
+                _wake.set()
+
+
+async def fetch_all(endpoint, params):
+    url = f"{client.NETBOX_URL}api/{endpoint}"
+    results = []
+    while url is not None:
+        async with client.request("GET", url, headers=client.headers(), params=params) as r:
+            response = await codec.read_json(r)
+            status = r.status
+        if status != 200:
+            raise LookupError(response)
+        results.extend(response["results"])
+        # The next link carries the query already
+        url, params = response["next"], None
+    return results
+
+
+async def _changelog_head():
+    """Return the changelog endpoint and its latest change id, or None without a readable changelog."""
+    for endpoint in CHANGELOG_ENDPOINTS:
+        try:
+            async with client.request("GET", f"{client.NETBOX_URL}api/{endpoint}", headers=client.headers(),
+                                      params={"ordering": "-id", "limit": 1, "brief": 1}) as r:
+                response = await codec.read_json(r)
+                status = r.status
+        except Exception as e:
+            logger.error(f"replica changelog {endpoint} failed with reason {e}")
+            continue
+        if status == 200:
+            results = response["results"]
+            return endpoint, results[0]["id"] if results else 0
+    return None
+
+
+async def seed(replica):
+    replica.load(await fetch_all(replica.endpoint, {"limit": 1000}))
+    replica.watermark = max((record.get("last_updated") or "" for record in replica.records.values()), default="")
+    replica.seeded = time.monotonic()
+    logger.info(f"replica.seed {replica.endpoint} loaded {len(replica.records)} records")
+
+
+async def refresh_ids(replica, ids):
+    """Re-read changed objects, those NetBox no longer returns were deleted."""
+    ids = sorted(ids)
+    for start in range(0, len(ids), REFRESH_CHUNK):
+        chunk = ids[start:start + REFRESH_CHUNK]
+        found = await fetch_all(replica.endpoint, {"id": [str(record_id) for record_id in chunk], "limit": REFRESH_CHUNK})
+        for record in found:
+            replica.upsert(record)
+        for record_id in set(chunk) - {record["id"] for record in found}:
+            replica.remove(record_id)
+
+
+async def sync_changelog(changelog, last_change, endpoints_by_type):
+    changes = await fetch_all(changelog, {"id__gt": last_change, "ordering": "id", "limit": 1000})
+    touched = {}
+    for change in changes:
+        last_change = max(last_change, change["id"])
+        object_type = change.get("changed_object_type")
+        if isinstance(object_type, dict):
+            object_type = f"{object_type.get('app_label')}.{object_type.get('model')}"
+        endpoint = endpoints_by_type.get(object_type)
+        if endpoint is not None:
+            touched.setdefault(endpoint, set()).add(change["changed_object_id"])
+    for endpoint, ids in touched.items():
+        await refresh_ids(replicas[endpoint], ids)
+    return last_change
+
+
+async def reseed_expired():
+    """Reseed the replicas read in full more than ``NETBOX_REPLICA_RESEED_INTERVAL`` ago.
+
+    The changelog only names the objects that changed, a renamed site stays
+    stale inside every device embedding it until the devices are read again.
+    """
+    for replica in replicas.values():
+        if time.monotonic() - replica.seeded > NETBOX_REPLICA_RESEED_INTERVAL:
+            await seed(replica)
+
+
+async def sync_last_updated(replica):
+    """Fallback without a changelog, upserts by ``last_updated`` and a periodic reseed for deletions."""
+    if time.monotonic() - replica.seeded > NETBOX_REPLICA_RESEED_INTERVAL or replica.write_stamp() != replica.synced_writes:
+        await seed(replica)
+        return
+    params = {"limit": 1000}
+    if replica.watermark:
+        params["last_updated__gte"] = replica.watermark
+    for record in await fetch_all(replica.endpoint, params):
+        replica.upsert(record)
+        replica.watermark = max(replica.watermark, record.get("last_updated") or "")
+
+
+async def sync_forever(object_types):
+    """Seed the configured replicas and keep them current, run for the server lifetime."""
+    global _wake
+    if not replicas:
+        return
+    _wake = asyncio.Event()
+    endpoints_by_type = {
+        object_type: normalize_endpoint(details["endpoint"])
+        for object_type, details in object_types.items()
+        if normalize_endpoint(details["endpoint"]) in replicas
+    }
+    changelog = None
+    while True:
+        writes = {endpoint: replica.write_stamp() for endpoint, replica in replicas.items()}
+        try:
+            if changelog is None:
+                # Changes made while seeding are replayed from the head taken before it
+                changelog = await _changelog_head() or (None, None)
+                for replica in replicas.values():
+                    await seed(replica)
+            elif changelog[0] is not None:
+                changelog = (changelog[0], await sync_changelog(*changelog, endpoints_by_type))
+                # Changes made while reseeding are replayed at the next sync
+                await reseed_expired()
+            else:
+                for replica in replicas.values():
+                    await sync_last_updated(replica)
+            now = time.monotonic()
+            for endpoint, replica in replicas.items():
+                replica.synced = now
+                replica.synced_writes = writes[endpoint]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"replica.sync_forever failed with reason {e}")
+            if changelog is not None and any(replica.seeded is None for replica in replicas.values()):
+                changelog = None
+        _wake.clear()
+        try:
+            await asyncio.wait_for(_wake.wait(), NETBOX_REPLICA_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def collect_metrics():
+    now = time.monotonic()
+    for endpoint, replica in replicas.items():
+        label = metrics.endpoint_label(endpoint)
+        metrics.replica_records.set(len(replica.records), label)
+        if replica.synced is not None:
+            metrics.replica_lag.set(now - replica.synced, label)
+
+
+metrics.register_collector(collect_metrics)
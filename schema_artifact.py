@@ -0,0 +1,260 @@
+"""Compact binary form of ``validation.SchemaIndex`` read through ``mmap``.
+
+Layout, little-endian, every offset from the start of the file::
+
+    header   magic, version, source mtime, string count, string table,
+             string blob, path count, path table, id array offsets
+    strings  (offset, length) per string into the blob, sorted by value so a
+             string's id is its rank and lookups are a binary search
+    paths    (path id, methods bitmask, first param, param count, extra
+             offset, extra length) per path, sorted by path id
+    ids      the sorted string ids of every path's GET query parameters
+    extra    per path JSON of its choices and related paths, decoded only
+             when an invalid choice is reported
+
+Validating a path or a parameter reads a handful of pages of the mapping,
+nothing is parsed at load time and every process mapping the file shares
+its pages::
+
+    python -m schema_artifact schema.json schema.idx
+"""
+import os
+import sys
+import mmap
+import codec
+import struct
+
+from bisect import bisect_left
+from functools import cached_property
+
+
+MAGIC = b"NBSI"
+VERSION = 1
+HEADER = struct.Struct("<4sIqIIIIII")
+STRING = struct.Struct("<II")
+PATH = struct.Struct("<IIIIII")
+METHODS = ("get", "put", "post", "patch", "delete", "head", "options")
+
+
+def compile_index(index, mtime=None):
+    """Return the artifact bytes of a ``validation.SchemaIndex``."""
+    strings = set(index.paths)
+    for path_index in index.paths.values():
+        strings.update(path_index.params)
+    strings = sorted(strings, key=str.encode)
+    ids = {string: i for i, string in enumerate(strings)}
+    encoded = [string.encode() for string in strings]
+
+    string_table = bytearray()
+    blob = bytearray()
+    for value in encoded:
+        string_table += STRING.pack(len(blob), len(value))
+        blob += value
+
+    path_table = bytearray()
+    id_array = []
+    extra = bytearray()
+    for path in sorted(index.paths, key=ids.get):
+        path_index = index.paths[path]
+        methods = sum(1 << i for i, method in enumerate(METHODS) if method in path_index.methods)
+        params = sorted(ids[param] for param in path_index.params)
+        details = codec.dumps({"choices": path_index.choices, "related": path_index.related})
+        path_table += PATH.pack(ids[path], methods, len(id_array), len(params), len(extra), len(details))
+        id_array.extend(params)
+        extra += details
+
+    string_table_offset = HEADER.size
+    blob_offset = string_table_offset + len(string_table)
+    path_table_offset = blob_offset + len(blob)
+    id_array_offset = path_table_offset + len(path_table)
+    extra_offset = id_array_offset + 4 * len(id_array)
+    header = HEADER.pack(
+        MAGIC, VERSION, mtime if mtime is not None else -1, len(strings), string_table_offset,
+        blob_offset, len(index.paths), path_table_offset, id_array_offset,
+    )
+    # The extra section offset follows the id array, stored as a trailing field
+    return b"".join([
+        header, string_table, blob, path_table,
+        struct.pack(f"<{len(id_array)}I", *id_array), extra, struct.pack("<I", extra_offset),
+    ])
+
+
+def write(index, path, mtime=None):
+    """Write the artifact next to its final name and swap it in atomically."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(compile_index(index, mtime))
+    os.replace(tmp, path)
+
+
+class _Strings:
+    """Sequence view of the sorted string table, for ``bisect``."""
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+
+    def __len__(self):
+        return self.artifact.string_count
+
+    def __getitem__(self, i):
+        return self.artifact.string_bytes(i)
+
+
+class _Names:
+    """Set-like view of a path's parameter names, membership by binary search."""
+
+    def __init__(self, artifact, ids):
+        self.artifact = artifact
+        self.ids = ids
+
+    def __contains__(self, name):
+        string_id = self.artifact.string_id(name)
+        if string_id is None:
+            return False
+        i = bisect_left(self.ids, string_id)
+        return i < len(self.ids) and self.ids[i] == string_id
+
+    def __iter__(self):
+        return (self.artifact.string(string_id) for string_id in self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return set(self) == set(other)
+
+
+class MappedPathIndex:
+    """Duck-typed ``validation.PathIndex`` over one path record of the artifact."""
+
+    def __init__(self, artifact, methods, ids, extra):
+        self.artifact = artifact
+        self.methods = frozenset(method for i, method in enumerate(METHODS) if methods & (1 << i))
+        self.params = _Names(artifact, ids)
+        self._extra = extra
+
+    @cached_property
+    def lookups(self):
+        lookups = {}
+        for name in self.params:
+            base, separator, suffix = name.partition("__")
+            if separator:
+                lookups.setdefault(base, set()).add(suffix)
+        return {base: frozenset(suffixes) for base, suffixes in lookups.items()}
+
+    @cached_property
+    def _details(self):
+        return codec.loads(bytes(self._extra))
+
+    @property
+    def choices(self):
+        return {field: tuple(values) for field, values in self._details["choices"].items()}
+
+    @property
+    def related(self):
+        return self._details["related"]
+
+
+class _Paths:
+    """Read-only mapping of API path to ``MappedPathIndex``.
+
+    Path records are decoded once per process, only for the paths asked for.
+    """
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self._decoded = {}
+
+    def get(self, path, default=None):
+        path_index = self._decoded.get(path)
+        if path_index is None:
+            record = self.artifact.path_record(path)
+            if record is None:
+                return default
+            path_index = self._decoded[path] = MappedPathIndex(self.artifact, *record)
+        return path_index
+
+    def __getitem__(self, path):
+        path_index = self.get(path)
+        if path_index is None:
+            raise KeyError(path)
+        return path_index
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def __iter__(self):
+        return (self.artifact.string(self.artifact.path_ids[i]) for i in range(self.artifact.path_count))
+
+    def __len__(self):
+        return self.artifact.path_count
+
+    def keys(self):
+        return iter(self)
+
+
+class MappedSchemaIndex:
+    """``validation.SchemaIndex`` served from a memory-mapped artifact file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < HEADER.size + 4:
+            raise ValueError(f"{path} is truncated")
+        self.view = memoryview(self.buffer)
+        (magic, version, mtime, self.string_count, self.string_table_offset, self.blob_offset,
+         self.path_count, self.path_table_offset, self.id_array_offset) = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} schema artifact")
+        self.mtime = mtime if mtime >= 0 else None
+        self.extra_offset = struct.unpack_from("<I", self.buffer, len(self.buffer) - 4)[0]
+        self.strings = _Strings(self)
+        self.ids = self.view[self.id_array_offset:self.extra_offset].cast("I")
+        self.path_ids = self.view[self.path_table_offset:self.id_array_offset].cast("I")[::PATH.size // 4]
+        self.paths = _Paths(self)
+        self._string_ids = {}
+
+    def string_bytes(self, i):
+        offset, length = STRING.unpack_from(self.buffer, self.string_table_offset + i * STRING.size)
+        start = self.blob_offset + offset
+        return self.buffer[start:start + length]
+
+    def string(self, i):
+        return self.string_bytes(i).decode()
+
+    def string_id(self, value):
+        try:
+            return self._string_ids[value]
+        except KeyError:
+            pass
+        encoded = value.encode()
+        i = bisect_left(self.strings, encoded)
+        string_id = i if i < self.string_count and self.string_bytes(i) == encoded else None
+        if len(self._string_ids) < 65536:
+            self._string_ids[value] = string_id
+        return string_id
+
+    def path_record(self, path):
+        string_id = self.string_id(path)
+        if string_id is None:
+            return None
+        i = bisect_left(self.path_ids, string_id)
+        if i >= self.path_count or self.path_ids[i] != string_id:
+            return None
+        _, methods, first, count, extra, extra_length = PATH.unpack_from(self.buffer, self.path_table_offset + i * PATH.size)
+        start = self.extra_offset + extra
+        return methods, self.ids[first:first + count], self.view[start:start + extra_length]
+
+
+def main():
+    import validation
+
+    source, target = sys.argv[1:3]
+    with open(source, "rb") as f:
+        index = validation.SchemaIndex(codec.loads(f.read()))
+    write(index, target, os.stat(source).st_mtime_ns)
+    print(f"{target}: {len(index.paths)} paths, {os.path.getsize(target)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,100 @@
-from fastmcp import FastMCP
+import time
+_import_started = time.perf_counter()
+
+from fastmcp import Context, FastMCP
+from fastmcp.exceptions import ToolError
+from fastmcp.server.middleware import Middleware
+import cache
+import client
+import codec
+import metrics
 import netbox
+import replica
+import store
+import graphql_cost
+import graphql_schema
 import validation
-import json
+import workers
+import os
+import asyncio
 import logging
+from contextlib import aclosing, asynccontextmanager
 from typing import Annotated
 
-from pydantic import Field
+from pydantic import BaseModel, Field
+from starlette.responses import PlainTextResponse
 from urllib.parse import parse_qs
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# background: serve at once and load the schemas behind it, requests arriving
+# first are validated in a degraded mode; eager: load them before serving;
+# lazy: load them on first use
+NETBOX_STARTUP_MODE = (os.environ.get("NETBOX_STARTUP_MODE") or "background").lower()
+NETBOX_BATCH_MAX_REQUESTS = int(os.environ.get("NETBOX_BATCH_MAX_REQUESTS") or 50)
+# /metrics shares the MCP port, off: not served; local: loopback clients only;
+# public: any client, e.g. a Prometheus in another container
+NETBOX_METRICS = (os.environ.get("NETBOX_METRICS") or "local").lower()
+LOCAL_HOSTS = frozenset(["127.0.0.1", "::1", "localhost"])
+
+
+async def timed_warm_up(phase, task):
+    started = time.perf_counter()
+    try:
+        await task
+    except Exception as e:
+        logger.error(f"warm_up {phase} failed with reason {e}, retrying on first use")
+        return
+    elapsed = time.perf_counter() - started
+    metrics.startup_seconds.set(elapsed, phase)
+    logger.info(f"warm_up {phase} ready in {elapsed:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(server):
+    # One pooled NetBox session shared by every tool call for the server lifetime
+    await client.start()
+    graphql_refresh = asyncio.create_task(graphql_schema.refresh_forever())
+    schema_refresh = asyncio.create_task(validation.refresh_forever())
+    replica_sync = asyncio.create_task(replica.sync_forever(netbox.NETBOX_OBJECT_TYPES))
+    warm_up = None
+    if NETBOX_STARTUP_MODE != "lazy":
+        warm_up = asyncio.gather(
+            timed_warm_up("schema_index", validation.start_warm_up()),
+            timed_warm_up("graphql_schema", graphql_schema.start_warm_up()),
+        )
+        if NETBOX_STARTUP_MODE == "eager":
+            await warm_up
+    metrics.startup_seconds.set(time.perf_counter() - _import_started, "ready")
+    logger.info(f"server ready in {time.perf_counter() - _import_started:.2f}s after import, startup mode {NETBOX_STARTUP_MODE}")
+    try:
+        yield
+    finally:
+        graphql_refresh.cancel()
+        schema_refresh.cancel()
+        replica_sync.cancel()
+        if warm_up is not None:
+            warm_up.cancel()
+        await client.close()
+
+
+class MetricsMiddleware(Middleware):
+    async def on_call_tool(self, context, call_next):
+        tool = context.message.name
+        metrics.tool_in_flight.inc(tool)
+        outcome = "error"
+        try:
+            with metrics.tool_duration.time(tool):
+                result = await call_next(context)
+            outcome = "success"
+            return result
+        finally:
+            metrics.tool_in_flight.dec(tool)
+            metrics.tool_requests.inc(tool, outcome)
+
+
 # Create an MCP server
 mcp = FastMCP(
     "NetBox",
@@ -20,50 +103,72 @@ mcp = FastMCP(
     Resources:
     - `netbox://object-types`: Returns a JSON mapping of all available NetBox object types, their API endpoints, and important fields. Read this first to understand what data is available.
     - `netbox://graphql-schema`: Returns the GraphQL schema for the NetBox instance. Use this to understand the available types and fields for GraphQL queries.
+    - `netbox://cache-stats`: Returns hit/miss counters and size of the NetBox response cache.
 
     Tools:
     - `get_resource`: Fetches data from a specific NetBox endpoint. 
       - `endpoint`: The API path (e.g., 'dcim/devices'). Use the endpoints found in `netbox://object-types`.
       - `params`: A dictionary of query parameters for filtering (e.g., {'role': 'router', 'site': 'nyc'}).
+      - `max_rows` / `max_bytes`: Optional budgets, results are streamed page by page and cut off once reached (`truncated` is set).
+      - `count_only` / `group_by`: Return only the number of matching objects, overall or per value of one field.
+      - `compact`: Return only the important fields listed in `netbox://object-types` with nested objects flattened to slug/id.
+    - `count_resources`: Counts the objects matching a query with a single request, or per value of a `group_by` field without returning the objects.
+    - `get_resources_batch`: Fetches several lists at once, each request has a `resource`, an optional `query_string`, `compact` flag and `key`, and gets one result in request order. Prefer it over several `get_resources` calls when the lists are unrelated.
+    - `list_resource_parameters`: Lists the query parameters and lookups of a resource, or every API path without one. Errors only suggest the closest names, call it for the full lists.
     - `query_netbox_relationships`: Executes a GraphQL query against NetBox to fetch complex data, relationships, or aggregations.
       - `query`: The GraphQL query string.
+    - `create_resources` / `update_resources` / `delete_resources`: Create, update (objects must include `id`) or delete many objects of one endpoint at once, returning a per-object success/failure report.
     """,
-    strict_input_validation=False
+    strict_input_validation=False,
+    lifespan=lifespan,
+    middleware=[MetricsMiddleware()],
 )
 
+async def get_metrics(request):
+    """Prometheus text exposition of request counts, latencies and cache ratios."""
+    if NETBOX_METRICS != "public" and (request.client is None or request.client.host not in LOCAL_HOSTS):
+        return PlainTextResponse("Not found", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+if NETBOX_METRICS != "off":
+    mcp.custom_route("/metrics", methods=["GET"])(get_metrics)
+
+# Static, encoded once instead of on every read
+OBJECT_TYPES_RESOURCE = codec.dumps_text(netbox.NETBOX_OBJECT_TYPES)
+
 @mcp.resource("netbox://object-types")
 def get_object_types() -> str:
     """Return the list of available NetBox object types and their endpoints."""
     logger.info("get_object_types called")
-    return json.dumps(netbox.NETBOX_OBJECT_TYPES, indent=2)
+    return OBJECT_TYPES_RESOURCE
 
 @mcp.resource("netbox://graphql-schema")
 async def get_graphql_schema() -> str:
     """Return the GraphQL schema for the NetBox instance."""
-    query = """
-    query {
-      __schema {
-        types {
-          name
-          kind
-          description
-          fields {
-            name
-            description
-          }
-        }
-      }
-    }
-    """
-    response = await netbox.graphql_get(query)
-    if response and "data" in response:
-        return json.dumps(response["data"], indent=2)
-    return "Failed to fetch GraphQL schema"
+    try:
+        schema = await graphql_schema.get_schema()
+    except Exception as e:
+        logger.error(f"get_graphql_schema failed with reason {e}")
+        return "Failed to fetch GraphQL schema"
+    return schema.resource
+
+@mcp.resource("netbox://cache-stats")
+def get_cache_stats() -> str:
+    """Return hit/miss counters and size of the NetBox response cache and the on-disk store."""
+    stats = cache.response_cache.stats()
+    if store.store is not None:
+        stats["store"] = store.store.stats()
+    return codec.dumps_text(stats)
 
 @mcp.tool()
 async def get_resources(
     resource: Annotated[str, Field(description="The NetBox API resource endpoint (e.g., 'dcim/devices/', 'ipam/ip-addresses/')")], 
     query_string: Annotated[str | None, Field(description="Optional query string to filter the results, some parameters are queried using slugs, for example use site instead of site__slug")] = None,
+    max_rows: Annotated[int | None, Field(description="Optional maximum number of rows to return, results beyond it are not fetched", ge=1)] = None,
+    max_bytes: Annotated[int | None, Field(description="Optional maximum size in bytes of the JSON encoded rows to return", ge=1)] = None,
+    compact: Annotated[bool, Field(description="Return only the important fields of each object with nested objects flattened to their slug or id")] = False,
+    count_only: Annotated[bool, Field(description="Return only how many objects match, without fetching them")] = False,
+    group_by: Annotated[str | None, Field(description="Optional field to count the matching objects per value of, e.g. 'status' or 'site', instead of returning them")] = None,
     action: Annotated[str | None, Field(description="Ignored parameter")] = None,
     sessionId: Annotated[str | None, Field(description="Ignored parameter")] = None,
     sessionid: Annotated[str | None, Field(description="Ignored parameter (alias)")] = None,
@@ -71,20 +176,161 @@ async def get_resources(
     metadata: Annotated[dict | None, Field(description="Ignored parameter")] = None,
     toolCallId: Annotated[str | None, Field(description="Ignored parameter")] = None,
     tool: Annotated[str | None, Field(description="Ignored parameter")] = None,
+    ctx: Context | None = None,
 ) -> dict:
     """
     Gather all models matching the query from NetBox for a specific resource.
     """
 
-    query = parse_qs(query_string) if query_string else None
+    if count_only or group_by is not None:
+        resource, query = resource_query(resource, query_string)
+        return await count_output(resource, query, group_by)
+    resource, query = resource_query(resource, query_string, compact)
+    if max_rows is None and max_bytes is None:
+        output = await netbox.get(resource, query)
+    else:
+        output = await stream_resources(resource, query, max_rows, max_bytes, ctx)
+    if compact:
+        output = compact_output(resource, output)
+    return output
+
+
+@mcp.tool()
+async def count_resources(
+    resource: Annotated[str, Field(description="The NetBox API resource endpoint (e.g., 'dcim/devices/', 'ipam/ip-addresses/')")],
+    query_string: Annotated[str | None, Field(description="Optional query string to filter the counted objects, the same as for get_resources")] = None,
+    group_by: Annotated[str | None, Field(description="Optional field to count the matching objects per value of, e.g. 'status', 'role' or 'site'")] = None,
+) -> dict:
+    """
+    Count the NetBox objects matching a query without fetching them, e.g. "how many active devices are in site X".
+    With group_by, return the number of objects per value of that field, most frequent first.
+    """
+    resource, query = resource_query(resource, query_string)
+    return await count_output(resource, query, group_by)
+
+
+async def count_output(resource, query, group_by=None):
+    if group_by is None:
+        return {"count": await netbox.count(resource, query)}
+    return await netbox.aggregate(resource, group_by, query)
+
+
+class BatchRequest(BaseModel):
+    """One list of a ``get_resources_batch`` call, the same arguments as ``get_resources``."""
+
+    resource: str = Field(description="The NetBox API resource endpoint (e.g., 'dcim/sites/')")
+    query_string: str | None = Field(None, description="Optional query string to filter the results, as for get_resources")
+    compact: bool = Field(False, description="Return only the important fields of each object")
+    key: str | None = Field(None, description="Optional name of the request, echoed back in its result")
+
+
+@mcp.tool()
+async def get_resources_batch(
+    requests: Annotated[list[BatchRequest], Field(description="The lists to fetch")],
+) -> dict:
+    """
+    Gather several unrelated lists from NetBox in one call, e.g. sites, device roles, platforms and VLANs.
+
+    Every request is validated before any is sent, then they all run concurrently.
+    Results are returned in request order, each with its 'index' and 'key', and a failed
+    request has an 'error' instead of results without failing the others.
+    """
+    if len(requests) > NETBOX_BATCH_MAX_REQUESTS:
+        raise ToolError(f"At most {NETBOX_BATCH_MAX_REQUESTS} requests can be batched, got {len(requests)}")
+    queries = {}
+    errors = {}
+    for index, request in enumerate(requests):
+        try:
+            queries[index] = resource_query(request.resource, request.query_string, request.compact)
+        except Exception as e:
+            errors[index] = {"error": f"Invalid request: {e}"}
+    outputs = await netbox.get_many(queries)
+    results = []
+    for index, request in enumerate(requests):
+        output = errors.get(index) or outputs[index]
+        if request.compact and "error" not in output:
+            output = compact_output(queries[index][0], output)
+        key = request.key or f"{request.resource}{'?' + request.query_string if request.query_string else ''}"
+        results.append({"index": index, "key": key, **output})
+    failed = sum(1 for output in results if "error" in output)
+    return {"total": len(results), "succeeded": len(results) - failed, "failed": failed, "results": results}
+
 
-    if query is None:
-        query = {}
+@mcp.tool()
+async def list_resource_parameters(
+    resource: Annotated[str | None, Field(description="The NetBox API resource endpoint (e.g., 'dcim/devices/'), omit it to list every API path")] = None,
+) -> dict:
+    """
+    List the query parameters a NetBox resource accepts, each field with its lookup suffixes
+    (e.g. 'name': ['ic', 'n'] allows name__ic and name__n), or every API path without a resource.
+    Use it when get_resources reports an invalid path or parameter and the suggestions do not help.
+    """
+    schema = await validation.get_schema_index()
+    if resource is None:
+        return {"paths": sorted(schema.paths)}
+    path = f"/api/{normalize_resource(resource)}"
+    try:
+        await validation.validate_path(schema, path)
+    except ValueError as e:
+        raise ToolError(str(e))
+    return {"resource": path, "parameters": validation.param_validator(schema, path).describe()}
+
+
+def normalize_resource(resource):
     if not resource.endswith('/'):
         resource += '/'
     if resource.startswith('/api/'):
         resource = resource[5:]
-    return await netbox.get(resource, query)
+    return resource
+
+
+def resource_query(resource, query_string, compact=False):
+    """Return the normalized resource and the params of a query string, narrowed to compact fields."""
+    query = parse_qs(query_string) if query_string else {}
+    resource = normalize_resource(resource)
+    if compact and "fields" not in query and "brief" not in query:
+        fields = netbox.compact_fields(resource)
+        if fields is not None:
+            query["fields"] = fields
+        else:
+            query["brief"] = ["1"]
+    return resource, query
+
+
+def compact_output(resource, output):
+    results, saved = netbox.compact_results(output["results"])
+    logger.info(f"get_resources compact mode saved {saved} bytes on {resource}")
+    return {**output, "results": results, "bytes_saved": saved}
+
+
+async def stream_resources(resource, query, max_rows=None, max_bytes=None, ctx=None):
+    """Collect rows page by page until the row or byte budget is reached."""
+    if max_rows is not None and "limit" not in query:
+        query["limit"] = min(max_rows, 1000)
+    output = {"count": 0, "results": [], "truncated": False}
+    size = 0
+    async with aclosing(netbox.iter_pages(resource, query)) as pages:
+        async for page in pages:
+            output["count"] = page["count"]
+            for record in page["results"]:
+                if max_rows is not None and len(output["results"]) >= max_rows:
+                    output["truncated"] = True
+                    break
+                if max_bytes is not None:
+                    size += cache.estimate_size(record)
+                    if size > max_bytes:
+                        output["truncated"] = True
+                        break
+                output["results"].append(record)
+            if ctx is not None:
+                await ctx.report_progress(len(output["results"]), page["count"])
+            # A full budget stops before the next page is awaited
+            if output["truncated"] or (max_rows is not None and len(output["results"]) >= max_rows):
+                break
+    if len(output["results"]) < output["count"]:
+        output["truncated"] = True
+    logger.info(f"get_resources streamed {len(output['results'])} of {output['count']} rows from {resource}")
+    return output
 
 
 @mcp.tool()
@@ -107,8 +353,67 @@ async def query_netbox_relationships(
     - "Show me all Cisco devices in New York."
     """
     logger.info(f"query_netbox_relationships called with query: {query}")
+    try:
+        schema = await graphql_schema.get_schema_nowait()
+    except Exception as e:
+        # Without an introspection NetBox is left to validate the query
+        logger.error(f"query_netbox_relationships could not load the GraphQL schema with reason {e}")
+        schema = None
+    if schema is not None:
+        try:
+            graphql_schema.validate_query(schema, query)
+        except ValueError as e:
+            raise ToolError(str(e))
+        # Unbounded lists are split into concurrent pages and merged back
+        return await graphql_cost.execute(schema, query)
     return await netbox.graphql_get(query)
 
 
+@mcp.tool()
+async def create_resources(
+    resource: Annotated[str, Field(description="The NetBox API resource endpoint (e.g., 'dcim/interfaces/')")],
+    objects: Annotated[list[dict], Field(description="The objects to create, each with the fields NetBox requires for the endpoint")],
+) -> dict:
+    """
+    Create many objects of one NetBox resource in bulk, e.g. all interfaces of a device.
+    """
+    logger.info(f"create_resources called with resource: {resource}, objects: {len(objects)}")
+    return await netbox.bulk("POST", normalize_resource(resource), objects)
+
+
+@mcp.tool()
+async def update_resources(
+    resource: Annotated[str, Field(description="The NetBox API resource endpoint (e.g., 'ipam/ip-addresses/')")],
+    objects: Annotated[list[dict], Field(description="The changes to apply, each with the 'id' of the object to update and the fields to change")],
+) -> dict:
+    """
+    Update many objects of one NetBox resource in bulk, e.g. renumbering a prefix.
+    """
+    missing_id = [index for index, item in enumerate(objects) if "id" not in item]
+    if missing_id:
+        raise ToolError(f"Objects at positions {missing_id} have no 'id'")
+    logger.info(f"update_resources called with resource: {resource}, objects: {len(objects)}")
+    return await netbox.bulk("PATCH", normalize_resource(resource), objects)
+
+
+@mcp.tool()
+async def delete_resources(
+    resource: Annotated[str, Field(description="The NetBox API resource endpoint (e.g., 'dcim/interfaces/')")],
+    ids: Annotated[list[int], Field(description="The ids of the objects to delete")],
+) -> dict:
+    """
+    Delete many objects of one NetBox resource in bulk.
+    """
+    logger.info(f"delete_resources called with resource: {resource}, ids: {len(ids)}")
+    return await netbox.bulk("DELETE", normalize_resource(resource), [{"id": model_id} for model_id in ids])
+
+
+metrics.startup_seconds.set(time.perf_counter() - _import_started, "import")
+logger.info(f"server imported in {time.perf_counter() - _import_started:.2f}s")
+
+
 if __name__ == "__main__":
-    mcp.run(transport="http", host="0.0.0.0", port=8080)
+    if workers.NETBOX_WORKERS > 1:
+        workers.serve(mcp, "0.0.0.0", 8080)
+    else:
+        mcp.run(transport="http", host="0.0.0.0", port=8080)
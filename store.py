@@ -0,0 +1,190 @@
+"""Optional on-disk store of the state worth keeping across redeploys.
+
+The OpenAPI schema, the GraphQL introspection, the choice index and list
+results that carry revalidation validators are written through to a SQLite
+file, meant to live on a mounted volume, and read back when the container
+starts without them. Every entry is stamped with the NetBox version read
+from ``/api/status/`` and only served to the same version, entries of any
+other version are dropped once an upgrade is noticed. Least recently used
+entries are evicted over ``NETBOX_STORE_MAX_BYTES`` and the file is vacuumed
+once a quarter of it is free pages.
+"""
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import client
+import codec
+
+from cache import SQLiteFile
+from contextlib import closing
+
+
+logger = logging.getLogger(__name__)
+
+# e.g. /data/netbox-mcp.sqlite on a volume, unset disables the store
+NETBOX_STORE_FILE = os.environ.get("NETBOX_STORE_FILE") or None
+NETBOX_STORE_MAX_BYTES = int(os.environ.get("NETBOX_STORE_MAX_BYTES") or 256 * 1024 * 1024)
+# How long the NetBox version stamping the entries is trusted before re-reading it
+NETBOX_STORE_VERSION_TTL = float(os.environ.get("NETBOX_STORE_VERSION_TTL") or 300)
+# Wait between reads of /api/status/ while it fails, the store is bypassed meanwhile
+NETBOX_STORE_VERSION_RETRY = float(os.environ.get("NETBOX_STORE_VERSION_RETRY") or 30)
+
+VACUUM_FREE_RATIO = 0.25
+
+
+class Store(SQLiteFile):
+    """Versioned key/value SQLite file with LRU eviction, shared by every worker process."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            namespace TEXT, key TEXT, version TEXT, used REAL, size INTEGER, value BLOB,
+            PRIMARY KEY (namespace, key)
+        );
+        CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+        CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+        INSERT OR IGNORE INTO meta SELECT 'size', COALESCE(SUM(size), 0) FROM entries;
+    """
+
+    def __init__(self, path, max_bytes=NETBOX_STORE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, namespace, key, version):
+        """Return the stored bytes, None when missing or stored for another NetBox version."""
+        row = self.db.execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ? AND version = ?", (namespace, key, version)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE entries SET used = ? WHERE namespace = ? AND key = ?", (time.time(), namespace, key))
+        self.hits += 1
+        return row[0]
+
+    def set(self, namespace, key, version, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._transaction() as db:
+            previous = db.execute("SELECT size FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, version, used, size, value) VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, version, time.time(), len(value), value),
+            )
+            size = self._size(db) + len(value) - (previous[0] if previous else 0)
+            while size > self.max_bytes:
+                oldest = db.execute("SELECT namespace, key, size FROM entries ORDER BY used LIMIT 1").fetchone()
+                db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", oldest[:2])
+                size -= oldest[2]
+            db.execute("UPDATE meta SET value = ? WHERE name = 'size'", (size,))
+
+    def compact(self, version):
+        """Drop the entries of other NetBox versions and vacuum a mostly free file.
+
+        Blocking, it runs in a thread on a connection of its own.
+        """
+        with closing(self.connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            removed, size = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE version != ?", (version,)
+            ).fetchone()
+            db.execute("DELETE FROM entries WHERE version != ?", (version,))
+            db.execute("UPDATE meta SET value = value - ? WHERE name = 'size'", (size,))
+            db.execute("COMMIT")
+            pages = db.execute("PRAGMA page_count").fetchone()[0]
+            free = db.execute("PRAGMA freelist_count").fetchone()[0]
+            if pages and free / pages >= VACUUM_FREE_RATIO:
+                db.execute("VACUUM")
+        logger.info(f"store.compact dropped {removed} entries of other versions than NetBox {version}, {free}/{pages} free pages")
+        return removed
+
+    def _size(self, db):
+        return db.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def stats(self):
+        return {
+            "entries": self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+            "size_bytes": self._size(self.db),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "path": self.path,
+        }
+
+
+store = Store(NETBOX_STORE_FILE) if NETBOX_STORE_FILE else None
+_version = None
+_version_checked = None
+
+
+async def fetch_version():
+    """Read the NetBox version from ``/api/status/``, compacting the store when it changed."""
+    global _version, _version_checked
+    # Taken before the request, concurrent callers and failures wait for the next check
+    _version_checked = time.monotonic()
+    url = f"{client.NETBOX_URL}api/status/"
+    try:
+        async with client.request("GET", url, headers=client.headers()) as r:
+            if r.status != 200:
+                return None
+            version = (await codec.read_json(r)).get("netbox-version")
+    except Exception as e:
+        logger.error(f"store.fetch_version failed with reason {e}")
+        return None
+    if version is not None and version != _version:
+        _version = version
+        if store is not None:
+            try:
+                await asyncio.to_thread(store.compact, version)
+            except sqlite3.Error as e:
+                logger.error(f"store.compact failed with reason {e}")
+    return version
+
+
+async def version():
+    """Return the NetBox version, re-read every ``NETBOX_STORE_VERSION_TTL`` seconds, or
+    every ``NETBOX_STORE_VERSION_RETRY`` seconds while it can't be read."""
+    interval = NETBOX_STORE_VERSION_TTL if _version is not None else NETBOX_STORE_VERSION_RETRY
+    if _version_checked is None or time.monotonic() - _version_checked > interval:
+        await fetch_version()
+    return _version
+
+
+async def load_raw(namespace, key):
+    """Return bytes stored for the running NetBox version, None without a store or an entry."""
+    if store is None:
+        return None
+    current = await version()
+    if current is None:
+        return None
+    try:
+        return store.get(namespace, key, current)
+    except sqlite3.Error as e:
+        logger.error(f"store.get {namespace} {key} failed with reason {e}")
+        return None
+
+
+async def save_raw(namespace, key, value):
+    if store is None:
+        return
+    current = await version()
+    if current is None:
+        # Entries can't be stamped while NetBox is unreachable
+        return
+    try:
+        store.set(namespace, key, current, value)
+    except sqlite3.Error as e:
+        logger.error(f"store.set {namespace} {key} failed with reason {e}")
+
+
+async def load(namespace, key):
+    value = await load_raw(namespace, key)
+    return None if value is None else codec.loads(value)
+
+
+async def save(namespace, key, value):
+    if store is not None:
+        await save_raw(namespace, key, codec.dumps(value))
@@ -0,0 +1,160 @@
+import os
+import time
+import sqlite3
+import tempfile
+import unittest
+
+import cache
+import store
+
+class TestResponseCache(unittest.TestCase):
+    def test_key_normalization(self):
+        self.assertEqual(
+            cache.make_key("/api/dcim/sites", {"b": ["2"], "a": 1}),
+            cache.make_key("dcim/sites/", {"a": "1", "b": ("2",)}),
+        )
+        self.assertEqual(
+            cache.graphql_key('query {\n  site_list(filters: {name: "a  b"}) { id }\n}'),
+            cache.graphql_key('query { site_list(filters: {name: "a  b"}) { id } }'),
+        )
+
+    def test_hit_miss_and_invalidation(self):
+        response_cache = cache.ResponseCache(max_bytes=1024, default_ttl=60, ttls={})
+        key = cache.make_key("dcim/sites/", {})
+        graphql_key = cache.graphql_key("{ site_list { id } }")
+        self.assertIsNone(response_cache.get(key))
+        response_cache.set(key, {"count": 0, "results": []})
+        response_cache.set(graphql_key, {"data": {}})
+        self.assertEqual(response_cache.get(key), {"count": 0, "results": []})
+        response_cache.invalidate("dcim/sites/1/")
+        self.assertIsNone(response_cache.get(key))
+        self.assertIsNone(response_cache.get(graphql_key))
+        stats = response_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size_bytes"]), (1, 3, 0))
+
+    def test_size_eviction(self):
+        response_cache = cache.ResponseCache(max_bytes=100, default_ttl=60, ttls={"dcim/": 0})
+        response_cache.set(("ipam/vlans/", ()), "x", size=60)
+        response_cache.set(("ipam/vrfs/", ()), "y", size=60)
+        response_cache.set(("dcim/sites/", ()), "z", size=10)
+        self.assertIsNone(response_cache.get(("ipam/vlans/", ())))
+        self.assertEqual(response_cache.get(("ipam/vrfs/", ())), "y")
+        self.assertIsNone(response_cache.get(("dcim/sites/", ())))
+        self.assertEqual(response_cache.stats()["evictions"], 1)
+
+    def test_expired_entries_kept_for_revalidation(self):
+        response_cache = cache.ResponseCache(max_bytes=1024, default_ttl=0.01, ttls={})
+        response_cache.set(("dcim/sites/", ()), {"count": 0}, validators={"count": 0, "last_updated": None})
+        response_cache.set(("dcim/racks/", ()), {"count": 0})
+        time.sleep(0.02)
+        self.assertIsNone(response_cache.get(("dcim/sites/", ())))
+        self.assertIsNone(response_cache.get(("dcim/racks/", ())))
+        self.assertEqual(response_cache.get_stale(("dcim/sites/", ())), ({"count": 0}, {"count": 0, "last_updated": None}))
+        self.assertIsNone(response_cache.get_stale(("dcim/racks/", ())))
+        response_cache.invalidate("dcim/sites/")
+        self.assertIsNone(response_cache.get_stale(("dcim/sites/", ())))
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared_between_instances(self):
+        first = cache.SharedCache(self.path, max_bytes=1024, default_ttl=60, ttls={})
+        second = cache.SharedCache(self.path, max_bytes=1024, default_ttl=60, ttls={})
+        key = cache.make_key("dcim/sites/", {"limit": 1000})
+        first.set(key, {"count": 1, "results": [{"id": 1}]})
+        self.assertEqual(second.get(key), {"count": 1, "results": [{"id": 1}]})
+        generation = first.generation
+        second.invalidate("dcim/sites/1/")
+        self.assertIsNone(first.get(key))
+        # A read started before the invalidation is not cached
+        first.set(key, {"count": 0, "results": []}, generation=generation)
+        self.assertIsNone(second.get(key))
+        self.assertEqual(first.stats()["invalidations"], 1)
+
+    def test_size_eviction(self):
+        shared = cache.SharedCache(self.path, max_bytes=100, default_ttl=60, ttls={})
+        shared.set(("ipam/vlans/", ()), "x" * 50)
+        shared.set(("ipam/vrfs/", ()), "y" * 50)
+        self.assertIsNone(shared.get(("ipam/vlans/", ())))
+        self.assertEqual(shared.get(("ipam/vrfs/", ())), "y" * 50)
+        self.assertEqual(shared.stats()["evictions"], 1)
+        self.assertLessEqual(shared.stats()["size_bytes"], 100)
+
+    def test_batched_touches_and_pruning(self):
+        shared = cache.SharedCache(self.path, max_bytes=1024, default_ttl=60, ttls={})
+        shared.set(("dcim/sites/", ()), {"count": 1})
+        used = shared.db.execute("SELECT used FROM entries").fetchone()[0]
+        shared.get(("dcim/sites/", ()))
+        # A hit takes no write lock, its access time waits for the next write
+        self.assertEqual(shared.db.execute("SELECT used FROM entries").fetchone()[0], used)
+        shared.ttls = {"ipam/": 0.01}
+        shared.set(("ipam/vlans/", ()), {"count": 2})
+        shared.set(("ipam/vrfs/", ()), {"count": 3}, validators={"etag": '"a"'})
+        self.assertGreater(shared.db.execute("SELECT used FROM entries WHERE endpoint = 'dcim/sites/'").fetchone()[0], used)
+
+        time.sleep(0.02)
+        shared._pruned = 0.0
+        shared.set(("dcim/devices/", ()), {"count": 4})
+        endpoints = {row[0] for row in shared.db.execute("SELECT endpoint FROM entries")}
+        # Expired, only the entry that can be revalidated is kept
+        self.assertEqual(endpoints, {"dcim/sites/", "ipam/vrfs/", "dcim/devices/"})
+        self.assertEqual(shared.stats()["size_bytes"], shared.db.execute("SELECT SUM(size) FROM entries").fetchone()[0])
+
+    def test_validators_on_a_file_without_them(self):
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, endpoint TEXT, expires REAL, used REAL, size INTEGER, value BLOB)")
+        db.commit()
+        db.close()
+        shared = cache.SharedCache(self.path, max_bytes=1024, default_ttl=60, ttls={})
+        shared.set(("dcim/sites/", ()), {"count": 1}, validators={"etag": '"a"'})
+        self.assertEqual(shared.get_stale(("dcim/sites/", ())), ({"count": 1}, {"etag": '"a"'}))
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "store.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_versioned_entries(self):
+        first = store.Store(self.path)
+        first.set("openapi", "schema", "4.1.0", b"old")
+        # Reopened after a restart, only served to the version it was stored for
+        second = store.Store(self.path)
+        self.assertEqual(second.get("openapi", "schema", "4.1.0"), b"old")
+        self.assertIsNone(second.get("openapi", "schema", "4.2.0"))
+        second.set("graphql", "introspection", "4.2.0", b"new")
+        self.assertEqual(second.compact("4.2.0"), 1)
+        self.assertIsNone(second.get("openapi", "schema", "4.1.0"))
+        self.assertEqual(second.stats()["entries"], 1)
+
+    def test_size_eviction(self):
+        persistent = store.Store(self.path, max_bytes=100)
+        persistent.set("lists", "a", "4.2.0", b"x" * 50)
+        persistent.set("lists", "b", "4.2.0", b"y" * 50)
+        persistent.get("lists", "a", "4.2.0")
+        persistent.set("lists", "c", "4.2.0", b"z" * 50)
+        self.assertIsNone(persistent.get("lists", "b", "4.2.0"))
+        self.assertEqual(persistent.get("lists", "a", "4.2.0"), b"x" * 50)
+        persistent.set("lists", "d", "4.2.0", b"w" * 101)
+        self.assertLessEqual(persistent.stats()["size_bytes"], 100)
+        persistent.set("lists", "a", "4.2.0", b"x" * 10)
+        self.assertEqual(persistent.stats()["size_bytes"], 60)
+        self.assertEqual(persistent.compact("4.3.0"), 2)
+        self.assertEqual(persistent.stats()["size_bytes"], 0)
+
+    def test_size_on_a_file_without_it(self):
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE entries (namespace TEXT, key TEXT, version TEXT, used REAL, size INTEGER, value BLOB, PRIMARY KEY (namespace, key))")
+        db.execute("INSERT INTO entries VALUES ('lists', 'a', '4.2.0', 0, 3, x'616263')")
+        db.commit()
+        db.close()
+        self.assertEqual(store.Store(self.path).stats()["size_bytes"], 3)
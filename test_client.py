@@ -0,0 +1,34 @@
+import unittest
+
+from aiohttp.test_utils import TestServer
+
+import client
+from bench.mock_netbox import MockNetBox
+
+
+class TestSession(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = TestServer(MockNetBox(rows=5).app())
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await client.close()
+        await self.server.close()
+
+    async def test_shared_session_reused_and_closed(self):
+        session = await client.start()
+        self.assertIs(await client.start(), session)
+        self.assertIs(await client.get_session(), session)
+        url = str(self.server.make_url("/api/status/"))
+        for _ in range(3):
+            async with client.request("GET", url) as r:
+                self.assertEqual(r.status, 200)
+        # Every request went through the one pooled session
+        self.assertIs(await client.get_session(), session)
+
+        await client.close()
+        self.assertTrue(session.closed)
+        # Used again after shutdown, a new session is created lazily
+        replacement = await client.get_session()
+        self.assertIsNot(replacement, session)
+        self.assertFalse(replacement.closed)
@@ -0,0 +1,46 @@
+import unittest
+
+import codec
+import metrics
+
+from yarl import URL
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.url = URL("http://netbox/api/dcim/sites/?limit=1000")
+
+    async def read(self):
+        return self.body
+
+
+class TestCodec(unittest.IsolatedAsyncioTestCase):
+    def test_backends_agree(self):
+        value = {"id": 1, "name": "sw-ü", "tags": [], "site": None, 2: "non str key"}
+        for name, make in codec.BACKENDS.items():
+            try:
+                _, loads, dumps = make()
+            except ImportError:
+                continue
+            with self.subTest(backend=name):
+                encoded = dumps(value)
+                self.assertIsInstance(encoded, bytes)
+                self.assertNotIn(b" ", encoded.replace(b"non str key", b""))
+                self.assertEqual(loads(encoded)["name"], "sw-ü")
+
+    async def test_read_json(self):
+        self.assertEqual(await codec.read_json(FakeResponse(b'{"count": 1}')), {"count": 1})
+        self.assertIsNone(await codec.read_json(FakeResponse(b"")))
+        with self.assertRaises(ValueError):
+            await codec.read_json(FakeResponse(b"<html>Bad Gateway</html>"))
+
+    async def test_bytes_read_are_counted(self):
+        before = metrics.upstream_bytes.values.get(("dcim/sites/",), 0)
+        # Without relying on Content-Length, absent from chunked responses
+        await codec.read_json(FakeResponse(b'{"count": 1}'))
+        self.assertEqual(metrics.upstream_bytes.values[("dcim/sites/",)], before + 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+
+import cache
+import client
+import graphql_cost
+import graphql_query
+import graphql_schema
+import netbox
+
+from aiohttp.test_utils import TestServer
+from bench.mock_netbox import MockNetBox
+
+
+def type_ref(kind, name=None, of_type=None):
+    return {"kind": kind, "name": name, "ofType": of_type}
+
+
+INTROSPECTION = {"__schema": {"queryType": {"name": "Query"}, "types": [
+    {"name": "Query", "kind": "OBJECT", "description": None, "fields": [
+        {"name": "device_list", "description": None, "args": [{"name": "filters"}, {"name": "pagination"}],
+         "type": type_ref("NON_NULL", None, type_ref("LIST", None, type_ref("NON_NULL", None, type_ref("OBJECT", "DeviceType"))))},
+    ]},
+    {"name": "DeviceType", "kind": "OBJECT", "description": None, "fields": [
+        {"name": "id", "description": None, "args": [], "type": type_ref("SCALAR", "ID")},
+        {"name": "name", "description": None, "args": [], "type": type_ref("SCALAR", "String")},
+        {"name": "interfaces", "description": None, "args": [],
+         "type": type_ref("LIST", None, type_ref("OBJECT", "InterfaceType"))},
+    ]},
+    {"name": "InterfaceType", "kind": "OBJECT", "description": None, "fields": [
+        {"name": "name", "description": None, "args": [], "type": type_ref("SCALAR", "String")},
+    ]},
+    {"name": "ID", "kind": "SCALAR", "description": None, "fields": None},
+]}}
+
+
+class TestGraphQLQuery(unittest.TestCase):
+    def test_round_trip(self):
+        query = '''query Devices($name: String = "a, b") {
+          devices: device_list(filters: {name: {exact: $name}}) @include(if: true) {
+            id
+            ... on DeviceType { name }
+            ...DeviceFields
+          }
+        }
+        fragment DeviceFields on DeviceType { name }'''
+        definitions = graphql_query.parse(query)
+        self.assertEqual(definitions[0]["selections"][0]["alias"], "devices")
+        self.assertEqual(definitions[0]["selections"][0]["name"], "device_list")
+        self.assertEqual(graphql_query.parse(graphql_query.print_document(definitions)), definitions)
+
+    def test_syntax_error(self):
+        with self.assertRaises(ValueError):
+            graphql_query.parse("{ device_list { id }")
+
+
+class TestGraphQLSchema(unittest.TestCase):
+    def test_index(self):
+        schema = graphql_schema.GraphQLSchema(INTROSPECTION, "4.2.0")
+        self.assertEqual(schema.types["Query"]["device_list"].type_name, "DeviceType")
+        self.assertTrue(schema.types["Query"]["device_list"].is_list)
+        self.assertNotIn("ofType", schema.resource)
+
+    def test_validate_query(self):
+        schema = graphql_schema.GraphQLSchema(INTROSPECTION)
+        graphql_schema.validate_query(schema, "{ device_list { id name __typename } }")
+        with self.assertRaises(ValueError) as context:
+            graphql_schema.validate_query(schema, "{ device_list { id nmae } }")
+        self.assertIn("did you mean ['name']", str(context.exception))
+
+
+class TestGraphQLCost(unittest.TestCase):
+    def test_arguments(self):
+        selection = graphql_query.parse('{ device_list(filters: {name: {exact: "a"}}, pagination: {offset: 0, limit: 5}) { id } }')[0]["selections"][0]
+        values = graphql_cost.arguments(selection["arguments"])
+        self.assertEqual(list(values), ["filters", "pagination"])
+        self.assertEqual(graphql_cost.pagination_limit(values), 5)
+
+    def test_estimate(self):
+        schema = graphql_schema.GraphQLSchema(INTROSPECTION)
+        counts = {"DeviceType": 100, "InterfaceType": 2000}
+        # 100 devices of id and 20 interfaces with a name each
+        self.assertEqual(graphql_cost.estimate(schema, "{ device_list { id interfaces { name } } }", counts), 100 * (1 + 1 + 20 * 2))
+        self.assertEqual(
+            graphql_cost.estimate(schema, "{ device_list(pagination: {limit: 10}) { ...F } } fragment F on DeviceType { id }", counts),
+            10 * 2,
+        )
+
+
+class TestGraphQLPagination(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mock = MockNetBox(rows=20)
+        self.server = TestServer(self.mock.app())
+        await self.server.start_server()
+        self.url = client.NETBOX_URL
+        client.NETBOX_URL = str(self.server.make_url("/"))
+        self.budget = graphql_cost.NETBOX_GRAPHQL_COST_BUDGET
+        cache.response_cache.clear()
+
+    async def asyncTearDown(self):
+        client.NETBOX_URL = self.url
+        graphql_cost.NETBOX_GRAPHQL_COST_BUDGET = self.budget
+        cache.response_cache.clear()
+        await self.server.close()
+        await client.close()
+
+    async def test_over_budget_lists_are_paginated(self):
+        schema = graphql_schema.GraphQLSchema(INTROSPECTION)
+        query = "{ devices: device_list { id name } }"
+        expected = await netbox.graphql_get(query)
+        graphql_cost.NETBOX_GRAPHQL_COST_BUDGET = 10
+        response = await graphql_cost.execute(schema, query, {"DeviceType": 20})
+        self.assertEqual(response["data"], expected["data"])
+        self.assertEqual(response["extensions"]["pagination"]["devices"], {"pages": 7, "page_size": 3, "truncated": False})
+
+        graphql_cost.NETBOX_GRAPHQL_COST_BUDGET = 1000
+        response = await graphql_cost.execute(schema, query, {"DeviceType": 20})
+        self.assertNotIn("extensions", response)
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import client
+import limiter
+
+
+class TestAdaptiveLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrency_cap(self):
+        adaptive = limiter.AdaptiveLimiter(max_concurrency=2, min_concurrency=1, rate=0, burst=1)
+        peak = 0
+
+        async def work():
+            nonlocal peak
+            await adaptive.acquire()
+            peak = max(peak, adaptive.in_flight)
+            await asyncio.sleep(0.01)
+            adaptive.release()
+
+        await asyncio.gather(*(work() for _ in range(10)))
+        self.assertEqual(peak, 2)
+        self.assertEqual(adaptive.in_flight, 0)
+
+    async def test_aimd(self):
+        adaptive = limiter.AdaptiveLimiter(max_concurrency=8, min_concurrency=1, rate=0, burst=1, cooldown=0)
+        for _ in range(2):
+            await adaptive.acquire()
+            adaptive.release(overloaded=True)
+        self.assertEqual(adaptive.limit, 2)
+        for _ in range(3):
+            await adaptive.acquire()
+            adaptive.release()
+        self.assertGreater(adaptive.limit, 3)
+        self.assertLessEqual(adaptive.limit, 8)
+
+    async def test_token_bucket(self):
+        adaptive = limiter.AdaptiveLimiter(max_concurrency=8, min_concurrency=1, rate=100, burst=1)
+        started = time.monotonic()
+        for _ in range(4):
+            await adaptive.acquire()
+            adaptive.release()
+        self.assertGreaterEqual(time.monotonic() - started, 0.025)
+
+    def test_share(self):
+        previous = limiter.limiter, limiter.NETBOX_MAX_CONCURRENCY, limiter.NETBOX_RATE_LIMIT, limiter.NETBOX_RATE_BURST
+        limiter.NETBOX_MAX_CONCURRENCY, limiter.NETBOX_RATE_LIMIT, limiter.NETBOX_RATE_BURST = 16, 20.0, 20.0
+        try:
+            shared = limiter.share(4)
+            self.assertIs(limiter.limiter, shared)
+            self.assertEqual((shared.max_concurrency, shared.rate, shared.burst), (4, 5.0, 5.0))
+            # Never below one request at a time
+            self.assertEqual(limiter.share(32).max_concurrency, 1)
+        finally:
+            limiter.limiter, limiter.NETBOX_MAX_CONCURRENCY, limiter.NETBOX_RATE_LIMIT, limiter.NETBOX_RATE_BURST = previous
+
+    def test_retry_after(self):
+        self.assertEqual(limiter.retry_after("3"), 3.0)
+        self.assertIsNone(limiter.retry_after(None))
+        self.assertEqual(limiter.retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertTrue(limiter.should_retry("POST", 429))
+        self.assertFalse(limiter.should_retry("POST", 502))
+        self.assertTrue(limiter.should_retry("GET", 502))
+
+
+class TestClientRetry(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.backoff = limiter.NETBOX_RETRY_BACKOFF
+        limiter.NETBOX_RETRY_BACKOFF = 0.001
+        self.calls = 0
+
+        async def handler(request):
+            self.calls += 1
+            if self.calls < 3:
+                return web.json_response({"detail": "slow down"}, status=429, headers={"Retry-After": "0"})
+            return web.json_response({"ok": True})
+
+        app = web.Application()
+        app.router.add_route("*", "/api/", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        limiter.NETBOX_RETRY_BACKOFF = self.backoff
+        await self.server.close()
+        await client.close()
+
+    async def test_retries_429(self):
+        async with client.request("GET", str(self.server.make_url("/api/"))) as r:
+            self.assertEqual(r.status, 200)
+            self.assertEqual(await r.json(), {"ok": True})
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(limiter.limiter.in_flight, 0)
+
+    async def test_gives_up(self):
+        self.calls = -10
+        async with client.request("POST", str(self.server.make_url("/api/"))) as r:
+            self.assertEqual(r.status, 429)
+        self.assertEqual(self.calls, -10 + limiter.NETBOX_RETRIES + 1)
+        self.assertEqual(limiter.limiter.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
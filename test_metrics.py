@@ -0,0 +1,27 @@
+import unittest
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_endpoint_label(self):
+        self.assertEqual(metrics.endpoint_label("/api/dcim/devices/12/"), "dcim/devices/{id}/")
+        self.assertEqual(metrics.endpoint_label("/api/dcim/devices/?limit=10"), "dcim/devices/")
+        self.assertEqual(metrics.endpoint_label("/graphql/"), "graphql/")
+
+    def test_render(self):
+        counter = metrics.Counter("test_calls_total", "Test calls.", ("tool",))
+        histogram = metrics.Histogram("test_seconds", "Test latency.", buckets=(0.1, 1.0))
+        counter.inc("a")
+        counter.inc("a", amount=2)
+        histogram.observe(0.05)
+        histogram.observe(5)
+        text = metrics.render()
+        self.assertIn('test_calls_total{tool="a"} 3', text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{le="1.0"} 1', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("test_seconds_count 2", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,325 @@
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+
+import cache
+import client
+import codec
+import netbox
+import replica
+import store
+import validation
+
+from aiohttp.test_utils import TestServer
+from bench.mock_netbox import MockNetBox
+from fastmcp.exceptions import ToolError
+
+class TestPagination(unittest.TestCase):
+    def test_page_offsets(self):
+        response = {
+            "count": 2500,
+            "next": "http://netbox/api/dcim/interfaces/?limit=1000&offset=1000",
+            "results": [{}] * 1000,
+        }
+        limit, offsets = netbox.page_offsets(response)
+        self.assertEqual(limit, 1000)
+        self.assertEqual(list(offsets), [1000, 2000])
+
+    def test_page_offsets_cursor(self):
+        response = {
+            "count": 2500,
+            "next": "http://netbox/api/dcim/interfaces/?cursor=cD0yMDIz",
+            "results": [{}] * 1000,
+        }
+        self.assertIsNone(netbox.page_offsets(response))
+
+    def test_page_offsets_last_page(self):
+        response = {"count": 10, "next": None, "results": [{}] * 10}
+        self.assertIsNone(netbox.page_offsets(response))
+
+
+class TestCompact(unittest.TestCase):
+    def test_compact_fields(self):
+        self.assertEqual(
+            netbox.compact_fields("dcim/regions/"),
+            ["id", "name", "slug", "parent", "description"],
+        )
+        self.assertIsNone(netbox.compact_fields("plugins/unknown/"))
+
+    def test_compact_results(self):
+        results, saved = netbox.compact_results([{
+            "id": 1,
+            "url": "http://netbox/api/dcim/devices/1/",
+            "site": {"id": 2, "slug": "nyc", "name": "NYC"},
+            "status": {"value": "active", "label": "Active"},
+            "tags": [{"id": 3, "slug": "core"}],
+            "custom_fields": {},
+        }])
+        self.assertEqual(results, [{"id": 1, "site": "nyc", "status": "active", "tags": ["core"], "custom_fields": {}}])
+        self.assertGreater(saved, 0)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_callers_share_fetch(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"count": 0, "results": []}
+
+        results = await asyncio.gather(*(netbox.single_flight(("dcim/sites/", ()), fetch) for _ in range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(netbox._inflight, {})
+
+    async def test_exception_is_shared(self):
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise LookupError("unavailable")
+
+        results = await asyncio.gather(
+            *(netbox.single_flight(("dcim/sites/", ()), fetch) for _ in range(3)),
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(result, LookupError) for result in results))
+
+
+class TestWarmUp(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mock = MockNetBox(rows=5)
+        self.server = TestServer(self.mock.app())
+        await self.server.start_server()
+        self.url = client.NETBOX_URL
+        client.NETBOX_URL = str(self.server.make_url("/"))
+        cache.response_cache.clear()
+        self.pending = asyncio.get_running_loop().create_future()
+        self.previous = validation._schema_index, validation._schema_checked, validation._warmup_task
+        validation._schema_index, validation._warmup_task = None, self.pending
+
+    async def asyncTearDown(self):
+        validation._schema_index, validation._schema_checked, validation._warmup_task = self.previous
+        self.pending.cancel()
+        client.NETBOX_URL = self.url
+        cache.response_cache.clear()
+        await self.server.close()
+        await client.close()
+
+    async def test_degraded_validation_while_warming_up(self):
+        url, headers, params, validated = await netbox.prepare_get("dcim/sites/", {"fields": ["name"]})
+        self.assertTrue(url.endswith("api/dcim/sites/"))
+        self.assertEqual((params, validated), ({"fields": "name", "limit": 1000}, False))
+        with self.assertRaises(ToolError):
+            await netbox.prepare_get("dcim sites/", {})
+
+        # A filter could be misspelled, NetBox would ignore it and answer with the whole table
+        filtered = asyncio.create_task(netbox.prepare_get("dcim/devices/", {"stauts": ["active"]}))
+        await asyncio.sleep(0.05)
+        self.assertFalse(filtered.done())
+        index = validation.SchemaIndex(codec.loads(self.mock.schema))
+        validation._schema_index, validation._schema_checked = index, time.monotonic()
+        self.pending.set_result(index)
+        with self.assertRaises(ToolError):
+            await filtered
+
+    async def test_unvalidated_result_not_cached(self):
+        output = await netbox.get("dcim/sites/", {})
+        self.assertEqual(output["count"], 5)
+        self.assertIsNone(cache.response_cache.get(cache.make_key("dcim/sites/", {"limit": 1000})))
+        requests = self.mock.requests
+        self.assertEqual(await netbox.count("dcim/sites/"), 5)
+        self.assertEqual(await netbox.get("dcim/sites/", {}), output)
+        self.assertEqual(self.mock.requests, requests + 2)
+
+
+class TestQueries(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mock = MockNetBox(rows=5)
+        self.server = TestServer(self.mock.app())
+        await self.server.start_server()
+        self.url = client.NETBOX_URL
+        client.NETBOX_URL = str(self.server.make_url("/"))
+        cache.response_cache.clear()
+        self.previous = validation._schema_index, validation._schema_checked
+        validation._schema_index = validation.SchemaIndex(codec.loads(self.mock.schema))
+        validation._schema_checked = time.monotonic()
+
+    async def asyncTearDown(self):
+        validation._schema_index, validation._schema_checked = self.previous
+        client.NETBOX_URL = self.url
+        cache.response_cache.clear()
+        await self.server.close()
+        await client.close()
+
+    async def test_keyed_results_with_errors(self):
+        results = await netbox.get_many({
+            "sites": ("dcim/sites/", {}),
+            "bad": ("dcim sites/", {}),
+            "devices": ("dcim/devices/", {"name": ["device-1"]}),
+        })
+        self.assertEqual(list(results), ["sites", "bad", "devices"])
+        self.assertEqual(results["sites"]["count"], 5)
+        self.assertIn("does not exist", results["bad"]["error"])
+        self.assertEqual([row["name"] for row in results["devices"]["results"]], ["device-1"])
+
+    async def test_count_and_aggregate(self):
+        self.assertEqual(await netbox.count("dcim/devices/", {"name": ["device-1", "device-2"]}), 2)
+        requests = self.mock.requests
+        self.assertEqual(await netbox.count("dcim/devices/", {"name": ["device-1", "device-2"]}), 2)
+        self.assertEqual(self.mock.requests, requests)
+
+        result = await netbox.aggregate("dcim/devices/", "site", {"limit": [2]})
+        self.assertEqual(result["count"], 5)
+        self.assertEqual(sum(group["count"] for group in result["groups"]), 5)
+        self.assertEqual(result["groups"][0], {"value": "site-2", "count": 1})
+        with self.assertRaises(ToolError):
+            await netbox.aggregate("dcim/devices/", "unknown")
+
+    async def test_revalidation(self):
+        previous = cache.response_cache.default_ttl, cache.response_cache.ttls
+        cache.response_cache.default_ttl, cache.response_cache.ttls = 0.05, {}
+        try:
+            first = await netbox.get("dcim/devices/", {})
+            await asyncio.sleep(0.1)
+            requests = self.mock.requests
+            self.assertEqual(await netbox.get("dcim/devices/", {}), first)
+            # Only the count and last_updated probe
+            self.assertEqual(self.mock.requests, requests + 1)
+
+            # Not the first row, only the probe's ordering finds it
+            self.mock.rows["dcim/devices"][2]["last_updated"] = "2026-02-01T00:00:00Z"
+            await asyncio.sleep(0.1)
+            requests = self.mock.requests
+            changed = await netbox.get("dcim/devices/", {})
+            self.assertEqual(changed["results"][2]["last_updated"], "2026-02-01T00:00:00Z")
+            self.assertEqual(self.mock.requests, requests + 2)
+
+            await netbox.get("dcim/devices/", {"fields": ["name"]})
+            self.mock.rows["dcim/devices"][3]["last_updated"] = "2026-02-02T00:00:00Z"
+            await asyncio.sleep(0.1)
+            requests = self.mock.requests
+            await netbox.get("dcim/devices/", {"fields": ["name"]})
+            # The probe that found the change stands for the one before the pages
+            self.assertEqual(self.mock.requests, requests + 2)
+
+            self.mock.etags = True
+            await netbox.get("dcim/sites/", {})
+            self.assertIn("etag", cache.response_cache.get_stale(cache.make_key("dcim/sites/", {"limit": 1000}))[1])
+            await asyncio.sleep(0.1)
+            requests = self.mock.requests
+            await netbox.get("dcim/sites/", {})
+            # A 304 to If-None-Match
+            self.assertEqual(self.mock.requests, requests + 1)
+
+            self.mock.rows["dcim/sites"][0]["name"] = "renamed"
+            await asyncio.sleep(0.1)
+            requests = self.mock.requests
+            changed = await netbox.get("dcim/sites/", {})
+            self.assertEqual(changed["results"][0]["name"], "renamed")
+            # The 200 to If-None-Match held the whole list, it isn't fetched again
+            self.assertEqual(self.mock.requests, requests + 1)
+            self.assertIn("etag", cache.response_cache.get_stale(cache.make_key("dcim/sites/", {"limit": 1000}))[1])
+        finally:
+            cache.response_cache.default_ttl, cache.response_cache.ttls = previous
+
+    async def test_hot_lists_kept_in_store(self):
+        previous = (cache.response_cache.default_ttl, cache.response_cache.ttls, store.store,
+                    store._version, store._version_checked)
+        directory = tempfile.TemporaryDirectory()
+        cache.response_cache.default_ttl, cache.response_cache.ttls = 0.05, {}
+        store.store = store.Store(os.path.join(directory.name, "store.sqlite"))
+        store._version, store._version_checked = None, None
+        try:
+            first = await netbox.get("dcim/devices/", {})
+            await netbox.get("dcim/sites/", {})
+            self.assertEqual(store.store.stats()["entries"], 0)
+            await asyncio.sleep(0.1)
+            # Asked for again past its TTL
+            await netbox.get("dcim/devices/", {})
+            self.assertEqual(store.store.stats()["entries"], 1)
+
+            # As after a restart
+            cache.response_cache.clear()
+            requests = self.mock.requests
+            self.assertEqual(await netbox.get("dcim/devices/", {}), first)
+            self.assertEqual(self.mock.requests, requests + 1)
+        finally:
+            (cache.response_cache.default_ttl, cache.response_cache.ttls, store.store,
+             store._version, store._version_checked) = previous
+            directory.cleanup()
+
+
+class TestBulk(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mock = MockNetBox(rows=5)
+        self.server = TestServer(self.mock.app())
+        await self.server.start_server()
+        self.previous = (client.NETBOX_URL, netbox.NETBOX_BULK_CHUNK_SIZE, validation._schema_index,
+                         validation._schema_checked, replica.replicas)
+        client.NETBOX_URL = str(self.server.make_url("/"))
+        netbox.NETBOX_BULK_CHUNK_SIZE = 2
+        validation._schema_index = validation.SchemaIndex(codec.loads(self.mock.schema))
+        validation._schema_checked = time.monotonic()
+        self.replica = replica.Replica("dcim/devices/")
+        replica.replicas = {"dcim/devices/": self.replica}
+        cache.response_cache.clear()
+
+    async def asyncTearDown(self):
+        (client.NETBOX_URL, netbox.NETBOX_BULK_CHUNK_SIZE, validation._schema_index,
+         validation._schema_checked, replica.replicas) = self.previous
+        cache.response_cache.clear()
+        await self.server.close()
+        await client.close()
+
+    async def test_create_in_chunks(self):
+        items = [{"name": f"new-{i}"} for i in range(5)]
+        del items[3]["name"]
+        requests = self.mock.requests
+        report = await netbox.bulk("POST", "dcim/devices/", items)
+        self.assertEqual(self.mock.requests, requests + 3)
+        self.assertEqual((report["total"], report["succeeded"], report["failed"]), (5, 3, 2))
+        results = report["results"]
+        self.assertEqual([entry["index"] for entry in results], [0, 1, 2, 3, 4])
+        self.assertEqual([entry.get("id") for entry in results], [6, 7, None, None, 8])
+        # NetBox rolls back the whole chunk, the valid item is reported as not applied
+        self.assertEqual(results[2]["error"], "Not applied, another object in the same chunk failed")
+        self.assertEqual(results[3]["error"], {"name": ["This field is required."]})
+        self.assertEqual(len(self.mock.rows["dcim/devices"]), 8)
+
+    async def test_update_and_delete(self):
+        report = await netbox.bulk("PATCH", "dcim/devices/", [
+            {"id": 1, "name": "renamed-1"}, {"id": 2, "name": "renamed-2"},
+            {"id": 3, "name": "renamed-3"}, {"id": 99, "name": "missing"},
+        ])
+        self.assertEqual([entry["success"] for entry in report["results"]], [True, True, False, False])
+        self.assertEqual([entry.get("id") for entry in report["results"]], [1, 2, None, None])
+        # An error that names no item is reported for the whole chunk
+        self.assertEqual(report["results"][2]["error"], report["results"][3]["error"])
+        self.assertIn("Objects not found", report["results"][3]["error"]["detail"])
+        self.assertEqual(self.mock.rows["dcim/devices"][2]["name"], "device-3")
+
+        report = await netbox.bulk("DELETE", "dcim/devices/", [{"id": 4}, {"id": 5}])
+        self.assertEqual([entry.get("id") for entry in report["results"]], [4, 5])
+        self.assertEqual([row["id"] for row in self.mock.rows["dcim/devices"]], [1, 2, 3])
+
+    async def test_invalidation(self):
+        key = cache.make_key("dcim/devices/", {"limit": 1000})
+        cache.response_cache.set(key, {"count": 0, "results": []})
+        report = await netbox.bulk("POST", "dcim/devices/", [{}])
+        self.assertEqual(report["failed"], 1)
+        # Even a failed write may have been applied in part
+        self.assertIsNone(cache.response_cache.get(key))
+        self.assertEqual(self.replica.writes, 1)
+
+        client.NETBOX_URL = "http://127.0.0.1:1/"
+        cache.response_cache.set(key, {"count": 0, "results": []})
+        report = await netbox.bulk("POST", "dcim/devices/", [{"name": "unsent"}])
+        self.assertEqual(report["failed"], 1)
+        self.assertIsNone(cache.response_cache.get(key))
+        self.assertEqual(self.replica.writes, 2)
+
+    async def test_invalid_method(self):
+        with self.assertRaises(ToolError):
+            await netbox.bulk("POST", "dcim/devices/1/", [{"name": "x"}])
@@ -0,0 +1,131 @@
+import time
+import unittest
+
+from aiohttp.test_utils import TestServer
+
+import cache
+import client
+import replica
+from bench.mock_netbox import MockNetBox
+
+
+def device(record_id, name, site, status="active", tenant=None):
+    return {
+        "id": record_id,
+        "name": name,
+        "status": {"value": status, "label": status.title()},
+        "site": {"id": site, "slug": f"site-{site}"},
+        "tenant": tenant,
+        "tags": [],
+        "description": "",
+    }
+
+
+class TestReplicaQuery(unittest.TestCase):
+    def setUp(self):
+        self.replica = replica.Replica("dcim/devices/")
+        self.replica.load([
+            device(1, "core-1", 1),
+            device(2, "core-2", 2, status="planned"),
+            device(3, "edge-1", 1),
+        ])
+
+    def ids(self, params):
+        result = self.replica.query(params)
+        return None if result is None else [record["id"] for record in result["results"]]
+
+    def test_exact_filters(self):
+        self.assertEqual(self.ids({"site": "site-1", "limit": 1000}), [1, 3])
+        self.assertEqual(self.ids({"site_id": ["1"], "status": ["active"]}), [1, 3])
+        self.assertEqual(self.ids({"name": ["core-2", "edge-1"]}), [2, 3])
+        self.assertEqual(self.ids({"name": ["missing"]}), [])
+
+    def test_lookups_and_fields(self):
+        self.assertEqual(self.ids({"name__ic": ["CORE"]}), [1, 2])
+        self.assertEqual(self.ids({"name__n": ["core-1"]}), [2, 3])
+        result = self.replica.query({"name__isw": ["edge"], "fields": "id,name"})
+        self.assertEqual(result, {"count": 1, "results": [{"id": 3, "name": "edge-1"}]})
+
+    def test_negated_lookups_keep_null_fields(self):
+        self.replica.load([
+            device(1, "core-1", 1, tenant={"id": 1, "slug": "acme"}),
+            device(2, "core-2", 1),
+        ])
+        self.assertEqual(self.ids({"tenant__n": ["acme"]}), [2])
+        self.assertEqual(self.ids({"tenant__nic": ["acm"]}), [2])
+        self.assertEqual(self.ids({"tenant__nie": ["ACME"]}), [2])
+        self.assertEqual(self.ids({"tenant__ic": ["acm"]}), [1])
+
+    def test_passes_through(self):
+        # Unknown slugs get NetBox's list of valid choices, the rest can't be evaluated locally
+        self.assertIsNone(self.ids({"site": ["site-9"]}))
+        self.assertIsNone(self.ids({"q": ["core"]}))
+        self.assertIsNone(self.ids({"description": [""]}))
+        self.assertIsNone(self.ids({"tenant": ["acme"]}))
+        self.assertIsNone(self.ids({"name__regex": ["^c"]}))
+        self.assertIsNone(self.ids({"brief": ["1"]}))
+
+    def test_changes_drop_indexes(self):
+        self.assertEqual(self.ids({"status": ["planned"]}), [2])
+        self.replica.upsert(device(3, "edge-1", 1, status="planned"))
+        self.replica.remove(2)
+        self.assertEqual(self.ids({"status": ["planned"]}), [3])
+
+    def test_stale_after_another_workers_write(self):
+        self.replica.synced = time.monotonic()
+        self.replica.synced_writes = self.replica.write_stamp()
+        self.assertTrue(self.replica.fresh())
+        # Bumped through the shared cache file by a write in another worker
+        cache.response_cache.generation += 1
+        self.assertFalse(self.replica.fresh())
+
+
+class TestReplicaSync(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mock = MockNetBox(rows=20)
+        self.server = TestServer(self.mock.app())
+        await self.server.start_server()
+        self.url = client.NETBOX_URL
+        client.NETBOX_URL = str(self.server.make_url("/"))
+        self.replica = replica.Replica("dcim/devices/")
+
+    async def asyncTearDown(self):
+        client.NETBOX_URL = self.url
+        await self.server.close()
+        await client.close()
+
+    async def test_seed_and_changelog(self):
+        changelog, head = await replica._changelog_head()
+        self.assertEqual((changelog, head), ("core/object-changes/", 0))
+        await replica.seed(self.replica)
+        self.assertEqual(len(self.replica.records), 20)
+
+        rows = self.mock.rows["dcim/devices"]
+        rows[0]["name"] = "renamed"
+        self.mock.log_changes("dcim/devices", "update", [rows[0]])
+        self.mock.log_changes("dcim/devices", "delete", [rows.pop()])
+        self.mock.log_changes("dcim/sites", "update", [self.mock.rows["dcim/sites"][0]])
+        previous = replica.replicas
+        replica.replicas = {"dcim/devices/": self.replica}
+        try:
+            head = await replica.sync_changelog(changelog, head, {"dcim.device": "dcim/devices/"})
+        finally:
+            replica.replicas = previous
+        self.assertEqual(head, 3)
+        self.assertEqual(len(self.replica.records), 19)
+        self.assertEqual(self.replica.query({"name": ["renamed"]})["count"], 1)
+
+    async def test_periodic_reseed(self):
+        await replica.seed(self.replica)
+        # Nested related data changes without a changelog entry of the device
+        self.mock.rows["dcim/devices"][0]["site"] = {"id": 1, "slug": "renamed-site"}
+        previous = replica.replicas
+        replica.replicas = {"dcim/devices/": self.replica}
+        try:
+            await replica.reseed_expired()
+            self.assertIsNone(self.replica.query({"site": ["renamed-site"]}))
+            self.replica.seeded -= replica.NETBOX_REPLICA_RESEED_INTERVAL + 1
+            await replica.reseed_expired()
+        finally:
+            replica.replicas = previous
+        self.assertEqual(self.replica.query({"site": ["renamed-site"]})["count"], 1)
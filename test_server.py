@@ -0,0 +1,106 @@
+import time
+import unittest
+
+import cache
+import client
+import codec
+import netbox
+import server
+import validation
+
+from aiohttp.test_utils import TestServer
+from bench.mock_netbox import MockNetBox, make_rows
+from fastmcp.exceptions import ToolError
+from types import SimpleNamespace
+
+
+class TestTools(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mock = MockNetBox(rows=5)
+        self.server = TestServer(self.mock.app())
+        await self.server.start_server()
+        self.previous = client.NETBOX_URL, validation._schema_index, validation._schema_checked
+        client.NETBOX_URL = str(self.server.make_url("/"))
+        validation._schema_index = validation.SchemaIndex(codec.loads(self.mock.schema))
+        validation._schema_checked = time.monotonic()
+        cache.response_cache.clear()
+
+    async def asyncTearDown(self):
+        client.NETBOX_URL, validation._schema_index, validation._schema_checked = self.previous
+        cache.response_cache.clear()
+        await self.server.close()
+        await client.close()
+
+    async def test_bulk_tools(self):
+        report = await server.create_resources("/api/dcim/devices", [{"name": "new-1"}, {"name": "new-2"}])
+        self.assertEqual([entry["id"] for entry in report["results"]], [6, 7])
+        with self.assertRaises(ToolError):
+            await server.update_resources("dcim/devices/", [{"id": 6, "name": "renamed"}, {"name": "no id"}])
+        self.assertEqual(self.mock.rows["dcim/devices"][5]["name"], "new-1")
+        report = await server.update_resources("dcim/devices/", [{"id": 6, "name": "renamed"}])
+        self.assertEqual(report["succeeded"], 1)
+        report = await server.delete_resources("dcim/devices/", [6, 7])
+        self.assertEqual([entry["id"] for entry in report["results"]], [6, 7])
+        self.assertEqual(len(self.mock.rows["dcim/devices"]), 5)
+
+    async def test_stream_truncation(self):
+        self.mock.rows["dcim/devices"] = make_rows("dcim/devices", 100, 64)
+        requests = self.mock.requests
+        output = await server.get_resources("dcim/devices/", max_rows=10)
+        self.assertEqual((len(output["results"]), output["count"], output["truncated"]), (10, 100, True))
+        # The first page held the budget, no other page was fetched
+        self.assertEqual(self.mock.requests, requests + 1)
+
+        previous = netbox.NETBOX_PAGE_CONCURRENCY
+        netbox.NETBOX_PAGE_CONCURRENCY = 1
+        try:
+            requests = self.mock.requests
+            record_size = cache.estimate_size(self.mock.rows["dcim/devices"][0])
+            output = await server.get_resources("dcim/devices/", "limit=10", max_bytes=15 * record_size)
+        finally:
+            netbox.NETBOX_PAGE_CONCURRENCY = previous
+        self.assertTrue(output["truncated"])
+        self.assertLess(len(output["results"]), 20)
+        self.assertGreaterEqual(len(output["results"]), 10)
+        # The page after the one over budget at most was started, then cancelled
+        self.assertLessEqual(self.mock.requests, requests + 3)
+
+        output = await server.get_resources("dcim/devices/", max_rows=200)
+        self.assertEqual((len(output["results"]), output["truncated"]), (100, False))
+
+    async def test_batch(self):
+        output = await server.get_resources_batch([
+            server.BatchRequest(resource="dcim/sites", query_string="limit=2", key="sites"),
+            server.BatchRequest(resource="dcim/sites", query_string="limit=2", key="sites"),
+            server.BatchRequest(resource="dcim/devices/", query_string="name=device-1", compact=True),
+            server.BatchRequest(resource="dcim/nothing/"),
+            server.BatchRequest(resource="dcim/devices/", query_string="bogus=1"),
+        ])
+        self.assertEqual((output["total"], output["succeeded"], output["failed"]), (5, 3, 2))
+        results = output["results"]
+        self.assertEqual([result["index"] for result in results], [0, 1, 2, 3, 4])
+        # Duplicates are answered each, not collapsed by key
+        self.assertEqual(results[0]["key"], results[1]["key"])
+        self.assertEqual(results[0]["results"], results[1]["results"])
+        self.assertEqual(results[2]["key"], "dcim/devices/?name=device-1")
+        self.assertIn("bytes_saved", results[2])
+        self.assertIn("error", results[3])
+        self.assertIn("bogus", results[4]["error"])
+
+    async def test_batch_schema(self):
+        tool = await server.mcp.get_tool("get_resources_batch")
+        schema = codec.dumps_text(tool.parameters)
+        for name in ("resource", "query_string", "compact", "key"):
+            self.assertIn(name, schema)
+
+    async def test_metrics_route(self):
+        local = SimpleNamespace(client=SimpleNamespace(host="127.0.0.1"))
+        remote = SimpleNamespace(client=SimpleNamespace(host="10.0.0.5"))
+        self.assertEqual((await server.get_metrics(local)).status_code, 200)
+        self.assertEqual((await server.get_metrics(remote)).status_code, 404)
+        previous = server.NETBOX_METRICS
+        server.NETBOX_METRICS = "public"
+        try:
+            self.assertEqual((await server.get_metrics(remote)).status_code, 200)
+        finally:
+            server.NETBOX_METRICS = previous
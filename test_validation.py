@@ -1,7 +1,16 @@
+import os
 import asyncio
+import tempfile
 import unittest
 
+import client
 import netbox
+import store
+import validation
+import schema_artifact
+
+from aiohttp.test_utils import TestServer
+from bench.mock_netbox import MockNetBox
 
 class TestValidation(unittest.IsolatedAsyncioTestCase):
     async def test_invalid_path(self):
@@ -22,4 +31,202 @@ class TestValidation(unittest.IsolatedAsyncioTestCase):
         invalid_params = {"invalid_param": "value"}
         with self.assertRaises(ValueError) as context:
             await netbox.get(valid_path, params=invalid_params)
-            self.assertIn("Invalid query parameters", str(context.exception))
\ No newline at end of file
+            self.assertIn("Invalid query parameters", str(context.exception))
+
+SCHEMA = {
+    "paths": {
+        "/api/dcim/devices/": {
+            "get": {"parameters": [{"name": "name"}, {"name": "name__ic"}, {"name": "site"}]},
+            "post": {},
+            "parameters": [],
+        },
+    }
+}
+
+class TestSchemaIndex(unittest.IsolatedAsyncioTestCase):
+    def test_index(self):
+        index = validation.SchemaIndex(SCHEMA)
+        path_index = index.paths["/api/dcim/devices/"]
+        self.assertEqual(path_index.methods, {"get", "post"})
+        self.assertEqual(path_index.params, {"name", "name__ic", "site"})
+        self.assertEqual(path_index.lookups, {"name": {"ic"}})
+
+    async def test_validate_with_index(self):
+        index = validation.SchemaIndex(SCHEMA)
+        await validation.validate_path(index, "/api/dcim/devices/")
+        await validation.validate_query_params(index, "/api/dcim/devices/", {"name__ic": ["a"], "fields": ["name"]})
+        await validation.validate_method(index, "/api/dcim/devices/", "POST")
+        with self.assertRaises(ValueError):
+            await validation.validate_method(index, "/api/dcim/devices/", "DELETE")
+        with self.assertRaises(ValueError):
+            await validation.validate_path(index, "/api/dcim/invalid/")
+        with self.assertRaises(ValueError):
+            await validation.validate_query_params(index, "/api/dcim/devices/", {"invalid_param": ["a"]})
+
+    async def test_query_param_errors(self):
+        index = validation.SchemaIndex(SCHEMA)
+        with self.assertRaises(ValueError) as context:
+            await validation.validate_query_params(index, "/api/dcim/devices/", {"nmae": ["a"], "name__nic": ["a"], "site__ic": ["a"]})
+        message = str(context.exception)
+        self.assertIn("'nmae' is not a query parameter of '/api/dcim/devices/', did you mean ['name']?", message)
+        self.assertIn("'name__nic': lookup 'nic' is not supported for 'name', supported lookups: ['ic']", message)
+        self.assertIn("'site__ic': lookup 'ic' is not supported for 'site', supported lookups: []", message)
+        self.assertIs(validation.param_validator(index, "/api/dcim/devices/"), validation.param_validator(index, "/api/dcim/devices/"))
+        self.assertEqual(validation.param_validator(index, "/api/dcim/devices/").describe(), {"name": ["ic"], "site": []})
+
+    async def test_path_error(self):
+        index = validation.SchemaIndex({"paths": {f"/api/dcim/{name}/": {"get": {}} for name in ["devices", "sites", "racks", "regions"]}})
+        with self.assertRaises(ValueError) as context:
+            await validation.validate_path(index, "/api/dcim/devcies/")
+        self.assertEqual(
+            str(context.exception),
+            f"Path '/api/dcim/devcies/' does not exist, did you mean ['/api/dcim/devices/']?\n{validation.LIST_PATHS_HINT}",
+        )
+        self.assertIs(validation.path_error(index, "/api/dcim/devcies/"), validation.path_error(index, "/api/dcim/devcies/"))
+
+    def test_ngram_suggestions(self):
+        suggestions = validation.NgramIndex(["name", "name__ic", "site", "site_id", "status"])
+        self.assertEqual(suggestions.suggest("stie_id"), ["site_id"])
+        self.assertEqual(suggestions.suggest("nam__ic"), ["name__ic"])
+        self.assertEqual(suggestions.suggest("zzz"), [])
+
+    def test_choices_and_related(self):
+        def list_path(component):
+            return {"get": {
+                "parameters": [{"name": "status", "schema": {"type": "array", "items": {"type": "string", "enum": ["active", "planned"]}}}],
+                "responses": {"200": {"content": {"application/json": {"schema": {"$ref": f"#/components/schemas/Paginated{component}List"}}}}},
+            }}
+
+        def page(component):
+            return {"properties": {"results": {"type": "array", "items": {"$ref": f"#/components/schemas/{component}"}}}}
+
+        schema = {
+            "paths": {
+                "/api/dcim/devices/": list_path("DeviceWithConfigContext"),
+                "/api/dcim/sites/": list_path("Site"),
+            },
+            "components": {"schemas": {
+                "PaginatedDeviceWithConfigContextList": page("DeviceWithConfigContext"),
+                "PaginatedSiteList": page("Site"),
+                "DeviceWithConfigContext": {"properties": {
+                    "site": {"allOf": [{"$ref": "#/components/schemas/BriefSite"}]},
+                    "airflow": {"$ref": "#/components/schemas/DeviceAirflow"},
+                    "face": {"enum": ["front", "rear", "", None]},
+                }},
+                "DeviceAirflow": {"properties": {"value": {"enum": ["front-to-rear", "rear-to-front"]}}},
+                "Site": {"properties": {"slug": {"type": "string"}}},
+                "BriefSite": {"properties": {"slug": {"type": "string"}}},
+            }},
+        }
+        path_index = validation.SchemaIndex(schema).paths["/api/dcim/devices/"]
+        self.assertEqual(path_index.choices, {
+            "status": ("active", "planned"),
+            "airflow": ("front-to-rear", "rear-to-front"),
+            "face": ("front", "rear"),
+        })
+        self.assertEqual(path_index.related, {"site": "/api/dcim/sites/"})
+
+    async def test_mapped_artifact(self):
+        schema = {"paths": {
+            **SCHEMA["paths"],
+            "/api/dcim/sites/": {"get": {"parameters": [
+                {"name": "status", "schema": {"type": "array", "items": {"type": "string", "enum": ["active", "planned"]}}},
+            ]}},
+        }}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "schema.idx")
+            schema_artifact.write(validation.SchemaIndex(schema), path, mtime=42)
+            index = schema_artifact.MappedSchemaIndex(path)
+            self.assertEqual(index.mtime, 42)
+            self.assertEqual(sorted(index.paths), ["/api/dcim/devices/", "/api/dcim/sites/"])
+            path_index = index.paths["/api/dcim/devices/"]
+            self.assertEqual(path_index.methods, {"get", "post"})
+            self.assertEqual(path_index.params, {"name", "name__ic", "site"})
+            self.assertEqual(path_index.lookups, {"name": {"ic"}})
+            self.assertEqual(index.paths["/api/dcim/sites/"].choices, {"status": ("active", "planned")})
+            self.assertNotIn("/api/dcim/", index.paths)
+            self.assertNotIn("status", path_index.params)
+            await validation.validate_path(index, "/api/dcim/devices/")
+            await validation.validate_query_params(index, "/api/dcim/devices/", {"name__ic": ["a"]})
+            with self.assertRaises(ValueError):
+                await validation.validate_query_params(index, "/api/dcim/devices/", {"name__nic": ["a"]})
+
+
+class TestSchemaRevalidation(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mock = MockNetBox(rows=5, etags=True)
+        self.server = TestServer(self.mock.app())
+        await self.server.start_server()
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous = client.NETBOX_URL, validation.SCHEMA_FILE, validation.SCHEMA_VALIDATORS_FILE
+        client.NETBOX_URL = str(self.server.make_url("/"))
+        validation.SCHEMA_FILE = os.path.join(self.directory.name, "schema.json")
+        validation.SCHEMA_VALIDATORS_FILE = os.path.join(self.directory.name, "schema.validators.json")
+
+    async def asyncTearDown(self):
+        client.NETBOX_URL, validation.SCHEMA_FILE, validation.SCHEMA_VALIDATORS_FILE = self.previous
+        self.directory.cleanup()
+        await self.server.close()
+        await client.close()
+
+    async def test_not_modified(self):
+        schema = await validation.get_schema()
+        mtime = os.stat(validation.SCHEMA_FILE).st_mtime_ns
+        self.assertIn("etag", validation._read_validators())
+        requests = self.mock.requests
+        self.assertEqual(await validation.get_schema(revalidate=True), schema)
+        self.assertEqual(self.mock.requests, requests + 1)
+        self.assertEqual(os.stat(validation.SCHEMA_FILE).st_mtime_ns, mtime)
+
+        self.mock.schema = self.mock.schema.replace(b'"paths"', b'"info": {}, "paths"', 1)
+        changed = await validation.get_schema(revalidate=True)
+        self.assertEqual(changed["info"], {})
+        self.assertNotEqual(os.stat(validation.SCHEMA_FILE).st_mtime_ns, mtime)
+        # Both files are swapped in whole, no temp file is left behind
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["schema.json", "schema.validators.json"])
+
+    async def test_cold_start_downloads_once(self):
+        previous = validation.SCHEMA_INDEX_FILE, validation._schema_index, validation._schema_checked, validation._warmup_task
+        validation.SCHEMA_INDEX_FILE = os.path.join(self.directory.name, "schema.idx")
+        validation._schema_index, validation._warmup_task = None, None
+        try:
+            requests = self.mock.requests
+            validation.start_warm_up()
+            indexes = await asyncio.gather(validation.get_schema_index(), validation.get_schema_index())
+            # Both callers awaited the warm-up's build instead of downloading again
+            self.assertEqual(self.mock.requests, requests + 1)
+            self.assertIs(indexes[0], indexes[1])
+            self.assertIn("/api/dcim/devices/", indexes[0].paths)
+            self.assertFalse([name for name in os.listdir(self.directory.name) if name.endswith(".tmp")])
+        finally:
+            validation.SCHEMA_INDEX_FILE, validation._schema_index, validation._schema_checked, validation._warmup_task = previous
+
+    async def test_restored_from_store(self):
+        previous = store.store, store._version, store._version_checked
+        store.store = store.Store(os.path.join(self.directory.name, "store.sqlite"))
+        store._version, store._version_checked = None, None
+        try:
+            schema = await validation.get_schema()
+            # A redeployed container starts without schema.json
+            os.remove(validation.SCHEMA_FILE)
+            requests = self.mock.requests
+            self.assertEqual(await validation.get_schema(), schema)
+            self.assertEqual(self.mock.requests, requests)
+            self.assertTrue(os.path.exists(validation.SCHEMA_FILE))
+            self.assertIn("etag", validation._read_validators())
+
+            # Not served to another NetBox version
+            os.remove(validation.SCHEMA_FILE)
+            self.mock.version = "4.3.0-mock"
+            await store.fetch_version()
+            self.assertIsNone(await store.load_raw("openapi", "schema"))
+
+            # A failing /api/status/ is not read again before NETBOX_STORE_VERSION_RETRY
+            client.NETBOX_URL = f"{client.NETBOX_URL}missing/"
+            store._version, store._version_checked = None, None
+            self.assertIsNone(await store.load_raw("openapi", "schema"))
+            checked = store._version_checked
+            self.assertIsNone(await store.load_raw("openapi", "schema"))
+            self.assertEqual(store._version_checked, checked)
+        finally:
+            store.store, store._version, store._version_checked = previous
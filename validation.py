@@ -1,69 +1,471 @@
 import os
-import aiohttp
-import json
+import time
+import asyncio
+import logging
+import weakref
+import client
+import codec
 import aiofiles
+import store
+import schema_artifact
 
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import cached_property
+from typing import NamedTuple
 
-NETBOX_URL = os.environ.get("NETBOX_URL") or "http://netbox:8080/"
 
-async def get_schema():
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = os.environ.get("NETBOX_SCHEMA_FILE") or "schema.json"
+# Compiled, memory-mapped form of SCHEMA_FILE, rebuilt whenever it changes
+SCHEMA_INDEX_FILE = os.environ.get("NETBOX_SCHEMA_INDEX_FILE") or f"{os.path.splitext(SCHEMA_FILE)[0]}.idx"
+SCHEMA_CHECK_INTERVAL = float(os.environ.get("NETBOX_SCHEMA_CHECK_INTERVAL") or 5)
+# ETag/Last-Modified schema.json was downloaded with, sent back when revalidating it
+SCHEMA_VALIDATORS_FILE = f"{os.path.splitext(SCHEMA_FILE)[0]}.validators.json"
+# How often schema.json is revalidated against NetBox, 0 never revalidates it
+SCHEMA_REFRESH_INTERVAL = float(os.environ.get("NETBOX_SCHEMA_REFRESH_INTERVAL") or 3600)
+
+# Query params NetBox accepts on every list endpoint without listing them in the schema
+UNVALIDATED_PARAMS = frozenset(["fields", "brief"])
+# Errors carry a few suggestions, the full lists are only sent when asked for
+LIST_PATHS_HINT = "Call list_resource_parameters without a resource to list every API path"
+LIST_PARAMS_HINT = "Call list_resource_parameters with the resource to list its parameters and lookups"
+ERROR_CACHE_SIZE = 1024
+HTTP_METHODS = frozenset(["get", "put", "post", "patch", "delete", "head", "options"])
+MODEL_ASSESORS = frozenset(['site', 'manufacturer', 'cluster_group', 'device_type',
+                            'device','tenant',  'contact', 'group', 'role', 'platform', 'location',
+                            'rack', 'region', 'type', 'provider', 'circuit', 'virtual_circuit',
+                            'power_panel', 'power_port', 'power_feed', 'module_type', 'module',
+                            'interface', 'front_port', 'rear_port', 'console_port', 'console_server_port',
+                            'cluster', 'virtual_device_context', 'vrf', 'vlan', 'prefix', 'aggregate',
+                            'asn', 'asn_range', 'fhrp_group', 'ip_address', 'ip_range',
+                            'service', 'device_role', 'rack_role', 
+                            'circuit_type', 'virtual_circuit_type',])
+
+
+class PathIndex(NamedTuple):
+    methods: frozenset
+    params: frozenset
+    lookups: dict
+    choices: dict
+    related: dict
+
+
+def _ref_name(node):
+    if "$ref" in node:
+        return node["$ref"].rsplit("/", 1)[-1]
+    for key in ("allOf", "oneOf", "anyOf"):
+        for item in node.get(key, []):
+            if "$ref" in item:
+                return item["$ref"].rsplit("/", 1)[-1]
+    return None
+
+
+def _list_component(operations, components):
+    """Return the component name of the rows a list GET returns, if any."""
+    try:
+        response = operations["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        page = components[_ref_name(response)]
+        return _ref_name(page["properties"]["results"]["items"])
+    except (KeyError, TypeError):
+        return None
+
+
+def _enum(node):
+    values = node.get("enum") or node.get("items", {}).get("enum")
+    if values:
+        return tuple(value for value in values if value not in (None, ""))
+    return None
+
+
+class SchemaIndex:
+    """Lookup tables precomputed from the OpenAPI document.
+
+    ``paths`` maps every API path to its allowed methods, the names of its GET
+    query parameters and, per base field name, the lookup suffixes NetBox
+    accepts (``name`` -> ``{"ic", "n", ...}``). ``choices`` holds the enum
+    values of choice fields and ``related`` the list path of the model a
+    slug-addressed foreign key points to.
+    """
+
+    def __init__(self, schema, mtime=None):
+        self.mtime = mtime
+        self.paths = {}
+        components = schema.get("components", {}).get("schemas", {})
+        row_components = {}
+        list_paths = {}
+        for path, operations in schema.get("paths", {}).items():
+            component = _list_component(operations, components)
+            if component is not None:
+                row_components[path] = component
+                list_paths.setdefault(component, path)
+        for path, operations in schema.get("paths", {}).items():
+            names = []
+            choices = {}
+            for param in operations.get("get", {}).get("parameters", []):
+                if "name" not in param:
+                    continue
+                names.append(param["name"])
+                values = _enum(param.get("schema", {}))
+                if values:
+                    choices[param["name"]] = values
+            lookups = {}
+            for name in names:
+                base, separator, suffix = name.partition("__")
+                if separator:
+                    lookups.setdefault(base, set()).add(suffix)
+            related = {}
+            properties = components.get(row_components.get(path), {}).get("properties", {})
+            for field, node in properties.items():
+                node = node.get("items", node)
+                values = _enum(node)
+                ref = _ref_name(node)
+                target = components.get(ref, {}).get("properties", {})
+                if values is None and "value" in target:
+                    values = _enum(target["value"])
+                if values:
+                    choices.setdefault(field, values)
+                elif ref is not None:
+                    model = ref.removeprefix("Brief").removeprefix("Nested")
+                    related_path = list_paths.get(model) or list_paths.get(f"{model}WithConfigContext")
+                    if related_path is not None and "slug" in components[row_components[related_path]].get("properties", {}):
+                        related[field] = related_path
+            self.paths[path] = PathIndex(
+                methods=frozenset(method for method in operations if method in HTTP_METHODS),
+                params=frozenset(names),
+                lookups={base: frozenset(suffixes) for base, suffixes in lookups.items()},
+                choices=choices,
+                related=related,
+            )
+
+
+_schema_index = None
+_schema_checked = 0.0
+_warmup_task = None
+
+
+async def get_schema(revalidate=False):
+    """Return the OpenAPI document, from schema.json, the store or downloaded from NetBox when missing.
+
+    With ``revalidate`` an existing schema.json is checked against NetBox,
+    sending back the ``ETag``/``Last-Modified`` it was downloaded with, and
+    only rewritten when NetBox sends a changed document.
+    """
     # Try to read from local schema.json file first
+    if not revalidate:
+        try:
+            async with aiofiles.open(SCHEMA_FILE, "rb") as f:
+                return codec.loads(await f.read())
+        except FileNotFoundError:
+            pass
+        # A redeployed container has lost schema.json, the store kept it for this NetBox version
+        body = await store.load_raw("openapi", "schema")
+        if body is not None:
+            await write_file(SCHEMA_FILE, body)
+            await write_file(SCHEMA_VALIDATORS_FILE, codec.dumps(await store.load("openapi", "validators") or {}))
+            logger.info(f"validation.get_schema restored {len(body)} bytes from the store")
+            return codec.loads(body)
+    # If file doesn't exist, make the HTTP request
+    headers = {
+        "Accept": "application/json",
+    }
+    validators = _read_validators() if _schema_mtime() is not None else None
+    if validators:
+        headers = client.conditional_headers(headers, validators)
+    url = f"{client.NETBOX_URL.rstrip('/')}/api/schema/"
+    async with client.request("GET", url, headers=headers) as response:
+        if response.status == 304:
+            body = None
+        else:
+            response.raise_for_status()
+            body = await codec.read_body(response)
+            validators = client.http_validators(response.headers)
+    current = None
+    if _schema_mtime() is not None:
+        async with aiofiles.open(SCHEMA_FILE, "rb") as f:
+            current = await f.read()
+    if body is not None and body != current:
+        # Save the schema to file for future use, as received without re-encoding it
+        await write_file(SCHEMA_FILE, body)
+    if body is not None:
+        await write_file(SCHEMA_VALIDATORS_FILE, codec.dumps(validators or {}))
+    if body is None or body == current:
+        # Left untouched, its mtime keeps the compiled index current
+        logger.info(f"validation.get_schema {url} unchanged")
+        return codec.loads(current)
+    await store.save_raw("openapi", "schema", body)
+    await store.save("openapi", "validators", validators or {})
+    logger.info(f"validation.get_schema downloaded {len(body)} bytes from {url}")
+    return codec.loads(body)
+
+
+async def write_file(path, body):
+    """Write next to the final name and swap the file in atomically, a concurrent
+    reader or another worker never sees it half written."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    async with aiofiles.open(tmp, "wb") as f:
+        await f.write(body)
+    os.replace(tmp, path)
+
+
+def _read_validators():
+    try:
+        with open(SCHEMA_VALIDATORS_FILE, "rb") as f:
+            return codec.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+async def refresh_forever():
+    """Revalidate schema.json against NetBox every ``SCHEMA_REFRESH_INTERVAL``
+    seconds, run for the server lifetime. A rewritten file is picked up by
+    ``get_schema_index`` from its mtime."""
+    if SCHEMA_REFRESH_INTERVAL <= 0:
+        return
+    while True:
+        await asyncio.sleep(SCHEMA_REFRESH_INTERVAL)
+        try:
+            await get_schema(revalidate=True)
+        except Exception as e:
+            logger.error(f"validation.refresh_forever failed with reason {e}")
+
+
+def _schema_mtime():
     try:
-        async with aiofiles.open("schema.json", "r") as f:
-            content = await f.read()
-            return json.loads(content)
+        return os.stat(SCHEMA_FILE).st_mtime_ns
     except FileNotFoundError:
-        # If file doesn't exist, make the HTTP request
-        headers = {
-            "Accept": "application/json",
-        }
-        url = f"{NETBOX_URL.rstrip('/')}/api/schema/"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                schema_data = await response.json()
-                
-                # Save the schema to file for future use
-                async with aiofiles.open("schema.json", "w") as f:
-                    await f.write(json.dumps(schema_data, indent=2))
-                
-                return schema_data
+        return None
+
+
+def _map_index(mtime):
+    """Return the artifact of the schema.json with this mtime, None when missing or stale."""
+    try:
+        index = schema_artifact.MappedSchemaIndex(SCHEMA_INDEX_FILE)
+    except (FileNotFoundError, ValueError):
+        return None
+    return index if index.mtime == mtime else None
+
+
+def _compile_index(schema, mtime):
+    index = SchemaIndex(schema, mtime)
+    try:
+        schema_artifact.write(index, SCHEMA_INDEX_FILE, mtime)
+        return schema_artifact.MappedSchemaIndex(SCHEMA_INDEX_FILE)
+    except OSError:
+        # Read-only directory, keep serving from memory
+        return index
+
+
+def _load_index(mtime):
+    with open(SCHEMA_FILE, "rb") as f:
+        return _compile_index(codec.loads(f.read()), mtime)
+
+
+async def get_schema_index():
+    """Return the schema index, mapping the compiled artifact of schema.json and
+    recompiling it when schema.json changes.
+
+    The file is stat'ed at most every ``SCHEMA_CHECK_INTERVAL`` seconds and a
+    rebuilt index replaces the previous one in a single assignment, so callers
+    always see a complete index. Concurrent callers await the one check or
+    build in progress, the startup warm-up's included, so a cold start
+    downloads the schema once.
+    """
+    if _schema_index is not None and time.monotonic() - _schema_checked < SCHEMA_CHECK_INTERVAL:
+        return _schema_index
+    if _warmup_task is None or _warmup_task.done():
+        start_warm_up()
+    # Shielded, a cancelled caller doesn't cancel the build the others wait for
+    return await asyncio.shield(_warmup_task)
+
+
+async def _build_index():
+    global _schema_index, _schema_checked
+    _schema_checked = time.monotonic()
+    mtime = _schema_mtime()
+    if _schema_index is not None and (mtime is None or mtime == _schema_index.mtime):
+        return _schema_index
+    if mtime is None:
+        schema = await get_schema()
+        _schema_index = await asyncio.to_thread(_compile_index, schema, _schema_mtime())
+        return _schema_index
+    # Mapping an up to date artifact reads its header only
+    index = _map_index(mtime)
+    if index is None:
+        # Parsing a multi-megabyte document would otherwise stall the event loop
+        index = await asyncio.to_thread(_load_index, mtime)
+    _schema_index = index
+    return _schema_index
+
+
+def start_warm_up():
+    """Build the schema index in the background, from the server lifespan."""
+    global _warmup_task
+    _warmup_task = asyncio.create_task(_build_index())
+    return _warmup_task
+
+
+async def get_schema_index_nowait():
+    """Return the schema index, or None while the startup warm-up is still building it.
+
+    A failed warm-up is retried here like a cold start, waiting for the index.
+    """
+    if _schema_index is None and _warmup_task is not None and not _warmup_task.done():
+        return None
+    return await get_schema_index()
+
+
+def as_index(schema):
+    if isinstance(schema, (SchemaIndex, schema_artifact.MappedSchemaIndex)):
+        return schema
+    return SchemaIndex(schema)
+
 
 async def validate_path(schema, path):
-    schema_paths = schema.get("paths", {}).keys()
-    if path not in schema_paths:
-        raise ValueError(f"Path '{path}' does not exist\navailable paths: {list(schema_paths)}")
-    
-async def validate_query_params(schema, path, query_params):
-    model_assesors = ['site', 'manufacturer', 'cluster_group', 'device_type',
-                       'device','tenant',  'contact', 'group', 'role', 'platform', 'location',
-                       'rack', 'region', 'type', 'provider', 'circuit', 'virtual_circuit',
-                       'power_panel', 'power_port', 'power_feed', 'module_type', 'module',
-                       'interface', 'front_port', 'rear_port', 'console_port', 'console_server_port',
-                       'cluster', 'virtual_device_context', 'vrf', 'vlan', 'prefix', 'aggregate',
-                       'asn', 'asn_range', 'fhrp_group', 'ip_address', 'ip_range',
-                       'service', 'device_role', 'rack_role', 
-                       'circuit_type', 'virtual_circuit_type',]
-    not_validated_fields = {}
-    validated_fields = {}
-    params = query_params.copy()
-    for field in params:
-        assessors = field.split("__")
-        if len(assessors) >= 3:
-            raise ValueError("Only one level of field lookup is supported, e.g., 'site__slug'")
-        if len(assessors) == 2:
-            if assessors[1] in model_assesors:
-                not_validated_fields[field] = params[field]
+    index = as_index(schema)
+    if path not in index.paths:
+        raise ValueError(path_error(index, path))
+
+
+async def validate_method(schema, path, method):
+    path_index = as_index(schema).paths.get(path)
+    if path_index is None or method.lower() not in path_index.methods:
+        allowed = sorted(path_index.methods) if path_index is not None else []
+        raise ValueError(f"Method '{method.upper()}' is not allowed on path '{path}'\nallowed methods: {allowed}")
+
+class NgramIndex:
+    """Fuzzy "did you mean" over a fixed set of words.
+
+    Every word is indexed by its character bigrams, a misspelling only
+    compares against the words sharing the most bigrams with it instead of
+    the whole set.
+    """
+
+    def __init__(self, words, candidates=20):
+        self.words = sorted(words)
+        self.candidates = candidates
+        self.grams = {}
+        for i, word in enumerate(self.words):
+            for gram in self._grams(word):
+                self.grams.setdefault(gram, []).append(i)
+
+    @staticmethod
+    def _grams(word):
+        padded = f" {word} "
+        return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+    def suggest(self, word, k=3, cutoff=0.6, margin=0.1):
+        """Return up to ``k`` words by similarity, within ``margin`` of the closest one."""
+        shared = Counter()
+        for gram in self._grams(word):
+            shared.update(self.grams.get(gram, ()))
+        matches = []
+        for i, _ in shared.most_common(self.candidates):
+            matcher = SequenceMatcher(None, word, self.words[i])
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                ratio = matcher.ratio()
+                if ratio >= cutoff:
+                    matches.append((-ratio, self.words[i]))
+        matches.sort()
+        # Words sharing a long prefix all score high, keep the near misses only
+        return [match for ratio, match in matches[:k] if ratio <= matches[0][0] + margin]
+
+
+class ParamValidator:
+    """Query parameter check of one path, compiled on first use from its index.
+
+    Parameter names are a hash set and the lookup suffixes accepted per base
+    field a dict of sets, so a whole query is checked in one pass and an
+    invalid lookup on a known field is reported as such. The suggestion
+    index is only built the first time a query fails.
+    """
+
+    def __init__(self, path, path_index):
+        self.path = path
+        self.params = frozenset(path_index.params) if path_index is not None else frozenset()
+        self.lookups = dict(path_index.lookups) if path_index is not None else {}
+        self.fields = frozenset(name for name in self.params if "__" not in name) | frozenset(self.lookups)
+        self._unknown = {}
+
+    @cached_property
+    def suggestions(self):
+        return NgramIndex(self.params)
+
+    def errors(self, query_params):
+        errors = []
+        for name in query_params:
+            if name in self.params or name in UNVALIDATED_PARAMS:
+                continue
+            base, separator, suffix = name.partition("__")
+            if not separator:
+                errors.append(self.unknown(name))
+            elif "__" in suffix:
+                errors.append(f"'{name}': only one level of field lookup is supported, e.g., 'site__slug'")
+            elif suffix in MODEL_ASSESORS:
+                continue
+            elif base in self.fields:
+                supported = sorted(self.lookups.get(base, ()))
+                errors.append(f"'{name}': lookup '{suffix}' is not supported for '{base}', supported lookups: {supported}")
             else:
-                validated_fields[field] = params[field]
-        else:
-            if field != "fields":
-                validated_fields[field] = params[field]
-    schema_params = schema.get("paths", {}).get(path, {}).get("get", {}).get("parameters", [])
-    valid_params = {param["name"] for param in schema_params}
-    invalid_params = [param for param in validated_fields.keys() if param not in valid_params]
-    if invalid_params:
-        raise ValueError(f"Invalid query parameters: {invalid_params}\navailable parameters: {list(valid_params)}")
+                errors.append(self.unknown(name))
+        return errors
+
+    def unknown(self, name):
+        message = self._unknown.get(name)
+        if message is None:
+            suggestions = self.suggestions.suggest(name)
+            hint = f", did you mean {suggestions}?" if suggestions else ""
+            message = f"'{name}' is not a query parameter of '{self.path}'{hint}"
+            if len(self._unknown) < ERROR_CACHE_SIZE:
+                self._unknown[name] = message
+        return message
+
+    def describe(self):
+        """Every field of the path with the lookup suffixes it accepts."""
+        return {field: sorted(self.lookups.get(field, ())) for field in sorted(self.fields)}
+
+
+class _Compiled:
+    """Validators and error messages derived from one schema index, built as they are needed."""
+
+    def __init__(self):
+        self.validators = {}
+        self.path_errors = {}
+        self.path_suggestions = None
+
+
+_compiled = weakref.WeakKeyDictionary()
+
+
+def param_validator(schema, path):
+    """Return the compiled ``ParamValidator`` of a path, cached per schema index."""
+    index = as_index(schema)
+    validators = _compiled.setdefault(index, _Compiled()).validators
+    validator = validators.get(path)
+    if validator is None:
+        validator = validators[path] = ParamValidator(path, index.paths.get(path))
+    return validator
+
+
+def path_error(index, path):
+    """Return the error of a path missing from the index, ranked suggestions instead of every path."""
+    compiled = _compiled.setdefault(index, _Compiled())
+    message = compiled.path_errors.get(path)
+    if message is None:
+        if compiled.path_suggestions is None:
+            compiled.path_suggestions = NgramIndex(index.paths)
+        suggestions = compiled.path_suggestions.suggest(path)
+        hint = f", did you mean {suggestions}?" if suggestions else ""
+        message = f"Path '{path}' does not exist{hint}\n{LIST_PATHS_HINT}"
+        if len(compiled.path_errors) < ERROR_CACHE_SIZE:
+            compiled.path_errors[path] = message
+    return message
+
+
+async def validate_query_params(schema, path, query_params):
+    errors = param_validator(schema, path).errors(query_params)
+    if errors:
+        raise ValueError("Invalid query parameters:\n" + "\n".join(errors) + f"\n{LIST_PARAMS_HINT}")
     
     
-
@@ -0,0 +1,95 @@
+import os
+import gc
+import time
+import signal
+import socket
+import asyncio
+import logging
+import client
+import graphql_schema
+import limiter
+import validation
+
+
+logger = logging.getLogger(__name__)
+
+NETBOX_WORKERS = int(os.environ.get("NETBOX_WORKERS") or 1)
+
+
+def bind(host, port):
+    """Bind the listening socket once in the supervisor, every worker accepts on it."""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+async def prewarm():
+    """Load the schemas in the supervisor so the workers inherit them instead of loading their own."""
+    try:
+        await validation.get_schema_index()
+        await graphql_schema.get_schema()
+    except Exception as e:
+        logger.error(f"workers.prewarm failed with reason {e}, every worker loads the schemas itself")
+    finally:
+        # The session belongs to this loop, workers open their own pools
+        await client.close()
+
+
+def run_worker(mcp, sock, host, port):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # MCP sessions live in one process, stateless HTTP lets any worker serve any request
+    mcp.run(transport="http", host=host, port=port, stateless_http=True, sockets=[sock], show_banner=False)
+
+
+def serve(mcp, host, port, workers=NETBOX_WORKERS):
+    """Pre-fork ``workers`` processes serving ``mcp`` on one port, restarting any that die."""
+    sock = bind(host, port)
+    asyncio.run(prewarm())
+    # Objects built so far are shared copy-on-write with the workers, keep the
+    # collector from touching, and so copying, their pages
+    gc.freeze()
+    # Every worker limits its own requests, together they keep to the configured caps
+    limiter.share(workers)
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(mcp, sock, host, port)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info(f"workers.serve {workers} workers on {host}:{port}, pids {list(children)}")
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        logger.error(f"workers.serve worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it")
+        if time.monotonic() - started < 1:
+            # Do not spin on a worker failing at startup
+            time.sleep(1)
+        spawn()